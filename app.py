@@ -3,19 +3,31 @@ import re
 import os 
 import json
 import streamlit.components.v1 as components
-import requests
+import html
+import time
+import threading
+from importlib import import_module
+from collections import OrderedDict
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from search.web_search import collect_web_result, submit_web_search, web_search
+
 MAX_IMAGES_PER_ROW = 4
+MAX_SIMILAR_PER_CARD = 3
+MAX_SUGGESTIONS = 5
+SUGGEST_MAX_WORDS = 3  # only short, name-like queries get "did you mean" suggestions
 IMAGE_WIDTH_PX = 200
 IMAGE_HEIGHT_PX = 200
+CARD_CACHE_SIZE = 2048  # rendered product cards shared by every session
 SEARCH_MODULE_PATH = "search.hybrid_search_test" 
+WARMUP_POLL_SECONDS = 0.5
+WARMUP_TIMEOUT_SECONDS = 60
 ROLE_PROMPT_FILE = "./prompt/role.txt" 
 
-
-SERPAPI_API_KEY = os.getenv('SERPAPI_API_KEY', '')
+# When set, chat turns go to the async search service (search/service.py) instead of running in-process
+SEARCH_SERVICE_URL = os.getenv('CHEESEBOT_SERVICE_URL', '').rstrip('/')
 
 
 if "chat_log" not in st.session_state:
@@ -24,22 +36,78 @@ if "clients_initialized_successfully" not in st.session_state:
     st.session_state.clients_initialized_successfully = None
 if "context_data" not in st.session_state:
     st.session_state.context_data = []
+if "last_trace" not in st.session_state:
+    st.session_state.last_trace = None
+if "stage_percentiles" not in st.session_state:
+    st.session_state.stage_percentiles = {}
+if "response_cache" not in st.session_state:
+    st.session_state.response_cache = {}
+if "model_router" not in st.session_state:
+    st.session_state.model_router = {}
+if "suggestions" not in st.session_state:
+    st.session_state.suggestions = []
+if "pending_query" not in st.session_state:
+    st.session_state.pending_query = None
+if "web_context" not in st.session_state:
+    st.session_state.web_context = False
+if "conversation" not in st.session_state:
+    st.session_state.conversation = {}  # ConversationState.to_dict(): bounded summary, shown SKUs, active filters
+
+
+class BackendWarmup:
+    """Imports the search module and initializes clients, catalog indexes and prompt templates on a
+    background thread, so the first page renders without waiting for the OpenAI/Pinecone SDKs."""
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.module = None
+        self.ok = False
+        self.error = None
+        self.seconds = None
+        threading.Thread(target=self._run, name="backend-warmup", daemon=True).start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self.module = import_module(SEARCH_MODULE_PATH)
+            if SEARCH_SERVICE_URL:
+                # Local lookups (autocomplete, similar products, cards) still run in-process
+                self.module.load_local_artifacts()
+                self.ok = check_search_service()
+                if not self.ok:
+                    self.error = f"Search service at {SEARCH_SERVICE_URL} is not ready."
+            else:
+                self.ok = self.module.initialize_clients()
+                if not self.ok:
+                    self.error = "Failed to initialize backend services. Please check console/server logs."
+        except ImportError as e:
+            self.error = (f"Failed to import '{SEARCH_MODULE_PATH}' module: {e}. Ensure "
+                          f"'{SEARCH_MODULE_PATH.replace('.', '/')}.py' exists and has no syntax errors.")
+        except AttributeError as e:
+            self.error = f"Functions not found in '{SEARCH_MODULE_PATH}': {e}."
+        except Exception as e:
+            self.error = f"Exception during backend initialization: {e}"
+        self.seconds = time.perf_counter() - start
+        print(f"INFO: Backend warm-up finished in {self.seconds:.2f}s (ok={self.ok}).")
+        self.ready.set()
+
+    def failed(self):
+        return self.ready.is_set() and not self.ok
+
+
+@st.cache_resource(show_spinner=False)
+def get_backend_warmup() -> BackendWarmup:
+    """One warm-up per process, shared by every session."""
+    return BackendWarmup()
 
 
-try:
-    from importlib import import_module
-    search_module = import_module(SEARCH_MODULE_PATH)
-    product_search_bot = search_module.product_search_bot
-    initialize_clients = search_module.initialize_clients
-except ImportError as e:
-    st.error(f"🔴 Failed to import '{SEARCH_MODULE_PATH}' module: {e}. "
-             f"Ensure '{SEARCH_MODULE_PATH.replace('.', '/')}.py' exists (e.g., in a subfolder named 'search' "
-             f"if path contains a dot) relative to app.py, is in the Python path, and has no syntax errors.")
-    st.stop()
-except AttributeError as e:
-    st.error(f"🔴 Functions not found in '{SEARCH_MODULE_PATH}': {e}. "
-             "Ensure 'product_search_bot' and 'initialize_clients' are defined in the module.")
-    st.stop()
+def search_api():
+    """The search module, waiting for the warm-up import if it is still running."""
+    warmup = get_backend_warmup()
+    warmup.ready.wait(WARMUP_TIMEOUT_SECONDS)
+    if warmup.module is None:
+        raise RuntimeError(warmup.error or "Search backend is still warming up.")
+    return warmup.module
 
 
 st.set_page_config(layout="wide", page_title="🧀 Cheese Product Assistant")
@@ -52,60 +120,75 @@ def clean_image_links_from_text(text: str) -> str:
     cleaned_text = re.sub(r'  +', ' ', cleaned_text)
     return cleaned_text.strip()
 
-def web_search(query: str, num_results: int = 5, engine: str = "google", tb: str = "", tbs: str = "") -> dict:
-    if not SERPAPI_API_KEY:
-        return {
-            "success": False,
-            "error": "SERPAPI_API_KEY not found in .env file. Please add it to use web search functionality."
-        }
-    
+def get_waterfall_html(trace: dict) -> str:
+    total_ms = max(trace.get("duration_ms", 0), 1)
+    rows = []
+    for span in trace.get("spans", []):
+        left = span["offset_ms"] / total_ms * 100
+        width = max(span["duration_ms"] / total_ms * 100, 0.5)
+        attributes = span.get("attributes", {})
+        details = []
+        if "prompt_tokens" in attributes:
+            details.append(f"{attributes['prompt_tokens']}+{attributes.get('completion_tokens', 0)} tok")
+        if "response_bytes" in attributes:
+            details.append(f"{attributes['response_bytes'] / 1024:.1f} KB")
+        rows.append(f"""
+        <div style="font-size: 12px; margin-bottom: 4px;">
+            <div>{html.escape(span['name'])} · {span['duration_ms']:.0f} ms {html.escape(' · '.join(details))}</div>
+            <div style="position: relative; height: 8px; background: #f0f0f0; border-radius: 4px;">
+                <div style="position: absolute; left: {left:.2f}%; width: {width:.2f}%; height: 8px; background: #f4a300; border-radius: 4px;"></div>
+            </div>
+        </div>""")
+    return f"<div><b>Total {trace.get('duration_ms', 0):.0f} ms</b>{''.join(rows)}</div>"
+
+def trace_to_jsonl(trace: dict) -> str:
+    return "\n".join(
+        json.dumps({"trace_id": trace.get("trace_id"), **span}) for span in trace.get("spans", [])
+    ) + "\n"
+
+@st.cache_resource
+def get_service_session():
+    import requests  # deferred with the other network clients to keep start-up fast
+
+    return requests.Session()
+
+def check_search_service() -> bool:
+    import requests
+
     try:
-        url = "https://serpapi.com/search"
-        params = {
-            "q": query+" cheese",
-            "api_key": SERPAPI_API_KEY,
-            "engine": engine,
-            "num": num_results,
-            "tb": tb,
-            "tbs": tbs
-        }
-        
-        response = requests.get(url, params=params)
+        response = get_service_session().get(f"{SEARCH_SERVICE_URL}/health", timeout=5)
         response.raise_for_status()
-        
-        results = response.json()
-        
-        organic_results = results.get("organic_results", [])
-        processed_results = []
-        
-        for result in organic_results[:num_results]:
-            processed_results.append({
-                "title": result.get("title", ""),
-                "link": result.get("link", ""),
-                "snippet": result.get("snippet", "")
-            })
-            
-        return {
-            "success": True,
-            "results": processed_results,
-            "total_results": len(processed_results)
-        }
-        
-    except requests.exceptions.RequestException as e:
-        return {
-            "success": False,
-            "error": f"Error making request to SerpAPI: {str(e)}"
-        }
-    except ValueError as e:
-        return {
-            "success": False, 
-            "error": f"Error parsing SerpAPI response: {str(e)}"
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "error": f"Unexpected error during web search: {str(e)}"
-        }
+        return bool(response.json().get("ready"))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"ERROR: Search service at {SEARCH_SERVICE_URL} is not reachable: {e}")
+        return False
+
+def call_search_service(user_query: str, history: str, on_text=None, conversation=None) -> dict:
+    """Streams a chat turn from the search service over SSE. Returns the same dict as product_search_bot,
+    plus the updated "conversation" when one was sent."""
+    response = get_service_session().post(
+        f"{SEARCH_SERVICE_URL}/chat/stream",
+        json={"query": user_query, "history": history, "conversation": conversation},
+        stream=True,
+        timeout=(5, 120)
+    )
+    response.raise_for_status()
+    event = None
+    streamed_text = ""
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            data = json.loads(line[len("data: "):])
+            if event == "token":
+                streamed_text += data.get("text", "")
+                if on_text:
+                    on_text(streamed_text)
+            elif event == "done":
+                return data
+            elif event == "error":
+                return {"success": False, "response": f"Sorry, the search service failed: {data.get('message', '')}"}
+    return {"success": False, "response": "Sorry, the search service closed the connection early."}
 
 
 def parse_image_urls_from_bot_response(image_section_text: str) -> list[dict]:
@@ -121,9 +204,11 @@ def parse_image_urls_from_bot_response(image_section_text: str) -> list[dict]:
 
 def get_image_card_html(image_url: str, caption: str, detail_url: str) -> str:
     safe_alt_caption = re.sub(r'[^a-zA-Z0-9 .,!?\'"-]', '', caption) if caption else "Product Image"
-    display_caption = caption if caption else "View Details"
+    safe_alt_caption = html.escape(safe_alt_caption, quote=True)
+    display_caption = html.escape(caption if caption else "View Details", quote=True)
+    image_url = html.escape(str(image_url or ""), quote=True)
     return f"""
-    <a href="{detail_url}" target="_blank" style="text-decoration: none; color: inherit; display: block; text-align: center; margin-bottom: 15px;">
+    <a href="{_safe_href(detail_url)}" target="_blank" style="text-decoration: none; color: inherit; display: block; text-align: center; margin-bottom: 15px;">
         <img src="{image_url}" alt="{safe_alt_caption}" style="width: {IMAGE_WIDTH_PX}px; height: {IMAGE_HEIGHT_PX}px; object-fit: contain; border-radius: 8px; margin-bottom: 8px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); transition: transform 0.2s ease-in-out;" onmouseover="this.style.transform='scale(1.05)';" onmouseout="this.style.transform='scale(1)';">
         <p style="font-size: 14px; width: {IMAGE_WIDTH_PX}px; word-wrap: break-word; margin: 0 auto; line-height: 1.3; height: 3.9em; overflow: hidden; color: #333;">
             {display_caption}
@@ -131,12 +216,132 @@ def get_image_card_html(image_url: str, caption: str, detail_url: str) -> str:
     </a>
     """
 
+def _safe_href(url) -> str:
+    """Attribute-escaped link target; anything but an http(s) URL becomes "#"."""
+    url = str(url or "").strip()
+    if not url.lower().startswith(("http://", "https://")):
+        return "#"
+    return html.escape(url, quote=True)
+
+def get_similar_products_html(similar: list[dict]) -> str:
+    if not similar:
+        return ""
+    links = "".join(
+        f'<a href="{_safe_href(item.get("detail_url"))}" target="_blank" title="{html.escape(item.get("name", ""), quote=True)}" '
+        f'style="display: block; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; color: #555;">'
+        f'{html.escape(item.get("name", "Product"))}</a>'
+        for item in similar
+    )
+    return f"""
+    <div style="width: {IMAGE_WIDTH_PX}px; margin: -8px auto 15px auto; font-size: 12px; line-height: 1.4;">
+        <span style="color: #888;">Similar:</span>
+        {links}
+    </div>
+    """
+
+def get_suggestions(user_query: str) -> list[str]:
+    suggest_completions = getattr(search_api(), "suggest_completions", None)
+    if suggest_completions is None or len(user_query.split()) > SUGGEST_MAX_WORDS:
+        return []
+    try:
+        return [s for s in suggest_completions(user_query, MAX_SUGGESTIONS) if s.lower() != user_query.strip().lower()]
+    except Exception as e:
+        print(f"Warning: Autocomplete failed for '{user_query}': {e}")
+        return []
+
+
+def use_suggestion(suggestion: str):
+    st.session_state.pending_query = suggestion
+    st.session_state.suggestions = []
+
+
+def get_similar_for_product(product_data: dict) -> list[dict]:
+    similar_products = getattr(search_api(), "similar_products", None)
+    if similar_products is None:
+        return []
+    product_id = product_data.get('sku') or product_data.get('product_code_from_url')
+    if not product_id:
+        return []
+    try:
+        return [
+            {'name': item.get('product_name', 'Product'), 'detail_url': item.get('product_detail_url', '#')}
+            for item in similar_products(product_id, MAX_SIMILAR_PER_CARD)
+        ]
+    except Exception as e:
+        print(f"Warning: Similar product lookup failed for {product_id}: {e}")
+        return []
+
+
+def product_key(product_data: dict) -> str:
+    return str(product_data.get('sku') or product_data.get('product_code_from_url') or product_data.get('image_url', ''))
+
+
+def index_results_by_image(search_results: list[dict]) -> dict:
+    """Maps each result's image URLs to the product, so parsed image links resolve in one lookup."""
+    products_by_url = {}
+    for product_data in search_results:
+        for field in ('image_url', 'detail_page_main_image_url'):
+            if product_data.get(field):
+                products_by_url.setdefault(product_data[field], product_data)
+    return products_by_url
+
+
+@st.cache_resource(show_spinner=False)
+def get_card_cache():
+    """(OrderedDict sku -> card HTML, lock), least recently used first."""
+    return OrderedDict(), threading.Lock()
+
+
+def get_product_card_html(sku: str, product_data: dict = None, image_url: str = None) -> str:
+    """Image card plus similar-product links for one SKU, rendered once and reused by later reruns.
+
+    Without product_data the card is rebuilt from the local catalog when it has been evicted.
+    Returns "" when the product is unknown.
+    """
+    cards, lock = get_card_cache()
+    with lock:
+        card = cards.get(sku)
+        if card is not None:
+            cards.move_to_end(sku)
+            return card
+    if product_data is None:
+        get_product_record = getattr(search_api(), "get_product_record", None)
+        record = get_product_record(sku) if get_product_record else None
+        if record is None:
+            return ""
+        product_data = record.to_metadata()
+    thumbnail_url = getattr(search_api(), "thumbnail_url", lambda url: url)
+    card = get_image_card_html(
+        thumbnail_url(image_url or product_data.get('image_url') or product_data.get('detail_page_main_image_url', '')),
+        product_data.get('product_name', "Product"),
+        product_data.get('product_detail_url', '#')
+    ) + get_similar_products_html(get_similar_for_product(product_data))
+    with lock:
+        cards[sku] = card
+        while len(cards) > CARD_CACHE_SIZE:
+            cards.popitem(last=False)
+    return card
+
+
+def render_product_cards(skus: list[str]):
+    """One HTML block per turn; a rerun only looks up the cached cards."""
+    cards = "".join(
+        f'<div style="width: {IMAGE_WIDTH_PX + 20}px;">{get_product_card_html(sku)}</div>' for sku in skus
+    )
+    st.markdown("---")
+    st.markdown(
+        f'<div style="display: flex; flex-wrap: wrap; gap: 12px; '
+        f'max-width: {MAX_IMAGES_PER_ROW * (IMAGE_WIDTH_PX + 32)}px;">{cards}</div>',
+        unsafe_allow_html=True
+    )
+
 
 with st.sidebar:
     st.title("🧀 CheeseBot")
     st.markdown("---")
     if st.button("🧹 Clear Chat History"):
         st.session_state.chat_log = []
+        st.session_state.conversation = {}
         st.toast("Chat history cleared!", icon="🧹")
         st.rerun() 
     st.markdown("---")
@@ -218,6 +423,8 @@ with st.sidebar:
                 st.info("No results found. Try a different search query.")
         else:
             st.error(search_results.get("error", "An unknown error occurred"))
+    st.checkbox("Add web results to chat answers", key="web_context",
+                help="Searches the web alongside the catalog; the answer only waits briefly for it.")
     st.caption("Happy cheese hunting!")
     st.markdown("---")
     st.subheader("Debug Options")
@@ -233,6 +440,45 @@ with st.sidebar:
         with st.expander("Raw Search Results", expanded=True):
             st.json(st.session_state.context_data)
 
+    show_trace = st.radio(
+        "Show Latency Waterfall:",
+        options=["Hide", "Show"],
+        index=0,
+        horizontal=True
+    )
+
+    if show_trace == "Show" and st.session_state.last_trace:
+        st.subheader("Last Turn")
+        st.markdown(get_waterfall_html(st.session_state.last_trace), unsafe_allow_html=True)
+        if st.session_state.stage_percentiles:
+            with st.expander("Stage Latency Percentiles (ms)"):
+                st.dataframe(
+                    [{"stage": stage, **values} for stage, values in st.session_state.stage_percentiles.items()],
+                    hide_index=True
+                )
+        if st.session_state.response_cache:
+            cache = st.session_state.response_cache
+            with st.expander("Response Cache"):
+                st.markdown(
+                    f"Hit rate **{cache.get('hit_rate', 0):.0%}** ({cache.get('hits', 0)} hits, "
+                    f"{cache.get('misses', 0)} misses, {cache.get('entries', 0)} entries)  \n"
+                    f"Saved **{cache.get('seconds_saved', 0):.1f}s** and **{cache.get('tokens_saved', 0)}** tokens"
+                )
+        if st.session_state.model_router.get("turns"):
+            router = st.session_state.model_router
+            with st.expander("Model Routing"):
+                st.dataframe(
+                    [{"route": route, **values} for route, values in router.get("routes", {}).items()],
+                    hide_index=True
+                )
+                st.markdown(f"Saved **${router.get('cost_saved_usd', 0):.4f}** against the large model on every turn")
+        st.download_button(
+            "Export Trace (JSONL)",
+            data=trace_to_jsonl(st.session_state.last_trace),
+            file_name=f"cheesebot_trace_{st.session_state.last_trace.get('trace_id', 'turn')}.jsonl",
+            mime="application/jsonl"
+        )
+
 
 main_header_cols = st.columns([0.85, 0.15]) 
 with main_header_cols[0]:
@@ -241,17 +487,28 @@ with main_header_cols[0]:
 
 st.caption("Ask me about cheese products! I'll do my best to help you find the perfect cheese.")
 
-if st.session_state.clients_initialized_successfully is None:
-    with st.spinner("🛠️ Initializing backend services... This may take a moment."):
-        try:
-            if initialize_clients():
-                st.session_state.clients_initialized_successfully = True
-            else:
-                st.session_state.clients_initialized_successfully = False
-                st.error("🔴 CRITICAL: Failed to initialize backend services. Please check console/server logs.")
-        except Exception as e:
-            st.session_state.clients_initialized_successfully = False
-            st.error(f"🔴 CRITICAL: Exception during backend initialization: {e}")
+@st.fragment(run_every=WARMUP_POLL_SECONDS)
+def show_warmup_status():
+    """Polls the warm-up while the page stays interactive; one full rerun once it finishes."""
+    if not get_backend_warmup().ready.is_set():
+        st.caption("⏳ Warming up…")
+    else:
+        st.rerun()
+
+
+warmup = get_backend_warmup()
+if warmup.failed() and st.session_state.clients_initialized_successfully is None:
+    get_backend_warmup.clear()  # a new session retries instead of inheriting an earlier failure
+    warmup = get_backend_warmup()
+
+with main_header_cols[1]:
+    if warmup.ready.is_set():
+        st.session_state.clients_initialized_successfully = warmup.ok
+        st.caption("🟢 Ready" if warmup.ok else "🔴 Offline", help=f"Backend warm-up took {warmup.seconds:.1f}s")
+    else:
+        show_warmup_status()
+if warmup.failed():
+    st.error(f"🔴 CRITICAL: {warmup.error}")
 
 
 for entry in st.session_state.chat_log:
@@ -260,27 +517,20 @@ for entry in st.session_state.chat_log:
             st.markdown(entry["text_response"])
         elif entry["role"] == "assistant":
             st.markdown(entry["text_response"])
-            if entry.get("images"):
-                st.markdown("---")
-                images_to_display_from_history = entry["images"]
-                num_images = len(images_to_display_from_history)
-                cols_per_row_history = min(num_images, MAX_IMAGES_PER_ROW) if num_images > 0 else 1
-                if num_images > 0:
-                    image_cols_history = st.columns(cols_per_row_history) 
-                    for i, img_data in enumerate(images_to_display_from_history):
-                        col_to_use = image_cols_history[i % cols_per_row_history]
-                        with col_to_use:
-                            st.markdown(
-                                get_image_card_html(
-                                    img_data.get('url', ''),
-                                    img_data.get('caption', 'Product Image'),
-                                    img_data.get('detail_url', '#')
-                                ),
-                                unsafe_allow_html=True
-                            )
-
-
-if user_query := st.chat_input("What kind of cheese are you looking for?"):
+            if entry.get("skus"):
+                render_product_cards(entry["skus"])
+
+
+user_query = st.chat_input("What kind of cheese are you looking for?")
+if not user_query and st.session_state.pending_query:
+    user_query, st.session_state.pending_query = st.session_state.pending_query, None
+
+if user_query:
+    if not warmup.ready.is_set():
+        with st.spinner("⏳ Finishing backend warm-up..."):
+            warmup.ready.wait(WARMUP_TIMEOUT_SECONDS)
+        if warmup.ready.is_set():
+            st.session_state.clients_initialized_successfully = warmup.ok
     if st.session_state.clients_initialized_successfully is False:
         st.error("🔴 Backend services not initialized. Cannot process query.")
     elif st.session_state.clients_initialized_successfully is None:
@@ -289,8 +539,7 @@ if user_query := st.chat_input("What kind of cheese are you looking for?"):
         st.session_state.chat_log.append({
             "role": "user", 
             "text_response": user_query, 
-            "images": [], 
-            "full_results": []
+            "skus": []
         })
         with st.chat_message("user"):
             st.markdown(user_query)
@@ -300,14 +549,28 @@ if user_query := st.chat_input("What kind of cheese are you looking for?"):
             image_container_placeholder = st.container() 
 
             with st.spinner("🧀 Searching for cheeses..."):
+                web_future = submit_web_search(user_query) if st.session_state.web_context else None
                 try:
-                    history_context = ""
-
-                    if len(st.session_state.chat_log) > 1: 
-                        history_context = st.session_state.chat_log[-2]["text_response"]
-                    
-                    bot_data = product_search_bot(user_query, history_context)
+                    # The conversation summary replaces the raw previous answer as history
+                    if SEARCH_SERVICE_URL:
+                        bot_data = call_search_service(
+                            user_query, "",
+                            on_text=lambda text: message_placeholder.markdown(
+                                clean_image_links_from_text(text.split("******", 1)[0])
+                            ),
+                            conversation=st.session_state.conversation
+                        )
+                        st.session_state.conversation = bot_data.get("conversation", st.session_state.conversation)
+                    else:
+                        search_module = search_api()
+                        conversation = search_module.ConversationState.from_dict(st.session_state.conversation)
+                        bot_data = search_module.product_search_bot(user_query, "", conversation, web_future=web_future)
+                        st.session_state.conversation = conversation.to_dict()
                     st.session_state.context_data = bot_data.get("results", "")
+                    st.session_state.last_trace = bot_data.get("trace")
+                    st.session_state.stage_percentiles = bot_data.get("stage_percentiles", {})
+                    st.session_state.response_cache = bot_data.get("response_cache", st.session_state.response_cache)
+                    st.session_state.model_router = bot_data.get("model_router", st.session_state.model_router)
 
                 except Exception as e:
                     st.error(f"⚠️ Error during product search: {e}")
@@ -316,7 +579,7 @@ if user_query := st.chat_input("What kind of cheese are you looking for?"):
                 conversational_text = "Sorry, I couldn't process that request."
                 parsed_image_urls_from_bot = [] 
                 all_search_results_from_bot = []
-                images_for_log_and_history = [] 
+                skus_for_log = []
 
                 if bot_data and bot_data.get("success"):
                     full_response_text = bot_data.get("response", "")
@@ -340,40 +603,40 @@ if user_query := st.chat_input("What kind of cheese are you looking for?"):
                     )
 
                 message_placeholder.markdown(conversational_text)
+                web_results = (bot_data or {}).get("web_results")
+                if web_future is not None and web_results is None:
+                    # The search service does not take web context; show what finished alongside it
+                    web_results = (collect_web_result(web_future, 0) or {}).get("results", [])
+                if web_results:
+                    with st.expander("🌐 From the web"):
+                        for result in web_results:
+                            st.markdown(f"[{result.get('title', 'Result')}]({result.get('link', '#')}): {result.get('snippet', '')}")
+                if bot_data and bot_data.get("corrected_query"):
+                    st.caption(f"Showing results for *{bot_data['corrected_query']}*")
+                st.session_state.suggestions = get_suggestions(user_query)
 
                 if parsed_image_urls_from_bot and all_search_results_from_bot:
-                    with image_container_placeholder:
-                        st.markdown("---") 
-                        num_parsed_urls = len(parsed_image_urls_from_bot)
-                        cols_for_new_images = min(num_parsed_urls, MAX_IMAGES_PER_ROW)
-                        if cols_for_new_images > 0:
-                            image_display_cols = st.columns(cols_for_new_images)
-                            for i, parsed_img_info in enumerate(parsed_image_urls_from_bot):
-                                target_url_from_parser = parsed_img_info['url']
-                                match_found_for_this_url = False
-                                for product_data in all_search_results_from_bot:
-                                    product_image_url = product_data.get('image_url')
-                                    product_main_image_url = product_data.get('detail_page_main_image_url')
-                                    if target_url_from_parser == product_image_url or \
-                                       target_url_from_parser == product_main_image_url:
-                                        caption = product_data.get('product_name', "Product")
-                                        detail_url = product_data.get('product_detail_url', '#')
-                                        images_for_log_and_history.append({
-                                            'url': target_url_from_parser,
-                                            'caption': caption,
-                                            'detail_url': detail_url
-                                        })
-                                        col_to_use = image_display_cols[i % cols_for_new_images]
-                                        with col_to_use:
-                                            st.markdown(
-                                                get_image_card_html(target_url_from_parser, caption, detail_url),
-                                                unsafe_allow_html=True
-                                            )
-                                        match_found_for_this_url = True
-                                        break 
+                    products_by_url = index_results_by_image(all_search_results_from_bot)
+                    for parsed_img_info in parsed_image_urls_from_bot:
+                        product_data = products_by_url.get(parsed_img_info['url'])
+                        if product_data is None:
+                            continue
+                        sku = product_key(product_data)
+                        if sku not in skus_for_log and get_product_card_html(sku, product_data, parsed_img_info['url']):
+                            skus_for_log.append(sku)
+                    if skus_for_log:
+                        with image_container_placeholder:
+                            render_product_cards(skus_for_log)
+                # Only SKUs are kept per turn; cards are re-rendered from the shared cache
                 st.session_state.chat_log.append({
                     "role": "assistant",
                     "text_response": conversational_text,
-                    "images": images_for_log_and_history, 
-                    "full_results": all_search_results_from_bot
-                })
\ No newline at end of file
+                    "skus": skus_for_log
+                })
+
+
+if st.session_state.suggestions:
+    suggestion_cols = st.columns(len(st.session_state.suggestions) + 1)
+    suggestion_cols[0].caption("Did you mean:")
+    for i, suggestion in enumerate(st.session_state.suggestions):
+        suggestion_cols[i + 1].button(suggestion, key=f"suggestion_{i}", on_click=use_suggestion, args=(suggestion,))
@@ -0,0 +1,170 @@
+"""Recall@k, QPS and build time of the local IVF index against exact search.
+
+Runs on synthetic clustered unit vectors shaped like llama-text-embed-v2 output (1024 dims), or on
+real vectors from --vectors (a float32 .npy of passage embeddings). Queries are held-out vectors
+with noise added. Also measures filtered search through the pipeline's filter path (a brand/price
+filter evaluated on a synthetic columnar metadata store), in-place inserts and deletes, and loading
+the saved index through mmap.
+
+    python bench/ann_benchmark.py --count 200000 --nprobe 8 16 32 64 --filter-share 0.05 0.3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search import artifacts
+from search.ann_index import IvfIndex, default_nprobe
+from search.metadata_store import (
+    build_metadata_store, filter_mask, load_metadata_store, save_metadata_store, store_row_positions
+)
+BRAND_COUNT = 100
+
+
+def synthetic_vectors(count, dimension, clusters, seed):
+    """Unit vectors around random topic centers, roughly how a product catalog embeds."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 1.5 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(vectors, ids, query, k, allowed=None):
+    scores = vectors @ query
+    if allowed is not None:
+        scores = np.where(allowed, scores, -np.inf)
+    top = np.argpartition(-scores, k)[:k]
+    return [ids[i] for i in top[np.argsort(-scores[top])] if scores[i] > -np.inf]
+
+
+def recall(found, expected):
+    return len(set(found) & set(expected)) / max(len(expected), 1)
+
+
+def run_queries(search, queries):
+    start = time.perf_counter()
+    results = [search(query) for query in queries]
+    return results, len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100000, help="synthetic catalog size")
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=2000, help="synthetic topic count")
+    parser.add_argument("--vectors", help="use these passage vectors (.npy) instead of synthetic ones")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--filter-share", type=float, nargs="+", default=[0.05, 0.3],
+                        help="shares of products passing the filter")
+    parser.add_argument("--updates", type=int, default=1000, help="products replaced in place")
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+    else:
+        vectors = synthetic_vectors(args.count + args.queries, args.dimension, args.clusters, seed=0)
+    held_out = vectors[-args.queries:]
+    vectors = vectors[:-args.queries]
+    queries = held_out + 0.01 * rng.standard_normal(held_out.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    ids = [str(100000 + i) for i in range(len(vectors))]
+    report = {"vectors": len(vectors), "dimension": vectors.shape[1], "k": args.k}
+
+    start = time.perf_counter()
+    ann = IvfIndex.build(ids, vectors)
+    report["build_s"] = round(time.perf_counter() - start, 2)
+    report["lists"] = ann.nlist
+    print(f"built {len(ann)} vectors into {ann.nlist} lists in {report['build_s']:.2f} s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "ann_index")
+        start = time.perf_counter()
+        ann.save(path)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        ann = IvfIndex.load(path)
+        report["save_s"], report["load_ms"] = round(saved, 2), round((time.perf_counter() - start) * 1000, 1)
+        print(f"saved in {saved:.2f} s, memory-mapped in {report['load_ms']:.1f} ms")
+
+        expected, exact_qps = run_queries(lambda q: exact_top_k(vectors, ids, q, args.k), queries)
+        report["exact_qps"] = round(exact_qps, 1)
+        print(f"\n{'search':<22} {'recall@' + str(args.k):>10} {'QPS':>9}")
+        print(f"{'exact (numpy)':<22} {1.0:>10.3f} {exact_qps:>9.1f}")
+        report["nprobe"] = {}
+        nprobe = default_nprobe(ann.nlist)
+        for probes in args.nprobe + [nprobe]:
+            results, qps = run_queries(lambda q: [i for i, _ in ann.search(q, args.k, probes)], queries)
+            score = float(np.mean([recall(r, e) for r, e in zip(results, expected)]))
+            report["nprobe"][probes] = {"recall": round(score, 4), "qps": round(qps, 1)}
+            label = f"ivf nprobe={probes}" + (" (default)" if probes == nprobe else "")
+            print(f"{label:<22} {score:>10.3f} {qps:>9.1f}")
+
+        # Filters run as in local_query: a row mask over the columnar store, cached per filter
+        artifacts.ARTIFACTS_DIR = directory
+        brands = rng.integers(0, BRAND_COUNT, len(ids))
+        prices = rng.uniform(2, 80, len(ids)).round(2)
+        save_metadata_store(build_metadata_store([
+            {"_id": product_id, "brand": f"Brand {brand}", "price": float(price)}
+            for product_id, brand, price in zip(ids, brands.tolist(), prices.tolist())
+        ]))
+        load_metadata_store()
+        report["filtered"] = []
+        for share in args.filter_share:
+            brand_count = max(1, round(share * BRAND_COUNT / 0.9))
+            filter_dict = {"brand": {"$in": [f"Brand {brand}" for brand in range(brand_count)]}, "price": {"$lte": 72.2}}
+            allowed = (brands < brand_count) & (prices <= 72.2)
+            filtered_expected = [exact_top_k(vectors, ids, q, args.k, allowed) for q in queries]
+            start = time.perf_counter()
+            filter_mask(filter_dict)
+            mask_ms = (time.perf_counter() - start) * 1000
+            results, qps = run_queries(
+                lambda q: [i for i, _ in ann.search(q, args.k, accept=(filter_mask(filter_dict), store_row_positions()))],
+                queries)
+            score = float(np.mean([recall(r, e) for r, e in zip(results, filtered_expected)]))
+            report["filtered"].append({"share": round(float(allowed.mean()), 4), "nprobe": nprobe, "recall": round(score, 4),
+                                       "qps": round(qps, 1), "cold_mask_ms": round(mask_ms, 1)})
+            print(f"{f'filtered {allowed.mean():.0%} p={nprobe}':<22} {score:>10.3f} {qps:>9.1f}"
+                  f"   (filter mask built in {mask_ms:.1f} ms)")
+
+        # Replace some products with new vectors and delete as many others, then save the delta only
+        replaced = rng.choice(len(ids), args.updates, replace=False)
+        deleted = rng.choice(np.setdiff1d(np.arange(len(ids)), replaced), args.updates, replace=False)
+        new_vectors = synthetic_vectors(args.updates, vectors.shape[1], args.clusters, seed=2)
+        start = time.perf_counter()
+        ann.add([ids[i] for i in replaced], new_vectors)
+        ann.remove([ids[i] for i in deleted])
+        ann.save(path)
+        updated = time.perf_counter() - start
+        vectors = vectors.copy()
+        vectors[replaced] = new_vectors
+        live = np.ones(len(ids), dtype=np.bool_)
+        live[deleted] = False
+        ann = IvfIndex.load(path)
+        expected = [exact_top_k(vectors, ids, q, args.k, live) for q in queries]
+        results, qps = run_queries(lambda q: [i for i, _ in ann.search(q, args.k, nprobe)], queries)
+        score = float(np.mean([recall(r, e) for r, e in zip(results, expected)]))
+        start = time.perf_counter()
+        compacted = ann.compact()
+        compact_s = time.perf_counter() - start
+        report["updates"] = {"upserted": args.updates, "deleted": args.updates, "apply_and_save_s": round(updated, 2),
+                             "recall": round(score, 4), "qps": round(qps, 1), "compact_s": round(compact_s, 2)}
+        print(f"{f'after updates p={nprobe}':<22} {score:>10.3f} {qps:>9.1f}")
+        print(f"\n{args.updates} upserts + {args.updates} deletes applied and saved in {updated:.2f} s; "
+              f"compacting {len(compacted)} vectors took {compact_s:.2f} s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Deterministic offline benchmark of the full search pipeline.
+
+Record real OpenAI/Pinecone responses for the fixed query set once (needs API keys):
+
+    python bench/benchmark.py --record
+
+or, without API keys, write a small synthetic fixture from a sample of the local catalog:
+
+    python bench/benchmark.py --synthesize
+
+then replay them offline with injected backend latency, as often as needed:
+
+    python bench/benchmark.py --repeat 3 --output before.json
+    python bench/benchmark.py --repeat 3 --baseline before.json
+
+Replay sleeps for the latency observed while recording unless overridden per call kind
+(--latency plan=0.8 response=2.0 embed=0.05 query=0.08 fetch=0.05) or scaled (--latency-scale).
+Cached answers are turned off in every mode, so repeated passes measure the pipeline rather than the cache.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench.replay import (
+    SYNTHETIC_PRODUCTS, BackendFixture, RecordingIndex, RecordingOpenAI, RecordingPinecone, ReplayIndex, ReplayOpenAI,
+    ReplayPinecone, SyntheticIndex, SyntheticOpenAI, SyntheticPinecone, clear_recorded_latency
+)
+from search import hybrid_search_test as engine
+from search import response_cache, shared_store, tracing
+from search.metadata_store import iter_products
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QUERIES = os.path.join(BENCH_DIR, "queries.txt")
+DEFAULT_FIXTURE = os.path.join(BENCH_DIR, "fixtures", "backends.json")
+
+
+def load_queries(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def parse_latency(pairs):
+    latency = {}
+    for pair in pairs or []:
+        kind, _, seconds = pair.partition("=")
+        latency[kind.strip()] = float(seconds)
+    return latency
+
+
+def install_recording_backends(fixture):
+    if not engine.initialize_clients():
+        raise SystemExit("ERROR: Recording needs PINECONE_API_KEY and OPENAI_API_KEY.")
+    engine.openai = RecordingOpenAI(fixture, engine.openai)
+    engine.pc = RecordingPinecone(fixture, engine.pc)
+    engine.index = RecordingIndex(fixture, engine.index)
+
+
+def disable_answer_caches():
+    response_cache.CACHE_SIZE = 0
+    shared_store.SHARED_DB_PATH = ""
+    response_cache.clear_response_cache()
+
+
+def install_synthetic_backends(fixture):
+    engine.load_local_artifacts()
+    products = [(product_id, record.to_metadata()) for product_id, record in iter_products()][:SYNTHETIC_PRODUCTS]
+    if not products:
+        raise SystemExit("ERROR: Synthesizing needs the local metadata store. Run ingest first.")
+    engine.openai = RecordingOpenAI(fixture, SyntheticOpenAI())
+    engine.pc = RecordingPinecone(fixture, SyntheticPinecone())
+    engine.index = RecordingIndex(fixture, SyntheticIndex(products))
+    engine._clients_initialized = True
+
+
+def install_replay_backends(fixture, latency, latency_scale):
+    engine.load_local_artifacts()
+    engine.openai = ReplayOpenAI(fixture, latency, latency_scale)
+    engine.pc = ReplayPinecone(fixture, latency, latency_scale)
+    engine.index = ReplayIndex(fixture, latency, latency_scale)
+    engine._clients_initialized = True
+
+
+def _run_query(fixture, query):
+    fixture.current_query = query
+    start = time.perf_counter()
+    try:
+        bot_data = engine.product_search_bot(query, "")
+    except KeyError as e:
+        print(f"Warning: Skipping '{query}': {e}")
+        return None
+    bot_data["seconds"] = time.perf_counter() - start
+    return bot_data
+
+
+def _turn_tokens(trace):
+    return sum(span["attributes"].get("prompt_tokens", 0) or 0 for span in trace["spans"])
+
+
+def run_benchmark(fixture, queries, repeat=1, workers=1):
+    tracing.reset_histograms()
+    turns = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for bot_data in pool.map(lambda q: _run_query(fixture, q), queries * repeat):
+            if bot_data is not None and bot_data.get("success"):
+                turns.append(bot_data)
+    elapsed = time.perf_counter() - start
+
+    prompt_tokens = [_turn_tokens(turn["trace"]) for turn in turns]
+    return {
+        "queries": len(queries) * repeat,
+        "completed": len(turns),
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "queries_per_second": round(len(turns) / elapsed, 3) if elapsed else 0.0,
+        "prompt_tokens_total": sum(prompt_tokens),
+        "prompt_tokens_per_turn": round(sum(prompt_tokens) / len(turns), 1) if turns else 0.0,
+        "stages": tracing.stage_percentiles(),
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"\n{report['completed']}/{report['queries']} turns in {report['seconds']:.2f}s "
+          f"({report['queries_per_second']:.2f} q/s, {report['workers']} worker(s)); "
+          f"{report['prompt_tokens_per_turn']:.0f} prompt tokens per turn")
+    if baseline:
+        print(f"baseline: {baseline['queries_per_second']:.2f} q/s, "
+              f"{baseline['prompt_tokens_per_turn']:.0f} prompt tokens per turn")
+    print(f"\n{'stage':<14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}" + (f" {'Δp50 ms':>9}" if baseline else ""))
+    for stage, stats in sorted(report["stages"].items(), key=lambda item: item[0] != "chat_turn"):
+        line = f"{stage:<14} {stats['count']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}"
+        if baseline:
+            before = baseline["stages"].get(stage)
+            line += f" {stats['p50_ms'] - before['p50_ms']:>+9.1f}" if before else f" {'new':>9}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="one query per line")
+    parser.add_argument("--fixture", default=DEFAULT_FIXTURE, help="recorded backend responses")
+    parser.add_argument("--record", action="store_true", help="call the real backends and (re)write the fixture")
+    parser.add_argument("--synthesize", action="store_true",
+                        help="(re)write the fixture from synthetic backends over the local catalog, no API keys needed")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the query set")
+    parser.add_argument("--workers", type=int, default=1, help="queries run concurrently")
+    parser.add_argument("--latency", nargs="*", metavar="KIND=SECONDS", help="fixed injected latency per call kind")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier on injected latency")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    fixture = BackendFixture(args.fixture)
+    disable_answer_caches()
+    if args.record or args.synthesize:
+        install_synthetic_backends(fixture) if args.synthesize else install_recording_backends(fixture)
+        report = run_benchmark(fixture, queries)
+        if args.synthesize:
+            clear_recorded_latency(fixture)
+        fixture.save()
+        print(f"INFO: Recorded {sum(len(section) for section in fixture.data.values())} responses to {args.fixture}")
+    else:
+        if not fixture.data["chat"]:
+            raise SystemExit(f"ERROR: No fixtures at {args.fixture}. Run with --record first.")
+        install_replay_backends(fixture, parse_latency(args.latency), args.latency_scale)
+        report = run_benchmark(fixture, queries, args.repeat, args.workers)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
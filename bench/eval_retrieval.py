@@ -0,0 +1,220 @@
+"""Retrieval quality and speed for each retrieval configuration, over a labeled set built from the catalog.
+
+Labels come from the local metadata store (run ingest first): brand queries expect every product
+of that brand, category queries every product in that subcategory, price-band queries every
+product priced inside the band. Each query is embedded once per model; configurations then
+differ only in how the vectors are weighted and whether Pinecone reranks.
+
+    python bench/eval_retrieval.py --k 10 --min-ndcg 0.6 --output eval.json
+
+Recall@k is capped (hits / min(k, relevant)) so large label sets can still reach 1.0.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search import hybrid_search_test as engine
+from search.batch import EMBED_BATCH_SIZE
+from search.departments import all_namespaces
+from search.metadata_store import iter_products
+
+PRICE_BANDS = [(0, 20), (20, 50), (50, 100), (100, None)]
+MIN_RELEVANT = 2
+
+# name -> (alpha, rerank); alpha scales dense by alpha and sparse by 1 - alpha
+CONFIGURATIONS = {
+    "dense": (1.0, False),
+    "dense+rerank": (1.0, True),
+    "sparse": (0.0, False),
+    "sparse+rerank": (0.0, True),
+    "hybrid-0.3": (0.3, False),
+    "hybrid-0.5": (0.5, False),
+    "hybrid-0.7": (0.7, False),
+    "hybrid-0.5+rerank": (0.5, True),
+}
+
+
+def _subcategory(categories):
+    if isinstance(categories, list):
+        categories = categories[-1] if categories else ""
+    return (categories or "").split("/")[-1].strip()
+
+
+def _band_label(low, high):
+    return f"cheese under ${high}" if not low else (f"cheese over ${low}" if high is None else f"cheese between ${low} and ${high}")
+
+
+def build_eval_set():
+    """Labeled [{"query", "kind", "relevant": [ids]}] derived from brand, subcategory and price band."""
+    groups = {}
+    for product_id, record in iter_products():
+        brand = record.get("brand")
+        if brand:
+            groups.setdefault(("brand", f"{brand} cheese"), set()).add(product_id)
+        subcategory = _subcategory(record.get("categories"))
+        if subcategory:
+            groups.setdefault(("category", subcategory.lower()), set()).add(product_id)
+        price = record.get("price")
+        if price is not None:
+            for low, high in PRICE_BANDS:
+                if price >= low and (high is None or price < high):
+                    groups.setdefault(("price_band", _band_label(low, high)), set()).add(product_id)
+    return [
+        {"query": query, "kind": kind, "relevant": sorted(ids)}
+        for (kind, query), ids in sorted(groups.items())
+        if len(ids) >= MIN_RELEVANT
+    ]
+
+
+def _timed_embed(model, queries):
+    """Embeds in EMBED_BATCH_SIZE chunks, the most one inference request accepts."""
+    data = []
+    start = time.perf_counter()
+    for i in range(0, len(queries), EMBED_BATCH_SIZE):
+        response = engine.pc.inference.embed(
+            model=model, inputs=queries[i:i + EMBED_BATCH_SIZE], parameters={"input_type": "query", "truncate": "END"}
+        )
+        data.extend(response.data)
+    return data, (time.perf_counter() - start) / max(len(queries), 1)
+
+
+def embed_eval_set(eval_set):
+    """Embeds every query once per model. Returns (vectors, per-query seconds per model)."""
+    queries = [item["query"] for item in eval_set]
+    dense_data, dense_seconds = _timed_embed("llama-text-embed-v2", queries)
+    sparse_data, sparse_seconds = _timed_embed("pinecone-sparse-english-v0", queries)
+    vectors = [
+        (dense["values"], {"indices": sparse["sparse_indices"], "values": sparse["sparse_values"]})
+        for dense, sparse in zip(dense_data, sparse_data)
+    ]
+    return vectors, {"dense": dense_seconds, "sparse": sparse_seconds}
+
+
+def query_config(dense_vector, sparse_vector, alpha, rerank, k):
+    """Top-k ids over every department's namespace, since labels come from the whole local store."""
+    dense, sparse = engine.scale_hybrid_vectors(dense_vector, sparse_vector, alpha)
+    query_kwargs = dict(
+        top_k=k,
+        vector=dense,
+        include_values=False,
+        include_metadata=rerank,
+    )
+    if sparse:
+        query_kwargs["sparse_vector"] = sparse
+    if rerank:
+        query_kwargs["rerank"] = {"model": "bge-reranker-v2-m3", "top_n": k, "rank_fields": ["chunk_text"]}
+    start = time.perf_counter()
+    matches = engine.query_namespaces(query_kwargs, all_namespaces())
+    return [match.id for match in matches], time.perf_counter() - start
+
+
+def ranking_metrics(ranked_ids, relevant, k):
+    relevant = set(relevant)
+    top = ranked_ids[:k]
+    hits = [product_id in relevant for product_id in top]
+    first_hit = next((rank for rank, hit in enumerate(hits, 1) if hit), None)
+    dcg = sum(1 / math.log2(rank + 1) for rank, hit in enumerate(hits, 1) if hit)
+    ideal = sum(1 / math.log2(rank + 1) for rank in range(1, min(k, len(relevant)) + 1))
+    return {
+        "recall": sum(hits) / min(k, len(relevant)),
+        "mrr": 1 / first_hit if first_hit else 0.0,
+        "ndcg": dcg / ideal if ideal else 0.0,
+    }
+
+
+def _p50(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] if samples else 0.0
+
+
+def evaluate_config(eval_set, vectors, embed_seconds, alpha, rerank, k):
+    """Mean metrics and p50 latency (embeds the configuration needs plus the index query)."""
+    totals = {"recall": 0.0, "mrr": 0.0, "ndcg": 0.0}
+    latencies = []
+    embed_cost = (embed_seconds["dense"] if alpha > 0 else 0.0) + (embed_seconds["sparse"] if alpha < 1 else 0.0)
+    for item, (dense_vector, sparse_vector) in zip(eval_set, vectors):
+        ranked_ids, seconds = query_config(dense_vector, sparse_vector, alpha, rerank, k)
+        for name, value in ranking_metrics(ranked_ids, item["relevant"], k).items():
+            totals[name] += value
+        latencies.append(embed_cost + seconds)
+    count = max(len(eval_set), 1)
+    return {
+        "alpha": alpha,
+        "rerank": rerank,
+        f"recall@{k}": round(totals["recall"] / count, 4),
+        "mrr": round(totals["mrr"] / count, 4),
+        f"ndcg@{k}": round(totals["ndcg"] / count, 4),
+        "p50_ms": round(_p50(latencies) * 1000, 1),
+    }
+
+
+def pareto_front(rows, quality_key):
+    """Names of configurations no other configuration beats on both quality and latency."""
+    front = []
+    for name, row in rows.items():
+        dominated = any(
+            other[quality_key] >= row[quality_key] and other["p50_ms"] <= row["p50_ms"]
+            and (other[quality_key] > row[quality_key] or other["p50_ms"] < row["p50_ms"])
+            for other_name, other in rows.items() if other_name != name
+        )
+        if not dominated:
+            front.append(name)
+    return front
+
+
+def print_table(rows, k, min_ndcg=None):
+    quality_key = f"ndcg@{k}"
+    front = set(pareto_front(rows, quality_key))
+    print(f"\n{'configuration':<20} {'recall@' + str(k):>10} {'MRR':>7} {quality_key:>9} {'p50 ms':>8}  pareto")
+    for name, row in sorted(rows.items(), key=lambda item: item[1]["p50_ms"]):
+        print(f"{name:<20} {row[f'recall@{k}']:>10.3f} {row['mrr']:>7.3f} {row[quality_key]:>9.3f} "
+              f"{row['p50_ms']:>8.1f}  {'*' if name in front else ''}")
+    if min_ndcg is not None:
+        passing = [(row["p50_ms"], name) for name, row in rows.items() if row[quality_key] >= min_ndcg]
+        if passing:
+            print(f"\nFastest configuration with {quality_key} >= {min_ndcg}: {min(passing)[1]}")
+        else:
+            print(f"\nNo configuration reaches {quality_key} >= {min_ndcg}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--eval-set", help="JSON labeled set to use instead of deriving one from the catalog")
+    parser.add_argument("--save-eval-set", help="write the derived labeled set for review or curation")
+    parser.add_argument("--configs", nargs="*", choices=sorted(CONFIGURATIONS), help="subset of configurations")
+    parser.add_argument("--min-ndcg", type=float, help="quality bar for picking the fastest configuration")
+    parser.add_argument("--output", help="write per-configuration results as JSON")
+    args = parser.parse_args()
+
+    if not engine.initialize_clients():
+        raise SystemExit("ERROR: Evaluation needs PINECONE_API_KEY and OPENAI_API_KEY.")
+    if args.eval_set:
+        with open(args.eval_set, 'r', encoding='utf-8') as f:
+            eval_set = json.load(f)
+    else:
+        eval_set = build_eval_set()
+    if not eval_set:
+        raise SystemExit("ERROR: Empty evaluation set. Run ingest so the local metadata store exists.")
+    if args.save_eval_set:
+        with open(args.save_eval_set, 'w', encoding='utf-8') as f:
+            json.dump(eval_set, f, indent=2)
+    print(f"INFO: Evaluating {len(eval_set)} labeled queries at k={args.k}.")
+
+    vectors, embed_seconds = embed_eval_set(eval_set)
+    rows = {
+        name: evaluate_config(eval_set, vectors, embed_seconds, *CONFIGURATIONS[name], args.k)
+        for name in (args.configs or CONFIGURATIONS)
+    }
+    print_table(rows, args.k, args.min_ndcg)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"k": args.k, "queries": len(eval_set), "configurations": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Load test for the async search service against local stub backends.
+
+Runs search/service.py in-process with stub OpenAI/Pinecone clients that only sleep for a
+configurable latency, then drives it over HTTP at increasing concurrency levels.
+
+    python bench/load_test.py --concurrency 1 4 16 64 --requests-per-session 5
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import itertools
+import threading
+from types import SimpleNamespace
+
+import httpx
+import uvicorn
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search import async_pipeline
+from search import hybrid_search_test as engine
+from search import llm_gateway
+from search.metadata_store import iter_products
+from search.service import app
+
+
+class _StubCompletions:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def create(self, model, messages, stream=False, response_format=None, stream_options=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        if response_format:
+            content = json.dumps({"vector_query": messages[-1]["content"][:80], "metadata_filters": {}, "top_k": 5})
+        else:
+            content = "Here are a few cheeses you might like. ******"
+        # Reported like OpenAI does, so the gateway settles its token reservations
+        prompt_tokens = len(json.dumps(messages)) // 4
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(content) // 4,
+                                total_tokens=prompt_tokens + len(content) // 4)
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+        async def chunks():
+            for word in content.split(" "):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))], usage=None)
+            if (stream_options or {}).get("include_usage"):
+                yield SimpleNamespace(choices=[], usage=usage)
+        return chunks()
+
+
+class StubAsyncOpenAI:
+    def __init__(self, latency):
+        self.chat = SimpleNamespace(completions=_StubCompletions(latency))
+
+
+class _StubInference:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def embed(self, model, inputs, parameters=None):
+        await asyncio.sleep(self.latency)
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        if "sparse" in model:
+            return SimpleNamespace(data=[{"sparse_indices": [1, 7, 42], "sparse_values": [0.4, 0.3, 0.2]} for _ in inputs])
+        return SimpleNamespace(data=[{"values": [random.random() for _ in range(1024)]} for _ in inputs])
+
+
+class StubAsyncPinecone:
+    def __init__(self, latency):
+        self.inference = _StubInference(latency)
+
+
+class StubAsyncIndex:
+    def __init__(self, latency):
+        self.latency = latency
+        self.product_ids = [product_id for product_id, _ in iter_products()] or [f"stub-{i}" for i in range(100)]
+
+    async def query(self, top_k, include_metadata=False, **kwargs):
+        await asyncio.sleep(self.latency)
+        ids = random.sample(self.product_ids, min(top_k, len(self.product_ids)))
+        return SimpleNamespace(matches=[
+            SimpleNamespace(id=product_id, score=1.0 - rank * 0.01,
+                            metadata={"product_name": product_id} if include_metadata else None)
+            for rank, product_id in enumerate(ids)
+        ])
+
+    async def fetch(self, ids, namespace=None):
+        return SimpleNamespace(vectors={product_id: SimpleNamespace(metadata={"product_name": product_id}) for product_id in ids})
+
+
+CHEESES = ("mild cheddar", "aged gouda", "fresh mozzarella", "smoked provolone", "crumbled feta", "swiss", "parmesan")
+DISHES = ("pizza", "a sandwich", "a salad", "pasta", "a cheese board", "burgers", "snacking")
+_session_ids = itertools.count()  # across levels too, so no level replays another's plans or cached answers
+
+
+def session_queries(session_id, count):
+    """Distinct queries for one session, so sessions neither coalesce nor hit each other's cached answers."""
+    return [f"{CHEESES[(session_id + turn) % len(CHEESES)]} for {DISHES[turn % len(DISHES)]}, under ${session_id + turn + 5}"
+            for turn in range(count)]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_service(llm_latency, embed_latency, query_latency):
+    # The stubs stand in for any account tier; set the variables to measure a real tier's limits instead
+    os.environ.setdefault("CHEESEBOT_LLM_RPM", str(10 ** 6))
+    os.environ.setdefault("CHEESEBOT_LLM_TPM", str(10 ** 9))
+    llm_gateway.reset_limits()
+    engine.load_local_artifacts()
+    async_pipeline.set_backends(
+        StubAsyncOpenAI(llm_latency), StubAsyncPinecone(embed_latency), StubAsyncIndex(query_latency)
+    )
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def _session(client, base_url, requests_per_session, latencies, stream):
+    conversation = {}  # carried between turns like the app does
+    for query in session_queries(next(_session_ids), requests_per_session):
+        start = time.perf_counter()
+        payload = {"query": query, "history": "", "conversation": conversation}
+        if stream:
+            async with client.stream("POST", f"{base_url}/chat/stream", json=payload) as response:
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif event == "done" and line.startswith("data: "):
+                        conversation = json.loads(line[len("data: "):]).get("conversation", conversation)
+        else:
+            response = await client.post(f"{base_url}/chat", json=payload)
+            response.raise_for_status()
+            conversation = response.json().get("conversation", conversation)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_level(base_url, concurrency, requests_per_session, stream):
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            _session(client, base_url, requests_per_session, latencies, stream) for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests-per-session", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per stub chat completion")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per stub embed call")
+    parser.add_argument("--query-latency", type=float, default=0.08, help="seconds per stub index query")
+    parser.add_argument("--stream", action="store_true", help="use the SSE endpoint instead of /chat")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_service(args.llm_latency, args.embed_latency, args.query_latency)
+    ideal = 2 * args.llm_latency + args.embed_latency + args.query_latency
+    print(f"Stub service at {base_url}; ideal single-request latency {ideal:.3f}s\n")
+    print(f"{'concurrency':>11} {'requests':>8} {'req/s':>8} {'p50 s':>7} {'p95 s':>7} {'scaling':>8}")
+    baseline = None
+    for concurrency in args.concurrency:
+        level = asyncio.run(run_level(base_url, concurrency, args.requests_per_session, args.stream))
+        baseline = baseline or level["throughput"] / level["concurrency"]
+        scaling = level["throughput"] / baseline
+        print(f"{level['concurrency']:>11} {level['requests']:>8} {level['throughput']:>8.2f} "
+              f"{level['p50']:>7.3f} {level['p95']:>7.3f} {scaling:>7.1f}x")
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
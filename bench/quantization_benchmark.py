@@ -0,0 +1,108 @@
+"""Memory, QPS and recall of int8-quantized ANN storage against full float32 precision.
+
+Builds one set of IVF lists, saves it once as float32 and once with int8 codes, and loads each
+through mmap in this process. For every configuration it reports the bytes scored per vector, the
+resident size of its memory-mapped files after the query pass, QPS and recall@k against exact
+float32 search, both at the default probe count and scanning every list.
+
+    python bench/quantization_benchmark.py --count 100000
+    python bench/quantization_benchmark.py --vectors passages.npy --queries-file queries.npy
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ann_benchmark import exact_top_k, recall, run_queries, synthetic_vectors
+from search import ann_index
+from search.ann_index import IvfIndex
+
+
+def resident_file_bytes(directory):
+    """Resident bytes of this process's memory maps of files in directory, from /proc/self/smaps."""
+    total = 0
+    mapped = False
+    with open("/proc/self/smaps") as f:
+        for line in f:
+            fields = line.split()
+            if "-" in fields[0] and not fields[0].endswith(":"):
+                mapped = len(fields) >= 6 and fields[-1].startswith(directory)
+            elif mapped and fields[0] == "Rss:":
+                total += int(fields[1]) * 1024
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100000, help="synthetic catalog size")
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--vectors", help="passage vectors (.npy), e.g. exported from the catalog ingest")
+    parser.add_argument("--queries-file", help="query vectors (.npy); held-out passages are used otherwise")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=ann_index.ANN_NPROBE, help="0: the index's default_nprobe")
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+    else:
+        vectors = synthetic_vectors(args.count + args.queries, args.dimension, args.clusters, seed=0)
+    if args.queries_file:
+        queries = np.load(args.queries_file).astype(np.float32)
+    else:
+        queries = vectors[-args.queries:] + 0.01 * rng.standard_normal((args.queries, vectors.shape[1])).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        vectors = vectors[:-args.queries]
+    ids = [str(100000 + i) for i in range(len(vectors))]
+
+    lists = IvfIndex.build(ids, vectors, quantization="none")
+    start = time.perf_counter()
+    codes, scales = ann_index.quantize_int8(lists.vectors)
+    quantize_s = time.perf_counter() - start
+    full_scan = lists.nlist
+    args.nprobe = args.nprobe or ann_index.default_nprobe(lists.nlist)
+    expected = [exact_top_k(vectors, ids, q, args.k) for q in queries]
+    report = {"vectors": len(vectors), "dimension": vectors.shape[1], "lists": lists.nlist, "k": args.k,
+              "quantize_s": round(quantize_s, 2), "configurations": {}}
+    print(f"{len(vectors)} vectors in {lists.nlist} lists; int8 codes computed in {quantize_s:.2f} s\n")
+    print(f"{'configuration':<34} {'bytes/vec':>9} {'mapped MB':>9} {'QPS':>8} {'recall@' + str(args.k):>10}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        configurations = [
+            ("int8+rescore", "int8", ann_index.RESCORE_FACTOR),
+            ("int8 rescore top-k only", "int8", 1),
+            ("float32", "none", ann_index.RESCORE_FACTOR),
+        ]
+        for quantization in ("int8", "none"):
+            IvfIndex(lists.centroids, lists.list_offsets, lists.vectors, lists.ids, quantization=quantization,
+                     codes=codes if quantization == "int8" else None, scales=scales).save(
+                os.path.join(directory, quantization))
+        for name, quantization, rescore_factor in configurations:
+            path = os.path.join(directory, quantization)
+            ann = IvfIndex.load(path)
+            ann_index.RESCORE_FACTOR = rescore_factor
+            bytes_per_vector = ann.dimension * 4 if ann.codes is None else ann.dimension + 4
+            for label, nprobe in ((f"p={args.nprobe}", args.nprobe), ("all lists", full_scan)):
+                results, qps = run_queries(lambda q: [i for i, _ in ann.search(q, args.k, nprobe)], queries)
+                resident = resident_file_bytes(path) / 2 ** 20
+                score = float(np.mean([recall(r, e) for r, e in zip(results, expected)]))
+                key = f"{name} {label}"
+                report["configurations"][key] = {"bytes_per_vector": bytes_per_vector, "resident_mb": round(resident, 1),
+                                                 "qps": round(qps, 1), "recall": round(score, 4)}
+                print(f"{key:<34} {bytes_per_vector:>9} {resident:>9.1f} {qps:>8.1f} {score:>10.4f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Record real OpenAI/Pinecone responses once, then replay them offline with injected latency.
+
+Without API keys, a small synthetic fixture can be written instead from deterministic stand-in
+backends over a sample of the local catalog (see SyntheticOpenAI and friends).
+
+Fixtures are keyed so that retrieval knobs can change without re-recording:
+chat completions by (user query, plan/response), embeddings by (model, inputs) and index
+queries by the query vectors only. Queries are recorded with a wide top_k and full metadata;
+replay applies the requested filter, top_k and include_metadata locally.
+"""
+import os
+import sys
+import re
+import json
+import math
+import time
+import hashlib
+import threading
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search.filters import matches_filter
+
+RECORD_TOP_K = 100
+SYNTHETIC_DIMENSION = 16
+SYNTHETIC_PRODUCTS = 20
+# Fields kept on synthetic products; the long lists and page text would only bloat the committed fixture
+SYNTHETIC_FIELDS = ("product_name", "brand", "categories", "price", "unit_price", "weight", "dimensions", "status",
+                    "sku", "upc", "quantity_package_info", "product_detail_url", "image_url")
+DEFAULT_LATENCY = {"plan": 0.9, "response": 2.5, "embed": 0.06, "query": 0.09, "fetch": 0.05}
+
+
+def _digest(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:24]
+
+
+def _normalized(values):
+    # Scale-free, so alpha-weighted copies of the same query vectors share one fixture
+    peak = max((abs(v) for v in values), default=0.0) or 1.0
+    return [round(v / peak, 5) for v in values]
+
+
+def _query_key(kwargs):
+    sparse = kwargs.get("sparse_vector") or {}
+    return _digest([
+        kwargs.get("namespace"),
+        _normalized(kwargs.get("vector") or []),
+        list(sparse.get("indices", [])),
+        _normalized(sparse.get("values", [])),
+    ])
+
+
+def _chat_kind(kwargs):
+    return "plan" if kwargs.get("response_format") else "response"
+
+
+class BackendFixture:
+    """Recorded responses plus the latency observed while recording them."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self.data = {"chat": {}, "embed": {}, "query": {}, "fetch": {}}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data.update(json.load(f))
+
+    @property
+    def current_query(self):
+        """User query of the turn running on this thread; chat fixtures are keyed by it."""
+        return getattr(self._local, "query", None)
+
+    @current_query.setter
+    def current_query(self, query):
+        self._local.query = query
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, separators=(",", ":"))
+
+    def put(self, section, key, response, seconds):
+        with self.lock:
+            self.data[section][key] = {"response": response, "seconds": seconds}
+
+    def get(self, section, key):
+        entry = self.data[section].get(key)
+        if entry is None:
+            raise KeyError(f"No recorded {section} response for {key!r}. Re-record fixtures with --record.")
+        return entry
+
+
+class _Dotted(SimpleNamespace):
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+
+# --- recording wrappers around real clients ---------------------------------------------
+
+class _RecordingCompletions:
+    def __init__(self, fixture, real_client):
+        self.fixture = fixture
+        self.real_client = real_client
+
+    def create(self, **kwargs):
+        start = time.perf_counter()
+        response = self.real_client.chat.completions.create(**kwargs)
+        usage = getattr(response, "usage", None)
+        self.fixture.put("chat", f"{self.fixture.current_query}::{_chat_kind(kwargs)}", {
+            "content": response.choices[0].message.content,
+            "usage": {
+                "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+                "completion_tokens": getattr(usage, "completion_tokens", 0),
+            },
+        }, time.perf_counter() - start)
+        return response
+
+
+class RecordingOpenAI:
+    def __init__(self, fixture, real_client):
+        self.chat = SimpleNamespace(completions=_RecordingCompletions(fixture, real_client))
+
+
+class _RecordingInference:
+    def __init__(self, fixture, real_pc):
+        self.fixture = fixture
+        self.real_pc = real_pc
+
+    def embed(self, model, inputs, parameters=None):
+        start = time.perf_counter()
+        response = self.real_pc.inference.embed(model=model, inputs=inputs, parameters=parameters)
+        data = []
+        for item in response.data:
+            if "sparse" in model:
+                data.append({"sparse_indices": list(item["sparse_indices"]), "sparse_values": list(item["sparse_values"])})
+            else:
+                data.append({"values": list(item["values"])})
+        self.fixture.put("embed", _digest([model, inputs]), {"data": data}, time.perf_counter() - start)
+        return response
+
+
+class RecordingPinecone:
+    def __init__(self, fixture, real_pc):
+        self.inference = _RecordingInference(fixture, real_pc)
+
+
+class RecordingIndex:
+    def __init__(self, fixture, real_index):
+        self.fixture = fixture
+        self.real_index = real_index
+
+    def query(self, **kwargs):
+        record_kwargs = dict(kwargs, top_k=max(kwargs.get("top_k", 10), RECORD_TOP_K), include_metadata=True, filter=None)
+        record_kwargs.pop("rerank", None)
+        start = time.perf_counter()
+        response = self.real_index.query(**record_kwargs)
+        seconds = time.perf_counter() - start
+        self.fixture.put("query", _query_key(kwargs), {"matches": [
+            {"id": match.id, "score": match.score, "metadata": dict(match.metadata or {})} for match in response.matches
+        ]}, seconds)
+        # Serve the caller what it asked for
+        return _replay_query(self.fixture.data["query"][_query_key(kwargs)]["response"], kwargs)
+
+    def fetch(self, ids, namespace=None):
+        start = time.perf_counter()
+        response = self.real_index.fetch(ids=ids, namespace=namespace)
+        self.fixture.put("fetch", _digest([namespace, sorted(ids)]), {"vectors": {
+            vector_id: {"metadata": dict(vector.metadata or {})} for vector_id, vector in response.vectors.items()
+        }}, time.perf_counter() - start)
+        return response
+
+
+# --- offline replay ---------------------------------------------------------------------
+
+def _replay_query(recorded, kwargs):
+    matches = []
+    for match in recorded["matches"]:
+        if kwargs.get("filter") and not matches_filter(match["metadata"], kwargs["filter"]):
+            continue
+        metadata = dict(match["metadata"]) if kwargs.get("include_metadata") else None
+        matches.append(_Dotted(id=match["id"], score=match["score"], metadata=metadata))
+        if len(matches) == kwargs.get("top_k", 10):
+            break
+    return _Dotted(matches=matches)
+
+
+class _Replayer:
+    def __init__(self, fixture, latency=None, latency_scale=1.0):
+        self.fixture = fixture
+        self.latency = latency or {}
+        self.latency_scale = latency_scale
+
+    def _sleep(self, kind, recorded_seconds):
+        seconds = self.latency.get(kind, recorded_seconds if recorded_seconds is not None else DEFAULT_LATENCY[kind])
+        if seconds > 0:
+            time.sleep(seconds * self.latency_scale)
+
+
+class _ReplayCompletions(_Replayer):
+    def create(self, **kwargs):
+        kind = _chat_kind(kwargs)
+        entry = self.fixture.get("chat", f"{self.fixture.current_query}::{kind}")
+        self._sleep(kind, entry.get("seconds"))
+        response = entry["response"]
+        return _Dotted(
+            choices=[_Dotted(message=_Dotted(content=response["content"]))],
+            usage=_Dotted(**response.get("usage", {}))
+        )
+
+
+class ReplayOpenAI:
+    def __init__(self, fixture, latency=None, latency_scale=1.0):
+        self.chat = SimpleNamespace(completions=_ReplayCompletions(fixture, latency, latency_scale))
+
+
+class _ReplayInference(_Replayer):
+    def embed(self, model, inputs, parameters=None):
+        entry = self.fixture.get("embed", _digest([model, inputs]))
+        self._sleep("embed", entry.get("seconds"))
+        return _Dotted(data=[dict(item) for item in entry["response"]["data"]])
+
+
+class ReplayPinecone:
+    def __init__(self, fixture, latency=None, latency_scale=1.0):
+        self.inference = _ReplayInference(fixture, latency, latency_scale)
+
+
+class ReplayIndex(_Replayer):
+    def query(self, **kwargs):
+        entry = self.fixture.get("query", _query_key(kwargs))
+        self._sleep("query", entry.get("seconds"))
+        return _replay_query(entry["response"], kwargs)
+
+    def fetch(self, ids, namespace=None):
+        entry = self.fixture.get("fetch", _digest([namespace, sorted(ids)]))
+        self._sleep("fetch", entry.get("seconds"))
+        return _Dotted(vectors={
+            vector_id: _Dotted(metadata=vector["metadata"]) for vector_id, vector in entry["response"]["vectors"].items()
+        })
+
+
+# --- synthetic stand-ins for the real backends ------------------------------------------
+# Recorded through the wrappers above like real clients; their entries carry no latency, so
+# replay injects DEFAULT_LATENCY unless told otherwise.
+
+def _hashed_tokens(text):
+    return [int(hashlib.sha256(token.encode('utf-8')).hexdigest()[:8], 16) for token in re.findall(r"[a-z]+", text.lower())]
+
+
+def synthetic_dense(text):
+    values = [0.0] * SYNTHETIC_DIMENSION
+    for token in _hashed_tokens(text):
+        values[token % SYNTHETIC_DIMENSION] += 1.0
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [round(v / norm, 5) for v in values]
+
+
+def synthetic_sparse(text):
+    indices = sorted({token % 65536 for token in _hashed_tokens(text)})
+    return {"sparse_indices": indices, "sparse_values": [1.0] * len(indices)}
+
+
+class _SyntheticCompletions:
+    def create(self, model, messages, response_format=None, **kwargs):
+        prompt = messages[-1]["content"]
+        match = re.search(r'Based on this user query: "(.*)"', prompt)
+        query = match.group(1) if match else prompt[:80]
+        if response_format:
+            content = json.dumps({"vector_query": query, "metadata_filters": {}, "top_k": 5})
+        else:
+            content = f"Here are a few cheeses for \"{query}\" from the catalog.\n\n******"
+        usage = SimpleNamespace(prompt_tokens=len(json.dumps(messages)) // 4, completion_tokens=len(content) // 4)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+class SyntheticOpenAI:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=_SyntheticCompletions())
+
+
+class _SyntheticInference:
+    def embed(self, model, inputs, parameters=None):
+        if "sparse" in model:
+            return _Dotted(data=[synthetic_sparse(text) for text in inputs])
+        return _Dotted(data=[{"values": synthetic_dense(text)} for text in inputs])
+
+
+class SyntheticPinecone:
+    def __init__(self):
+        self.inference = _SyntheticInference()
+
+
+class SyntheticIndex:
+    """Scores a fixed product sample by dense and sparse overlap with its name, brand and categories."""
+
+    def __init__(self, products):
+        products = [(product_id, {field: metadata[field] for field in SYNTHETIC_FIELDS if field in metadata})
+                    for product_id, metadata in products]
+        self.products = [
+            (product_id, metadata, synthetic_dense(_product_text(metadata)), set(synthetic_sparse(_product_text(metadata))["sparse_indices"]))
+            for product_id, metadata in products
+        ]
+
+    def query(self, top_k=10, vector=None, sparse_vector=None, filter=None, include_metadata=False, **kwargs):
+        sparse = dict(zip((sparse_vector or {}).get("indices", []), (sparse_vector or {}).get("values", [])))
+        scored = []
+        for product_id, metadata, dense, sparse_ids in self.products:
+            if filter and not matches_filter(metadata, filter):
+                continue
+            score = sum(a * b for a, b in zip(vector or [], dense)) + sum(sparse.get(i, 0.0) for i in sparse_ids)
+            scored.append(_Dotted(id=product_id, score=round(score, 5), metadata=dict(metadata) if include_metadata else None))
+        scored.sort(key=lambda match: match.score, reverse=True)
+        return _Dotted(matches=scored[:top_k])
+
+    def fetch(self, ids, namespace=None):
+        wanted = set(ids)
+        return _Dotted(vectors={product_id: _Dotted(metadata=dict(metadata))
+                                for product_id, metadata, _, _ in self.products if product_id in wanted})
+
+
+def _product_text(metadata):
+    categories = metadata.get("categories") or ""
+    if isinstance(categories, list):
+        categories = " ".join(categories)
+    return f"{metadata.get('product_name', '')} {metadata.get('brand', '')} {categories}"
+
+
+def clear_recorded_latency(fixture):
+    """Drops the (meaningless) latency recorded against synthetic backends."""
+    for section in fixture.data.values():
+        for entry in section.values():
+            entry["seconds"] = None
@@ -0,0 +1,85 @@
+"""Start-up profile for the Streamlit app.
+
+Prints the slowest imports (python -X importtime) of the search module, then measures in a fresh
+interpreter how long app.py takes to render its first interactive frame and how long until the
+background warm-up reports ready or offline.
+
+    python bench/startup_profile.py --top 15
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_FRAME_SCRIPT = r"""
+import json, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_loaded = time.perf_counter()
+at = AppTest.from_file("app.py", default_timeout=120)
+at.run()
+first_frame = time.perf_counter()
+status = None
+while status is None and time.perf_counter() - first_frame < 120:
+    status = next((c.value for c in at.caption if c.value in ("🟢 Ready", "🔴 Offline")), None)
+    if status is None:
+        time.sleep(0.1)
+        at.run()
+print(json.dumps({
+    "streamlit_import_s": streamlit_loaded - start,
+    "first_frame_s": first_frame - streamlit_loaded,
+    "backend_status_s": time.perf_counter() - streamlit_loaded,
+    "status": status,
+}))
+"""
+
+
+def import_profile(module, top):
+    """(cumulative microseconds, self microseconds, module) of the slowest imports of module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), int(own), name.rstrip()))
+    total = next((row[0] for row in rows if row[2].strip() == module), 0)
+    return total, sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="search.hybrid_search_test")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--skip-app", action="store_true", help="only print the import profile")
+    args = parser.parse_args()
+
+    total, rows = import_profile(args.module, args.top)
+    print(f"import {args.module}: {total / 1000:.0f} ms")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for cumulative, own, name in rows:
+        print(f"{cumulative / 1000:>14.1f} {own / 1000:>8.1f}  {name}")
+    for sdk in ("openai", "pinecone"):
+        sdk_total, _ = import_profile(sdk, 0)
+        print(f"(deferred to warm-up) import {sdk}: {sdk_total / 1000:.0f} ms")
+
+    if not args.skip_app:
+        result = subprocess.run([sys.executable, "-c", FIRST_FRAME_SCRIPT], cwd=ROOT, capture_output=True, text=True)
+        lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+        if not lines:
+            print(result.stderr[-2000:])
+            raise SystemExit("ERROR: App start-up measurement failed.")
+        timings = json.loads(lines[-1])
+        print(f"\nstreamlit import: {timings['streamlit_import_s'] * 1000:.0f} ms (paid once by the server)")
+        print(f"first interactive frame: {timings['first_frame_s'] * 1000:.0f} ms")
+        print(f"backend {timings['status'] or 'still warming up'}: {timings['backend_status_s'] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Sweeps the hybrid alpha over the retrieval evaluation set to pick CHEESEBOT_HYBRID_ALPHA.
+
+Alpha is the dense share of the hybrid score (0 = sparse/keyword only, 1 = dense only).
+Reports nDCG@k per query kind for every alpha, the best alpha per kind (a guide for the
+per-type guidance in prompt/system.txt) and the best overall default.
+
+    python bench/sweep_alpha.py --step 0.1 --k 10
+"""
+import os
+import sys
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench.eval_retrieval import build_eval_set, embed_eval_set, query_config, ranking_metrics
+from search import hybrid_search_test as engine
+
+
+def sweep(eval_set, vectors, alphas, k, rerank=False):
+    """{alpha: {kind: mean nDCG@k, "all": mean over every query}}"""
+    kinds = sorted({item["kind"] for item in eval_set})
+    table = {}
+    for alpha in alphas:
+        totals = {kind: [] for kind in kinds}
+        for item, (dense_vector, sparse_vector) in zip(eval_set, vectors):
+            ranked_ids, _ = query_config(dense_vector, sparse_vector, alpha, rerank, k)
+            totals[item["kind"]].append(ranking_metrics(ranked_ids, item["relevant"], k)["ndcg"])
+        row = {kind: sum(scores) / len(scores) for kind, scores in totals.items() if scores}
+        row["all"] = sum(sum(scores) for scores in totals.values()) / len(eval_set)
+        table[alpha] = row
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--step", type=float, default=0.1)
+    parser.add_argument("--rerank", action="store_true", help="sweep with Pinecone reranking enabled")
+    args = parser.parse_args()
+
+    if not engine.initialize_clients():
+        raise SystemExit("ERROR: The sweep needs PINECONE_API_KEY and OPENAI_API_KEY.")
+    eval_set = build_eval_set()
+    if not eval_set:
+        raise SystemExit("ERROR: Empty evaluation set. Run ingest so the local metadata store exists.")
+    vectors, _ = embed_eval_set(eval_set)
+
+    steps = int(round(1 / args.step))
+    alphas = [round(i * args.step, 3) for i in range(steps + 1)]
+    table = sweep(eval_set, vectors, alphas, args.k, args.rerank)
+
+    columns = [kind for kind in table[alphas[0]] if kind != "all"] + ["all"]
+    print(f"\n{'alpha':>6} " + " ".join(f"{column:>11}" for column in columns))
+    for alpha in alphas:
+        print(f"{alpha:>6.2f} " + " ".join(f"{table[alpha].get(column, 0.0):>11.3f}" for column in columns))
+    print()
+    for column in columns:
+        best = max(alphas, key=lambda alpha: table[alpha].get(column, 0.0))
+        print(f"best alpha for {column:<11} {best:.2f} (nDCG@{args.k} {table[best].get(column, 0.0):.3f})")
+    best_overall = max(alphas, key=lambda alpha: table[alpha]["all"])
+    print(f"\nSuggested default: CHEESEBOT_HYBRID_ALPHA={best_overall} (current {engine.DEFAULT_ALPHA})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Checks the web-search client against a local SerpAPI stub.
+
+Starts a threaded HTTP server that answers like SerpAPI after a fixed delay, then measures a cold
+search, a cached repeat, identical concurrent searches (which should reach the server once) and a
+search overlapped with a simulated catalog pipeline.
+
+    python bench/web_search_stub.py --latency 0.4 --concurrency 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search import web_search as client
+
+
+class StubSerpApi(BaseHTTPRequestHandler):
+    latency = 0.4
+    hits = 0
+    hits_lock = threading.Lock()
+
+    def do_GET(self):
+        with StubSerpApi.hits_lock:
+            StubSerpApi.hits += 1
+        time.sleep(self.latency)
+        query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        body = json.dumps({"organic_results": [
+            {"title": f"{query} result {i}", "link": f"https://example.com/{i}", "snippet": f"About {query}."}
+            for i in range(10)
+        ]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(latency):
+    StubSerpApi.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubSerpApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/search"
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.4, help="seconds the stub waits before answering")
+    parser.add_argument("--concurrency", type=int, default=8, help="identical searches issued at once")
+    parser.add_argument("--pipeline-seconds", type=float, default=1.0, help="simulated catalog pipeline time")
+    args = parser.parse_args()
+
+    server, url = start_stub(args.latency)
+    client.SERPAPI_URL = url
+    client.SERPAPI_API_KEY = client.SERPAPI_API_KEY or "stub-key"
+
+    result, cold = timed(client.web_search, "aged gouda")
+    assert result["success"] and result["total_results"] == 5, result
+    result, warm = timed(client.web_search, "  Aged   GOUDA ")
+    assert result.get("cached"), "normalized repeat should be served from the cache"
+    print(f"cold search: {cold * 1000:.0f} ms, cached repeat: {warm * 1000:.2f} ms")
+
+    hits_before = StubSerpApi.hits
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(lambda _: client.web_search("smoked provolone"), range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    assert all(r["success"] for r in results)
+    print(f"{args.concurrency} identical concurrent searches: {StubSerpApi.hits - hits_before} upstream request(s), "
+          f"{elapsed * 1000:.0f} ms")
+
+    start = time.perf_counter()
+    future = client.submit_web_search("fresh mozzarella")
+    time.sleep(args.pipeline_seconds)  # stands in for plan + retrieval
+    result = client.collect_web_result(future, 0.5)
+    elapsed = time.perf_counter() - start
+    print(f"search overlapped with a {args.pipeline_seconds:.1f} s pipeline: done after {elapsed * 1000:.0f} ms "
+          f"(sequential would be {(args.pipeline_seconds + args.latency) * 1000:.0f} ms), "
+          f"{'included' if result else 'skipped'}")
+
+    client._get_session().close()
+    server.shutdown()
+    print(json.dumps(client.web_search_metrics()))
+
+
+if __name__ == "__main__":
+    main()
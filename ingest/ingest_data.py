@@ -1,50 +1,78 @@
 import json
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from dotenv import load_dotenv # Import the dotenv library
 
 from pinecone import Pinecone
 from pinecone import ServerlessSpec
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from search.ann_index import save_ann_index, sync_ann_index
+from search.catalog import DEFAULT_CATALOG_DIR, LEGACY_JSON_PATH, convert_json_catalog, load_catalog_items
+from search.code_index import build_code_index, save_code_index
+from search.departments import build_namespace_map, load_departments, save_namespace_map
+from search.filters import build_metadata_schema, save_metadata_schema
+from search.lexicon import build_lexicon, save_lexicon
+from search.metadata_store import build_metadata_store, changed_product_ids, load_saved_store, save_metadata_store
+from search.product_graph import build_product_graph, save_product_graph
+from search.response_cache import record_ingest_generation
+from search.thumbnails import build_thumbnails, save_thumbnail_manifest
+
 load_dotenv()
 
 PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
 
 UPSERT_BATCH_SIZE = 50
-
-pc = Pinecone(api_key=PINECONE_API_KEY)
+EMBED_BATCH_SIZE = 96  # most inputs llama-text-embed-v2 accepts per request
+INGEST_WORKERS = 4  # departments embedded and upserted at the same time
 
 index_name = "cheese-chatbot"
 
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-
-
-if not pc.has_index(index_name):
-    pc.create_index(
-        name=index_name,
-        vector_type="dense",
-        dimension=1024,
-        metric="dotproduct",
-        spec=ServerlessSpec(
-            cloud="aws",
-            region="us-east-1"
+def connect_pinecone():
+    """Creates the Pinecone client, and the index if it does not exist yet. Called from main so that
+    importing this module (e.g. for its chunking helpers) makes no network calls."""
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+    if not pc.has_index(index_name):
+        pc.create_index(
+            name=index_name,
+            vector_type="dense",
+            dimension=1024,
+            metric="dotproduct",
+            spec=ServerlessSpec(
+                cloud="aws",
+                region="us-east-1"
+            )
         )
-    )
-
-def load_cheese_data(filepath="../scraper/kimelo_cheese_detailed_data_all_pages.json"):
-    """Loads cheese data from a JSON file."""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        print(f"Successfully loaded {len(data)} cheese items from {filepath}")
-        return data
-    except FileNotFoundError:
-        print(f"Error: File not found at {filepath}")
-        return []
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from {filepath}")
-        return []
+    return pc
+
+def load_cheese_data(catalog_dir=DEFAULT_CATALOG_DIR):
+    """Loads cheese items from the columnar catalog written by the scraper.
+
+    A scrape that only exists as the older JSON array is converted to the catalog first.
+    """
+    if not os.path.exists(catalog_dir) and os.path.exists(LEGACY_JSON_PATH):
+        print(f"Converting {LEGACY_JSON_PATH} to the columnar catalog...")
+        try:
+            convert_json_catalog(LEGACY_JSON_PATH, catalog_dir)
+        except (ValueError, json.JSONDecodeError) as e:
+            print(f"Error: Could not convert {LEGACY_JSON_PATH}: {e}")
+            return []
+    data = load_catalog_items(catalog_dir)
+    if data:
+        print(f"Successfully loaded {len(data)} cheese items from {catalog_dir}")
+    return data
+
+def load_department_data(department):
+    """Loads one department's items from its catalog; only cheese has a legacy JSON scrape."""
+    if department["catalog_dir"] == DEFAULT_CATALOG_DIR:
+        return load_cheese_data()
+    data = load_catalog_items(department["catalog_dir"])
+    if data:
+        print(f"Successfully loaded {len(data)} {department['name']} items from {department['catalog_dir']}")
+    return data
 
 def create_even_more_detailed_semantic_text_chunk(item: dict) -> str:
     name = item.get('product_name_detail', item.get('product_name', ''))
@@ -249,13 +277,46 @@ def prepare_detailed_metadata(item: dict) -> dict:
     return {k: v for k, v in metadata.items() if v is not None and v != ""}
 
 
+def embed_and_upsert(pc, namespace, all_metadata, all_text_chunks):
+    """Embeds one department's chunks and upserts them into its namespace. Returns the dense vectors."""
+    index = pc.Index(index_name)
+    dense_vectors = []
+    for start in range(0, len(all_text_chunks), EMBED_BATCH_SIZE):
+        chunks = all_text_chunks[start:start + EMBED_BATCH_SIZE]
+        dense_embeddings = pc.inference.embed(
+            model="llama-text-embed-v2",
+            inputs=chunks,
+            parameters={"input_type": "passage", "truncate": "END"}
+        )
+        sparse_embeddings = pc.inference.embed(
+            model="pinecone-sparse-english-v0",
+            inputs=chunks,
+            parameters={"input_type": "passage", "truncate": "END"}
+        )
+        records = []
+        for d, de, se in zip(all_metadata[start:start + EMBED_BATCH_SIZE], dense_embeddings, sparse_embeddings):
+            records.append({
+                "id": d['_id'],
+                "values": de['values'],
+                "sparse_values": {'indices': se['sparse_indices'], 'values': se['sparse_values']},
+                "metadata": d
+            })
+            dense_vectors.append(de['values'])
+        for batch_start in range(0, len(records), UPSERT_BATCH_SIZE):
+            index.upsert(vectors=records[batch_start:batch_start + UPSERT_BATCH_SIZE], namespace=namespace)
+    print(f"Upserted {len(all_metadata)} products into namespace '{namespace}'.")
+    return dense_vectors
+
 def main():
 
-    cheese_data_list = load_cheese_data()
-    if not cheese_data_list:
+    departments = load_departments()
+    data_by_department = {department["name"]: load_department_data(department) for department in departments}
+    departments = [department for department in departments if data_by_department[department["name"]]]
+    if not departments:
         print("No data to process. Exiting.")
         return
     try:
+        pc = connect_pinecone()
         index = pc.Index(index_name)
         print(f"Connected to index '{index_name}'.")
         print(f"Index stats before upsert: {index.describe_index_stats()}")
@@ -263,53 +324,85 @@ def main():
         print(f"Error connecting to Pinecone index '{index_name}': {e}")
         return
     all_metadata = []
-    all_text_chunks = []
-    
-    for i, item in enumerate(tqdm(cheese_data_list, desc="Preparing Items")):
-        vector_id = str(item.get('sku') or item.get('product_code_from_url') or f"item_{i}") # Fallback ID
-        if not item.get('sku') and not item.get('product_code_from_url'):
-            tqdm.write(f"Warning: Item {item.get('product_name', 'Unknown Name')} (index {i}) is missing a reliable ID. Using generated ID: {vector_id}.")
-
-        text_chunk = create_even_more_detailed_semantic_text_chunk(item)
-        metadata = prepare_detailed_metadata(item)
-        metadata['_id'] = vector_id
-
-        all_metadata.append(metadata)
-        all_text_chunks.append(text_chunk)
-
-    print("Embedding....")
-    dense_embeddings = pc.inference.embed(
-        model="llama-text-embed-v2",
-        inputs=[d for d in all_text_chunks],
-        parameters={"input_type": "passage", "truncate": "END"}
-    )
-
-    sparse_embeddings = pc.inference.embed(
-        model="pinecone-sparse-english-v0",
-        inputs=[d for d in all_text_chunks],
-        parameters={"input_type": "passage", "truncate": "END"}
-    )
-
-    print("End Embedding...")
+    id_item_pairs = []
+    metadata_by_department = {}
+    chunks_by_department = {}
+
+    for department in departments:
+        department_metadata = metadata_by_department[department["name"]] = []
+        department_chunks = chunks_by_department[department["name"]] = []
+        # Generated ids keep their old form for cheese and are prefixed for other departments
+        fallback_prefix = "" if department["catalog_dir"] == DEFAULT_CATALOG_DIR else f"{department['name']}_"
+        for i, item in enumerate(tqdm(data_by_department[department["name"]], desc=f"Preparing {department['name']}")):
+            vector_id = str(item.get('sku') or item.get('product_code_from_url') or f"{fallback_prefix}item_{i}") # Fallback ID
+            if not item.get('sku') and not item.get('product_code_from_url'):
+                tqdm.write(f"Warning: Item {item.get('product_name', 'Unknown Name')} (index {i}) is missing a reliable ID. Using generated ID: {vector_id}.")
+
+            metadata = prepare_detailed_metadata(item)
+            metadata['_id'] = vector_id
+
+            department_metadata.append(metadata)
+            department_chunks.append(create_even_more_detailed_semantic_text_chunk(item))
+            id_item_pairs.append((vector_id, item))
+        all_metadata.extend(department_metadata)
+
+    # The local artifacts are built first but written only once every upsert has succeeded, so they
+    # never describe products the index does not have
+    schema = build_metadata_schema(all_metadata)
+    store = build_metadata_store(all_metadata)
+    if len(store["rows"]) < len(all_metadata):
+        print(f"Warning: {len(all_metadata) - len(store['rows'])} products share an id with another product; the local store keeps one of each.")
+    changed_ids = changed_product_ids(load_saved_store(), store)
+    graph = build_product_graph(id_item_pairs)
+    code_index = build_code_index(all_metadata)
+    lexicon = build_lexicon(all_metadata)
+    thumbnails = build_thumbnails(all_metadata)
+    namespace_map = build_namespace_map(metadata_by_department, departments)
+
+    # Each department is embedded and upserted into its own namespace concurrently
+    print(f"Embedding and upserting {len(departments)} department(s)...")
+    with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as executor:
+        futures = {
+            department["name"]: executor.submit(
+                embed_and_upsert, pc, department["namespace"],
+                metadata_by_department[department["name"]], chunks_by_department[department["name"]]
+            )
+            for department in departments
+        }
+        dense_vectors = []
+        failed = []
+        for department in departments:
+            try:
+                dense_vectors.extend(futures[department["name"]].result())
+            except Exception as e:
+                print(f"ERROR: Embedding and upserting department '{department['name']}' failed: {e}")
+                failed.append(department["name"])
+    if failed:
+        print(f"ERROR: {len(failed)} department(s) failed ({', '.join(failed)}); local artifacts were left unchanged. Re-run ingest.")
+        return
 
-    index = pc.Index(index_name)
+    schema_path = save_metadata_schema(schema)
+    print(f"Saved metadata schema to {schema_path}")
+    store_path = save_metadata_store(store)
+    print(f"Saved local metadata store to {store_path}")
+    graph_path = save_product_graph(graph)
+    print(f"Saved product graph to {graph_path}")
+    codes_path = save_code_index(code_index)
+    print(f"Saved code index to {codes_path}")
+    lexicon_path = save_lexicon(lexicon)
+    print(f"Saved lexicon to {lexicon_path}")
+    thumbnails_path = save_thumbnail_manifest(thumbnails)
+    print(f"Saved thumbnail manifest to {thumbnails_path}")
+    namespaces_path = save_namespace_map(namespace_map)
+    print(f"Saved namespace routing table to {namespaces_path}")
+
+    ann_path = save_ann_index(sync_ann_index([d['_id'] for d in all_metadata], dense_vectors, changed_ids))
+    print(f"Saved ANN index to {ann_path}")
+    # Last, so serving processes that pick up the new generation also see the artifacts it describes
+    dropped = record_ingest_generation(changed_ids)
+    print(f"{len(changed_ids)} products changed since the last ingest; invalidated {dropped} shared cached answers,"
+          f" serving processes drop theirs on the next lookup.")
 
-    records = []
-    for d, de, se in zip(all_metadata, dense_embeddings, sparse_embeddings):
-        records.append({
-            "id": d['_id'],
-            "values": de['values'],
-            "sparse_values": {'indices': se['sparse_indices'], 'values': se['sparse_values']},
-            "metadata": d
-        })
-
-    print("Upserting...")
-
-    index.upsert(
-        vectors=records,
-        namespace="hybrid-namespace"
-    )
-        
     print(f"\n--- Indexing Complete ---")
     print(f"Final index stats: {index.describe_index_stats()}")
 
@@ -7,6 +7,7 @@ import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
 import threading
 import os
+import sys
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -14,6 +15,10 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from search.catalog import DEFAULT_CATALOG_DIR, write_catalog
+from search.departments import load_departments, save_departments
+
 BASE_APP_URL = "https://shop.kimelo.com/"
 MAX_WORKERS = 5
 thread_local = threading.local()
@@ -238,27 +243,20 @@ def scrape_listing_page(url, headers):
 
     return products_on_this_page
 
+save_lock = threading.Lock()
+
 def save_to_json(data, filename, is_first=False):
-    """Save data to JSON file, either creating new or appending to existing"""
+    """Append one product as a JSON line to the checkpoint file (truncated for the first product)"""
     try:
-        if is_first:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump([data], f, ensure_ascii=False, indent=4)
-        else:
-            try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                existing_data = []
-            
-            existing_data.append(data)
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(existing_data, f, ensure_ascii=False, indent=4)
-                
+        with save_lock, open(filename, 'w' if is_first else 'a', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False) + "\n")
     except Exception as e:
         print(f"Error saving to JSON: {e}")
 
+def load_checkpoint(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
 def process_product_batch(product_batch, output_filename, is_first_batch=False):
     """Process a batch of products in parallel and save results incrementally"""
     results = []
@@ -288,18 +286,21 @@ def process_product_batch(product_batch, output_filename, is_first_batch=False):
     
     return results
 
-if __name__ == '__main__':
-    base_department_url = "https://shop.kimelo.com/department/cheese/3365"
-    output_filename = "kimelo_cheese_detailed_data_all_pages.json"
+def checkpoint_filename(department):
+    # Cheese keeps the checkpoint name it had before there were departments
+    if department["catalog_dir"] == DEFAULT_CATALOG_DIR:
+        return "kimelo_cheese_detailed_data_all_pages.jsonl"
+    return f"kimelo_{department['name']}_detailed_data_all_pages.jsonl"
+
+def scrape_department(department):
+    """Scrape every listing page of a department, then its product details, and write its catalog"""
+    base_department_url = department["url"]
+    # Products are checkpointed as JSON lines while scraping; the columnar catalog is written at the end
+    output_filename = checkpoint_filename(department)
     
     page_number = 1
-    
-    common_headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
 
-    print("Starting scraper...")
-    print(f"Using {MAX_WORKERS} parallel workers for detail page scraping")
+    print(f"Scraping department '{department['name']}' from {base_department_url}")
     print(f"Results will be saved incrementally to {output_filename}")
 
     all_product_summaries = []
@@ -337,15 +338,49 @@ if __name__ == '__main__':
             print("--- Delaying between batches ---")
             time.sleep(2)
 
+    try:
+        final_data = load_checkpoint(output_filename)
+        write_catalog(final_data, department['catalog_dir'])
+        print(f"\nTotal {len(final_data)} products scraped and saved to '{department['catalog_dir']}'")
+    except Exception as e:
+        print(f"Error writing the catalog: {e}")
+
+def select_departments(args):
+    """Departments named on the command line as name or name=url, or every configured one.
+    Departments given with a URL are saved to the departments file for ingest."""
+    configured = {department["name"]: department for department in load_departments()}
+    if not args:
+        return list(configured.values())
+    added = False
+    for arg in args:
+        name, _, url = arg.partition("=")
+        if url:
+            configured[name] = {**configured.get(name, {}), "name": name, "url": url}
+            added = True
+        elif name not in configured:
+            print(f"Unknown department '{name}'. Pass it as {name}=<department listing url>.")
+            sys.exit(1)
+    if added:
+        print(f"Saved departments to {save_departments(configured.values())}")
+        configured = {department["name"]: department for department in load_departments()}
+    return [configured[arg.partition("=")[0]] for arg in args]
+
+if __name__ == '__main__':
+    # python scrape_cheese.py [department | department=url ...]
+    common_headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    }
+
+    departments = select_departments(sys.argv[1:])
+    print("Starting scraper...")
+    print(f"Using {MAX_WORKERS} parallel workers for detail page scraping")
+    print(f"Departments: {', '.join(department['name'] for department in departments)}")
+
+    for department in departments:
+        scrape_department(department)
+
     try:
         if hasattr(thread_local, "driver"):
             thread_local.driver.quit()
     except:
         pass
-
-    try:
-        with open(output_filename, 'r', encoding='utf-8') as f:
-            final_data = json.load(f)
-            print(f"\nTotal {len(final_data)} products scraped and saved to '{output_filename}'")
-    except Exception as e:
-        print(f"Error reading final count: {e}")
\ No newline at end of file
@@ -0,0 +1,457 @@
+import os
+import json
+import math
+import time
+import shutil
+
+import numpy as np
+
+from search.artifacts import ARTIFACTS_DIR, get_artifact_path
+
+# IVF (inverted file) index over the llama-text-embed-v2 passage vectors, scored by dot product like
+# the Pinecone index. Vectors are clustered with k-means and stored list by list, so a query only
+# scores the lists whose centroids are nearest to it. Layout of the artifact directory:
+#   manifest.json      dimension, list count, vector count
+#   centroids.npy      float32 (lists, dimension)
+#   list_offsets.npy   int64 (lists + 1); list i is rows list_offsets[i]:list_offsets[i + 1]
+#   vectors.npy        float32 (vectors, dimension), memory-mapped on load
+#   codes.npy          int8 copy of vectors.npy, with scales.npy (float32 per vector), when quantized
+#   ids.npy            product ids in the same row order
+#   delta.npz          vectors added and ids deleted since the lists were last written
+ANN_INDEX_DIR = "ann_index"
+DELTA_FILE = "delta.npz"
+FORMAT_VERSION = 1
+ANN_NPROBE = int(os.environ.get("CHEESEBOT_ANN_NPROBE", "0"))  # 0: default_nprobe of the index's list count
+NPROBE_PER_SQRT_LIST = 2
+MIN_NPROBE = 8
+# A filtered search scores just its passing rows, exactly, unless they outnumber the rows its probe
+# would score by more than this; exact is preferred at a comparable cost since it loses no recall
+FILTERED_EXACT_FACTOR = 2
+# "int8" scores candidates on 1-byte codes and rescores the best RESCORE_FACTOR * k in float32;
+# "none" scores the float32 vectors directly. Stored per index, so this only applies to new builds.
+ANN_QUANTIZATION = os.environ.get("CHEESEBOT_ANN_QUANTIZATION", "int8")
+QUANTIZATIONS = ("none", "int8")
+RESCORE_FACTOR = 4
+SCORE_CHUNK_ROWS = 128  # int8 rows widened to float32 per step, so the temporary stays in cache
+KMEANS_ITERATIONS = 10
+TRAINING_POINTS_PER_LIST = 40
+MIN_LIST_SIZE = 8
+ASSIGN_BATCH_SIZE = 4096
+# Inserts and deletes are kept in a brute-force delta until they reach this share of the index
+COMPACT_FRACTION = 0.1
+
+_index = None
+
+
+def default_list_count(count):
+    """About 4 * sqrt(n) lists, but never lists smaller than MIN_LIST_SIZE on average."""
+    return max(1, min(int(4 * math.sqrt(count)), count // MIN_LIST_SIZE))
+
+
+def default_nprobe(nlist):
+    """Lists probed per query: 2 * sqrt(lists), so recall holds as the index grows while the share of
+    the index scored still shrinks."""
+    return min(nlist, max(MIN_NPROBE, math.ceil(NPROBE_PER_SQRT_LIST * math.sqrt(nlist))))
+
+
+def _as_matrix(vectors):
+    return np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+
+
+def _nearest_lists(vectors, centroids):
+    """Index of the nearest centroid (squared L2) for every vector, in batches to bound memory."""
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+        batch = np.asarray(vectors[start:start + ASSIGN_BATCH_SIZE], dtype=np.float32)
+        assignment[start:start + len(batch)] = np.argmax(batch @ centroids.T - half_norms, axis=1)
+    return assignment
+
+
+def train_centroids(vectors, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """k-means centroids from a sample of TRAINING_POINTS_PER_LIST vectors per list."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * TRAINING_POINTS_PER_LIST)
+    sample = _as_matrix(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest_lists(sample, centroids)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=nlist)
+        filled = counts > 0
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        centroids[filled] = np.add.reduceat(sample[order], starts, axis=0) / counts[filled, None]
+        # An empty list takes over a random training point instead of staying unused
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return centroids
+
+
+def quantize_int8(vectors):
+    """Symmetric per-vector int8 codes: vector ~= code * scale. Returns (codes, scales)."""
+    codes = np.empty(vectors.shape, dtype=np.int8)
+    scales = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+        batch = np.asarray(vectors[start:start + ASSIGN_BATCH_SIZE], dtype=np.float32)
+        batch_scales = np.abs(batch).max(axis=1) / 127
+        batch_scales[batch_scales == 0] = 1
+        codes[start:start + len(batch)] = np.rint(batch / batch_scales[:, None])
+        scales[start:start + len(batch)] = batch_scales
+    return codes, scales
+
+
+class IvfIndex:
+    """Dot-product IVF index with an in-memory delta for inserts and tombstones for deletes."""
+
+    def __init__(self, centroids, list_offsets, vectors, ids, directory=None, quantization="none",
+                 codes=None, scales=None):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown ANN quantization '{quantization}', expected one of {QUANTIZATIONS}")
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.vectors = vectors
+        self.ids = ids
+        self.directory = directory
+        self.quantization = quantization
+        if quantization == "int8" and codes is None:
+            codes, scales = quantize_int8(vectors)
+        self.codes = codes
+        self.scales = scales
+        self._vector_file = None  # read with pread for rescoring, so float32 pages are never mapped
+        self._half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+        self._row_by_id = None
+        self._listed_ids = None
+        self._listed_positions = None  # (row_by_id, list row -> row of that table) of the last row mask
+        self._deleted = set()  # ids removed from the written lists
+        self._deleted_rows = np.zeros(len(ids), dtype=np.bool_)
+        self._delta_ids = []
+        self._delta_vectors = np.empty((0, centroids.shape[1]), dtype=np.float32)
+
+    @classmethod
+    def build(cls, ids, vectors, nlist=None, seed=0, quantization=ANN_QUANTIZATION):
+        vectors = _as_matrix(vectors)
+        nlist = min(nlist or default_list_count(len(vectors)), len(vectors))
+        centroids = train_centroids(vectors, nlist, seed=seed)
+        return cls._from_assignment(centroids, ids, vectors, _nearest_lists(vectors, centroids), quantization)
+
+    @classmethod
+    def _from_assignment(cls, centroids, ids, vectors, assignment, quantization):
+        order = np.argsort(assignment, kind="stable")
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=list_offsets[1:])
+        return cls(centroids, list_offsets, vectors[order], np.asarray(ids, dtype=str)[order],
+                   quantization=quantization)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "manifest.json"), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported ANN index version {manifest.get('version')} in {directory}")
+        quantization = manifest.get("quantization", "none")
+        quantized = quantization != "none"
+        ann = cls(
+            np.load(os.path.join(directory, "centroids.npy")),
+            np.load(os.path.join(directory, "list_offsets.npy")),
+            np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r"),
+            np.load(os.path.join(directory, "ids.npy"), mmap_mode="r"),
+            directory,
+            quantization,
+            np.load(os.path.join(directory, "codes.npy"), mmap_mode="r") if quantized else None,
+            np.load(os.path.join(directory, "scales.npy")) if quantized else None
+        )
+        if quantized and hasattr(os, "pread"):
+            ann._vector_file = os.open(os.path.join(directory, "vectors.npy"), os.O_RDONLY)
+        delta_path = os.path.join(directory, DELTA_FILE)
+        if os.path.exists(delta_path):
+            with np.load(delta_path) as delta:
+                ann._delta_ids = delta["ids"].tolist()
+                ann._delta_vectors = delta["vectors"]
+                ann._mark_deleted(delta["deleted"].tolist())
+        return ann
+
+    @property
+    def dimension(self):
+        return self.centroids.shape[1]
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.ids) - len(self._deleted) + len(self._delta_ids)
+
+    def delta_size(self):
+        """Inserts and deletes not yet folded into the lists."""
+        return len(self._deleted) + len(self._delta_ids)
+
+    def _rows(self):
+        if self._row_by_id is None:
+            self._row_by_id = {product_id: row for row, product_id in enumerate(self._ids_in_row_order())}
+        return self._row_by_id
+
+    def _ids_in_row_order(self):
+        if self._listed_ids is None:
+            self._listed_ids = self.ids.tolist()
+        return self._listed_ids
+
+    def _mark_deleted(self, ids):
+        rows = self._rows()
+        for product_id in ids:
+            row = rows.get(product_id)
+            if row is not None:
+                self._deleted.add(product_id)
+                self._deleted_rows[row] = True
+
+    def remove(self, ids):
+        """Deletes products; unknown ids are ignored."""
+        ids = set(ids)
+        keep = [position for position, product_id in enumerate(self._delta_ids) if product_id not in ids]
+        if len(keep) != len(self._delta_ids):
+            self._delta_ids = [self._delta_ids[position] for position in keep]
+            self._delta_vectors = self._delta_vectors[keep]
+        self._mark_deleted(ids)
+
+    def add(self, ids, vectors):
+        """Inserts products, replacing any existing vector with the same id."""
+        ids = [str(product_id) for product_id in ids]
+        vectors = _as_matrix(vectors)
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dim vectors, got {vectors.shape[1]}")
+        self.remove(ids)
+        self._delta_ids.extend(ids)
+        self._delta_vectors = np.concatenate((self._delta_vectors, vectors))
+
+    def _score_list(self, start, end, query):
+        if self.codes is None:
+            return self.vectors[start:end] @ query
+        scores = np.empty(end - start, dtype=np.float32)
+        for chunk in range(start, end, SCORE_CHUNK_ROWS):
+            stop = min(chunk + SCORE_CHUNK_ROWS, end)
+            scores[chunk - start:stop - start] = self.codes[chunk:stop].astype(np.float32) @ query
+        return scores * self.scales[start:end]
+
+    def _score_rows(self, rows, query):
+        """Scores of scattered list rows, e.g. the rows passing a filter."""
+        if self.codes is None:
+            return np.asarray(self.vectors[rows]) @ query
+        scores = np.empty(len(rows), dtype=np.float32)
+        for chunk in range(0, len(rows), SCORE_CHUNK_ROWS):
+            batch = rows[chunk:chunk + SCORE_CHUNK_ROWS]
+            scores[chunk:chunk + len(batch)] = self.codes[batch].astype(np.float32) @ query
+        return scores * self.scales[rows]
+
+    def _float_rows(self, rows):
+        if self._vector_file is None:
+            return np.asarray(self.vectors[rows])
+        row_bytes = self.dimension * 4
+        offset = self.vectors.offset
+        data = b"".join(os.pread(self._vector_file, row_bytes, offset + row * row_bytes) for row in rows.tolist())
+        return np.frombuffer(data, dtype=np.float32).reshape(len(rows), self.dimension)
+
+    def _rescore(self, rows, scores, query, k):
+        """Top k of the candidates after replacing int8 scores of list rows with float32 ones."""
+        if self.codes is not None:
+            listed = np.flatnonzero(rows < len(self.ids))
+            order = listed[np.argsort(rows[listed])]  # ascending rows read the file in order
+            scores = scores.copy()
+            scores[order] = self._float_rows(rows[order]) @ query
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(self._id_at(int(rows[i])), float(scores[i])) for i in top]
+
+    def _positions_in(self, row_by_id):
+        """Row in another table (-1 when absent) of every list row and then every delta row."""
+        if self._listed_positions is None or self._listed_positions[0] is not row_by_id:
+            listed = np.fromiter((row_by_id.get(product_id, -1) for product_id in self._ids_in_row_order()),
+                                 dtype=np.int64, count=len(self.ids))
+            self._listed_positions = (row_by_id, listed)
+        delta = np.fromiter((row_by_id.get(product_id, -1) for product_id in self._delta_ids),
+                            dtype=np.int64, count=len(self._delta_ids))
+        return np.concatenate((self._listed_positions[1], delta))
+
+    def accept_mask(self, accept):
+        """Live rows passing accept, list rows first and then the delta, as one boolean array.
+
+        accept is a predicate on product ids, or a (row_mask, row_by_id) pair: a boolean mask over the
+        rows of another table, e.g. the metadata store, with that table's id -> row mapping.
+        """
+        if isinstance(accept, tuple):
+            row_mask, row_by_id = accept
+            positions = self._positions_in(row_by_id)
+            mask = (positions >= 0) & row_mask[positions] if len(row_mask) else np.zeros(len(positions), np.bool_)
+            mask[:len(self.ids)] &= ~self._deleted_rows
+            return mask
+        listed = np.fromiter(map(accept, self._ids_in_row_order()), dtype=np.bool_, count=len(self.ids))
+        delta = np.fromiter(map(accept, self._delta_ids), dtype=np.bool_, count=len(self._delta_ids))
+        return np.concatenate((listed & ~self._deleted_rows, delta))
+
+    def _top(self, rows, scores, query, k, limit):
+        top = np.argpartition(-scores, limit)[:limit] if len(scores) > limit else slice(None)
+        return self._rescore(rows[top], scores[top], query, k)
+
+    def search(self, query, k=10, nprobe=None, accept=None):
+        """Top k (id, score) pairs by dot product.
+
+        Probes the nprobe nearest lists (default_nprobe when not given) plus the delta. With accept (see
+        accept_mask; e.g. a metadata filter) a row mask is built once and applied to the
+        scores, and nprobe grows in proportion to how few rows pass; unless far more rows pass than that
+        probe would score, only the passing rows are scored, exactly. Quantized indexes
+        pick RESCORE_FACTOR * k candidates on int8 scores and rank them on the float32 vectors.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        limit = k if self.codes is None else k * RESCORE_FACTOR
+        requested_nprobe = max(1, min(nprobe or default_nprobe(self.nlist), self.nlist))
+        mask = None
+        nprobe = requested_nprobe
+        if accept is not None:
+            mask = self.accept_mask(accept)
+            passing = np.flatnonzero(mask)
+            nprobe = min(self.nlist, math.ceil(requested_nprobe * len(mask) / max(len(passing), 1)))
+            if len(passing) <= FILTERED_EXACT_FACTOR * nprobe * len(self.ids) / self.nlist:
+                listed = passing[passing < len(self.ids)]
+                scores = np.concatenate((self._score_rows(listed, query),
+                                         self._delta_vectors[passing[len(listed):] - len(self.ids)] @ query))
+                return self._top(passing, scores, query, k, limit)
+
+        list_order = np.argsort(self._half_norms - self.centroids @ query)
+        delta_rows = np.arange(len(self._delta_ids)) + len(self.ids)
+        delta_scores = self._delta_vectors @ query
+        if mask is not None:
+            delta_keep = mask[len(self.ids):]
+            delta_rows, delta_scores = delta_rows[delta_keep], delta_scores[delta_keep]
+        rows = [delta_rows]
+        scores = [delta_scores]
+        probed = 0
+        while True:
+            for list_id in list_order[probed:nprobe]:
+                start, end = int(self.list_offsets[list_id]), int(self.list_offsets[list_id + 1])
+                keep = ~self._deleted_rows[start:end] if mask is None else mask[start:end]
+                rows.append(np.arange(start, end)[keep])
+                scores.append(self._score_list(start, end, query)[keep])
+            probed = nprobe
+            all_rows = np.concatenate(rows)
+            all_scores = np.concatenate(scores)
+            if len(all_scores) >= limit or probed >= self.nlist:
+                return self._top(all_rows, all_scores, query, k, limit)
+            nprobe = min(self.nlist, nprobe * 2)
+
+    def exact_search(self, query, k=10, accept=None):
+        """Brute-force search over every list, for recall measurements."""
+        return self.search(query, k, nprobe=self.nlist, accept=accept)
+
+    def _id_at(self, row):
+        return str(self.ids[row]) if row < len(self.ids) else self._delta_ids[row - len(self.ids)]
+
+    def compact(self, retrain=False):
+        """Folds the delta into the lists. Centroids are kept unless retrain is set or the index has
+        grown or shrunk enough that the list count no longer fits."""
+        live = np.flatnonzero(~self._deleted_rows)
+        ids = np.concatenate((np.asarray(self.ids)[live].astype(str), np.asarray(self._delta_ids, dtype=str)))
+        vectors = np.concatenate((np.asarray(self.vectors)[live], self._delta_vectors))
+        if not len(ids):
+            raise ValueError("Cannot compact an empty ANN index")
+        wanted = default_list_count(len(ids))
+        if retrain or not wanted / 2 <= self.nlist <= wanted * 2:
+            return IvfIndex.build(ids, vectors, wanted, quantization=self.quantization)
+        return IvfIndex._from_assignment(
+            self.centroids, ids, vectors, _nearest_lists(vectors, self.centroids), self.quantization
+        )
+
+    def save(self, directory):
+        """Writes the lists when they changed (atomic directory swap), otherwise only the delta."""
+        if self.directory != directory:
+            tmp_directory = directory.rstrip(os.sep) + ".tmp"
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            os.makedirs(tmp_directory)
+            np.save(os.path.join(tmp_directory, "centroids.npy"), self.centroids)
+            np.save(os.path.join(tmp_directory, "list_offsets.npy"), self.list_offsets)
+            np.save(os.path.join(tmp_directory, "vectors.npy"), np.asarray(self.vectors))
+            np.save(os.path.join(tmp_directory, "ids.npy"), np.asarray(self.ids))
+            if self.codes is not None:
+                np.save(os.path.join(tmp_directory, "codes.npy"), np.asarray(self.codes))
+                np.save(os.path.join(tmp_directory, "scales.npy"), self.scales)
+            self._save_delta(tmp_directory)
+            manifest = {"version": FORMAT_VERSION, "dimension": self.dimension, "lists": self.nlist,
+                        "vectors": len(self.ids), "quantization": self.quantization}
+            with open(os.path.join(tmp_directory, "manifest.json"), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            old_directory = directory.rstrip(os.sep) + ".old"
+            shutil.rmtree(old_directory, ignore_errors=True)
+            if os.path.exists(directory):
+                os.replace(directory, old_directory)  # open memory maps of the old files stay valid
+            os.replace(tmp_directory, directory)
+            shutil.rmtree(old_directory, ignore_errors=True)
+            self.directory = directory
+        else:
+            self._save_delta(directory)
+        return directory
+
+    def _save_delta(self, directory):
+        tmp_path = os.path.join(directory, DELTA_FILE + ".tmp.npz")
+        np.savez(tmp_path, ids=np.asarray(self._delta_ids, dtype=str), vectors=self._delta_vectors,
+                 deleted=np.asarray(sorted(self._deleted), dtype=str))
+        os.replace(tmp_path, os.path.join(directory, DELTA_FILE))
+
+
+def open_ann_index(directory=None):
+    """The saved index, or None when it has not been built yet or cannot be read."""
+    directory = directory or get_artifact_path(ANN_INDEX_DIR)
+    if not os.path.exists(os.path.join(directory, "manifest.json")):
+        print(f"Warning: ANN index not found at {directory}. Run ingest to build it.")
+        return None
+    try:
+        return IvfIndex.load(directory)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not load ANN index {directory}: {e}")
+        return None
+
+
+def sync_ann_index(ids, vectors, changed_ids=()):
+    """Brings the saved index in line with an ingest: removes products that are gone, upserts new and
+    changed ones, and compacts once the delta outgrows COMPACT_FRACTION. Builds from scratch when
+    there is no usable index. Returns the index, not yet saved."""
+    ids = [str(product_id) for product_id in ids]
+    vectors = _as_matrix(vectors)
+    ann = open_ann_index() if os.path.exists(get_artifact_path(ANN_INDEX_DIR)) else None
+    if ann is None or ann.dimension != vectors.shape[1] or ann.quantization != ANN_QUANTIZATION:
+        start = time.perf_counter()
+        ann = IvfIndex.build(ids, vectors)
+        print(f"INFO: Built ANN index with {len(ann)} vectors in {ann.nlist} lists ({ann.quantization} "
+              f"quantization) in {time.perf_counter() - start:.1f} s.")
+        return ann
+    current = set(ids)
+    changed = set(changed_ids)
+    known = (set(ann._rows()) - ann._deleted) | set(ann._delta_ids)
+    ann.remove(known - current)
+    upserts = [position for position, product_id in enumerate(ids) if product_id in changed or product_id not in known]
+    if upserts:
+        ann.add([ids[position] for position in upserts], vectors[upserts])
+    print(f"INFO: ANN index updated in place: {len(upserts)} upserted, {ann.delta_size()} pending changes.")
+    if ann.delta_size() > COMPACT_FRACTION * max(len(ann), 1):
+        ann = ann.compact()
+        print(f"INFO: Compacted ANN index to {len(ann)} vectors in {ann.nlist} lists.")
+    return ann
+
+
+def save_ann_index(ann):
+    os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+    return ann.save(get_artifact_path(ANN_INDEX_DIR))
+
+
+def load_ann_index():
+    """Memory-maps the saved ANN index. Returns True when it is available."""
+    global _index
+    _index = open_ann_index()
+    return _index is not None
+
+
+def is_ann_index_loaded():
+    return _index is not None
+
+
+def ann_search(query, k=10, accept=None, nprobe=ANN_NPROBE):
+    """(id, score) pairs from the loaded index; empty when none is loaded."""
+    if _index is None:
+        return []
+    return _index.search(query, k, nprobe or None, accept)
@@ -0,0 +1,37 @@
+import os
+import json
+
+ARTIFACTS_DIR = os.environ.get(
+    "CHEESEBOT_ARTIFACTS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "artifacts")
+)
+
+
+def get_artifact_path(filename):
+    """Returns the absolute path of a local artifact written by ingest."""
+    return os.path.join(ARTIFACTS_DIR, filename)
+
+
+def save_json_artifact(filename, data):
+    """Writes a compact JSON artifact into the artifacts directory."""
+    os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+    path = get_artifact_path(filename)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_json_artifact(filename):
+    """Loads a JSON artifact. Returns None when it has not been built yet."""
+    path = get_artifact_path(filename)
+    if not os.path.exists(path):
+        print(f"Warning: Artifact {filename} not found at {path}. Run ingest to build it.")
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        print(f"Warning: Could not decode artifact {path}")
+        return None
@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import asyncio
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search import hybrid_search_test as engine
+from search.departments import route_namespaces
+from search.llm_gateway import chat_completion_async, stream_chat_completion_async
+from search.metadata_store import hydrate_matches, is_metadata_store_loaded
+from search.model_router import LARGE_MODEL, PLAN_MODEL, response_model
+from search.tracing import payload_bytes, span, trace_turn, usage_attributes
+
+INDEX_NAME = "cheese-chatbot"
+
+openai_client = None
+pc = None
+index = None
+_backends_initialized = False
+
+
+async def initialize_async_clients():
+    """Creates pooled async OpenAI/Pinecone clients once per process. Returns True on success."""
+    global openai_client, pc, index, _backends_initialized
+
+    if _backends_initialized:
+        return True
+    if not engine.PINECONE_API_KEY or not engine.OPENAI_API_KEY:
+        print("ERROR: PINECONE_API_KEY and OPENAI_API_KEY must be set for the async pipeline.")
+        return False
+
+    try:
+        from openai import AsyncOpenAI
+        from pinecone import PineconeAsyncio
+
+        openai_client = AsyncOpenAI(api_key=engine.OPENAI_API_KEY, max_retries=0)  # llm_gateway retries
+        pc = PineconeAsyncio(api_key=engine.PINECONE_API_KEY)
+        description = await pc.describe_index(INDEX_NAME)
+        index = pc.IndexAsyncio(host=description.host)
+        await asyncio.to_thread(engine.load_local_artifacts)
+        _backends_initialized = True
+        print("INFO: Async OpenAI and Pinecone clients initialized successfully.")
+        return True
+    except Exception as e:
+        print(f"ERROR: Failed to initialize async clients: {e}")
+        return False
+
+
+def set_backends(openai_backend, pinecone_backend, index_backend):
+    """Installs already-built async backends, e.g. local stubs for load testing."""
+    global openai_client, pc, index, _backends_initialized
+    openai_client = openai_backend
+    pc = pinecone_backend
+    index = index_backend
+    _backends_initialized = True
+
+
+async def close_async_clients():
+    global _backends_initialized
+    for client in (index, pc, openai_client):
+        close = getattr(client, "close", None)
+        if close is not None:
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+    _backends_initialized = False
+
+
+async def generate_search_query_async(user_input: str, model=PLAN_MODEL, context: str = ""):
+    messages = engine.build_search_query_messages(user_input, context)
+    if messages is None:
+        return None
+    with span("plan", model=model, request_bytes=payload_bytes(messages)) as stage:
+        response = await chat_completion_async(
+            openai_client,
+            model=model,
+            messages=messages,
+            response_format={"type": "json_object"}
+        )
+        stage.set(response_bytes=payload_bytes(response.choices[0].message.content), **usage_attributes(response))
+    return response.choices[0].message.content
+
+
+async def _embed_async(stage_name, model, vector_queries):
+    with span(stage_name, inputs=len(vector_queries), request_bytes=payload_bytes(vector_queries)):
+        return await pc.inference.embed(
+            model=model,
+            inputs=vector_queries,
+            parameters={"input_type": "query", "truncate": "END"}
+        )
+
+
+async def _skipped_embed(count):
+    return SimpleNamespace(data=[None] * count)
+
+
+async def embed_queries_async(vector_queries, alpha=None):
+    """Dense and sparse embeddings requested concurrently; a side with zero weight is not requested."""
+    dense_query_embedding, sparse_query_embedding = await asyncio.gather(
+        _embed_async("embed_dense", "llama-text-embed-v2", vector_queries)
+        if alpha is None or alpha > 0 else _skipped_embed(len(vector_queries)),
+        _embed_async("embed_sparse", "pinecone-sparse-english-v0", vector_queries)
+        if alpha is None or alpha < 1 else _skipped_embed(len(vector_queries))
+    )
+    return [
+        (dense['values'] if dense else None,
+         {'indices': sparse['sparse_indices'], 'values': sparse['sparse_values']} if sparse else None)
+        for dense, sparse in zip(dense_query_embedding.data, sparse_query_embedding.data)
+    ]
+
+
+async def query_namespaces_async(query_kwargs, namespaces):
+    """Queries every namespace concurrently and merges the matches by score."""
+    responses = await asyncio.gather(*(index.query(**dict(query_kwargs, namespace=namespace)) for namespace in namespaces))
+    matches = [match for response in responses for match in response.matches]
+    if len(namespaces) > 1:
+        matches.sort(key=lambda match: match.score, reverse=True)
+    return matches[:query_kwargs["top_k"]]
+
+
+async def search_with_vectors_async(dense_vector, sparse_vector, metadata_filters, top_k=5, alpha=engine.DEFAULT_ALPHA,
+                                    vector_query=""):
+    filter_dict = engine.compile_filters(metadata_filters)
+    # Local index scans and store reads run on worker threads so they do not stall the event loop
+    if engine.use_local_retrieval() and dense_vector is not None:
+        return await asyncio.to_thread(engine.local_query, dense_vector, filter_dict)
+    dense_vector, sparse_vector = engine.scale_hybrid_vectors(dense_vector, sparse_vector, alpha)
+    namespaces = route_namespaces(filter_dict, vector_query)
+
+    if engine.use_adaptive_retrieval():
+        fetch_plan = await asyncio.to_thread(engine.plan_adaptive_fetch, filter_dict)
+        if fetch_plan is None:
+            return []
+        with span("index_query", top_k=fetch_plan[0], include_metadata=False, namespaces=len(namespaces)) as stage:
+            matches = await query_namespaces_async(
+                engine.adaptive_query_kwargs(dense_vector, sparse_vector, *fetch_plan), namespaces
+            )
+            stage.set(matches=len(matches), response_bytes=engine.matches_payload_bytes(matches))
+        with span("hydrate", matches=len(matches)):
+            return engine.select_adaptive_results(matches, filter_dict)
+
+    query_kwargs = engine.standard_query_kwargs(dense_vector, sparse_vector, filter_dict, top_k)
+    with span("index_query", top_k=top_k, include_metadata=query_kwargs["include_metadata"],
+              namespaces=len(namespaces)) as stage:
+        matches = await query_namespaces_async(query_kwargs, namespaces)
+        stage.set(matches=len(matches), response_bytes=engine.matches_payload_bytes(matches))
+    if not is_metadata_store_loaded():
+        return matches
+
+    with span("hydrate", matches=len(matches)):
+        hydrated, missing_ids = hydrate_matches(matches)
+        if missing_ids:
+            fetched = {}
+            for namespace in namespaces:
+                fetched.update((await index.fetch(ids=missing_ids, namespace=namespace)).vectors)
+            return engine.merge_fetched_metadata(hydrated, fetched)
+        return hydrated
+
+
+async def perform_hybrid_search_async(search_params):
+    search_params = json.loads(search_params)
+    vector_query = search_params.get("vector_query", "")
+    metadata_filters = search_params.get("metadata_filters", {})
+    top_k = search_params.get("top_k", 5)
+    alpha = engine.choose_alpha(search_params)
+
+    dense_vector, sparse_vector = (await embed_queries_async([vector_query], alpha))[0]
+    return await search_with_vectors_async(dense_vector, sparse_vector, metadata_filters, top_k, alpha, vector_query)
+
+
+async def generate_response_async(user_query, search_results, search_params, history, model=LARGE_MODEL):
+    # The lookup and store may hit the SQLite shared store
+    cache_key, cached = await asyncio.to_thread(engine.cached_response_lookup, search_results, search_params, history, model)
+    if cached is not None:
+        return cached
+
+    messages = engine.build_response_messages(user_query, search_results, search_params, history)
+    with span("response", model=model, request_bytes=payload_bytes(messages)) as stage:
+        response = await chat_completion_async(
+            openai_client,
+            model=model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=800
+        )
+        stage.set(response_bytes=payload_bytes(response.choices[0].message.content), **usage_attributes(response))
+    await asyncio.to_thread(engine.store_response, cache_key, search_results, response.choices[0].message.content, stage)
+    return response.choices[0].message.content
+
+
+async def stream_response_async(user_query, search_results, search_params, history, model=LARGE_MODEL, stage=None):
+    """Yields answer text deltas as the model produces them.
+
+    The caller owns the "response" span; pass it as stage to record the request size and token usage.
+    """
+    messages = engine.build_response_messages(user_query, search_results, search_params, history)
+    if stage is not None:
+        stage.set(request_bytes=payload_bytes(messages))
+    stream = stream_chat_completion_async(
+        openai_client,
+        model=model,
+        messages=messages,
+        temperature=0.7,
+        max_tokens=800,
+        stream_options={"include_usage": True}
+    )
+    try:
+        async for chunk in stream:
+            if stage is not None and getattr(chunk, "usage", None) is not None:
+                stage.set(**usage_attributes(chunk))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.aclose()  # frees the gateway slot now rather than when the generator is collected
+
+
+async def retrieve_async(corrected_query: str, conversation=None):
+    """Plan and retrieve for an already spell-corrected query. Returns (search_params, search_results)."""
+    search_params, context = engine.reuse_plan(corrected_query, conversation)
+    if search_params is None:
+        search_params = await generate_search_query_async(corrected_query, context=context)
+    if search_params is None:
+        raise ValueError("Could not generate a search plan for this query.")
+    search_results = await perform_hybrid_search_async(search_params)
+    return search_params, search_results
+
+
+async def product_search_bot_async(user_query: str, history: str, conversation=None, web_future=None):
+    """Async counterpart of product_search_bot with the same steps and return shape."""
+    if not _backends_initialized and not await initialize_async_clients():
+        return {
+            "success": False,
+            "response": "Critical Error: Failed to initialize API clients. Please check server logs or .env configuration.",
+            "query_interpretation": None, "results": [], "result_count": 0
+        }
+
+    answer, history = await asyncio.to_thread(engine.begin_turn, user_query, history, conversation)
+    if answer is not None:
+        return answer
+
+    with trace_turn() as trace:
+        corrected_query, route = engine.correct_turn(user_query)
+        search_params, search_results = await retrieve_async(corrected_query, conversation)
+        web_result = None
+        if web_future is not None:
+            history, web_result = await asyncio.to_thread(engine.add_web_context, history, web_future)
+        response_text = await generate_response_async(user_query, search_results, search_params, history,
+                                                      response_model(route))
+    return engine.turn_result(trace, user_query, corrected_query, route, search_params, search_results,
+                              response_text, conversation, web_result)
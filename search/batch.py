@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search import hybrid_search_test as engine
+from search.llm_gateway import BATCH, chat_completion, llm_gateway_metrics
+from search.model_router import PLAN_MODEL, classify_turn, response_model
+
+BATCH_PLAN_SIZE = 10  # queries planned per LLM call
+EMBED_BATCH_SIZE = 96  # Pinecone inference accepts at most 96 inputs per request
+MAX_WORKERS = 8
+
+
+def _plan_chunk(user_inputs, search_prompt):
+    """Plans several queries with one JSON-mode call. Falls back to one call per query on a mismatch."""
+    numbered = "\n".join(f'{i + 1}. "{query}"' for i, query in enumerate(user_inputs))
+    prompt = f"""
+    Based on each of these {len(user_inputs)} user queries:
+    {numbered}
+    {search_prompt}
+
+    Return a JSON object {{"plans": [...]}} with exactly one such object per query, in the same order.
+    """
+    response = chat_completion(
+        engine.openai, BATCH,
+        model=PLAN_MODEL,
+        messages=[
+            {"role": "system", "content": "You are a search query optimization assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        response_format={"type": "json_object"}
+    )
+    try:
+        plans = json.loads(response.choices[0].message.content).get("plans", [])
+    except (json.JSONDecodeError, AttributeError):
+        plans = []
+    if len(plans) != len(user_inputs) or not all(isinstance(plan, dict) for plan in plans):
+        print(f"Warning: Batched plan returned {len(plans)} plans for {len(user_inputs)} queries; planning individually.")
+        return [engine.generate_search_query(query, BATCH) for query in user_inputs]
+    return [json.dumps(plan) for plan in plans]
+
+
+def generate_search_queries(user_inputs: list, max_workers: int = MAX_WORKERS):
+    """Batched counterpart of generate_search_query. Returns one JSON plan string per input."""
+    search_prompt = engine.load_prompt("system.txt")
+    chunks = [user_inputs[i:i + BATCH_PLAN_SIZE] for i in range(0, len(user_inputs), BATCH_PLAN_SIZE)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        planned = list(executor.map(lambda chunk: _plan_chunk(chunk, search_prompt), chunks))
+    return [plan for chunk_plans in planned for plan in chunk_plans]
+
+
+def _embed_all(vector_queries, alphas):
+    vectors = []
+    for i in range(0, len(vector_queries), EMBED_BATCH_SIZE):
+        chunk_alphas = alphas[i:i + EMBED_BATCH_SIZE]
+        # A model is skipped only when no query in the chunk needs it
+        alpha = 0.0 if max(chunk_alphas) <= 0 else (1.0 if min(chunk_alphas) >= 1 else None)
+        vectors.extend(engine.embed_queries(vector_queries[i:i + EMBED_BATCH_SIZE], alpha))
+    return vectors
+
+
+def product_search_batch(user_queries: list, histories: list = None, max_workers: int = MAX_WORKERS):
+    """Runs N queries through the pipeline with batched planning/embedding and concurrent queries/responses.
+
+    Returns results in input order, each shaped like product_search_bot's output plus per-stage
+    "timings" in seconds, along with total wall time and throughput in queries/sec.
+    """
+    if not engine._clients_initialized and not engine.initialize_clients():
+        raise ConnectionError("Clients not initialized. Check server logs or .env configuration.")
+    histories = histories or [""] * len(user_queries)
+    batch_start = time.perf_counter()
+
+    stage_start = time.perf_counter()
+    plans = generate_search_queries(user_queries, max_workers)
+    plan_seconds = time.perf_counter() - stage_start
+
+    parsed_plans = []
+    for plan in plans:
+        try:
+            parsed_plans.append(json.loads(plan) if plan else {})
+        except json.JSONDecodeError:
+            parsed_plans.append({})
+
+    stage_start = time.perf_counter()
+    alphas = [engine.choose_alpha(plan) for plan in parsed_plans]
+    vectors = _embed_all([plan.get("vector_query", "") or query for plan, query in zip(parsed_plans, user_queries)], alphas)
+    embed_seconds = time.perf_counter() - stage_start
+
+    def run_query(i):
+        start = time.perf_counter()
+        plan = parsed_plans[i]
+        matches = engine.search_with_vectors(
+            vectors[i][0], vectors[i][1], plan.get("metadata_filters", {}), plan.get("top_k", 5), alphas[i],
+            plan.get("vector_query", "") or user_queries[i]
+        )
+        return matches, time.perf_counter() - start
+
+    def run_response(i, matches):
+        start = time.perf_counter()
+        text = engine.generate_response(user_queries[i], matches, plans[i], histories[i], BATCH,
+                                        response_model(classify_turn(user_queries[i])))
+        finished = time.perf_counter()
+        return text, finished - start, finished
+
+    results = [None] * len(user_queries)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        query_futures = {i: executor.submit(run_query, i) for i in range(len(user_queries))}
+        response_futures = {}
+        # Start each response as soon as its own query finishes
+        for i, future in query_futures.items():
+            try:
+                matches, query_seconds = future.result()
+            except Exception as e:
+                results[i] = {"success": False, "response": f"Search failed: {e}", "query_interpretation": plans[i],
+                              "results": [], "result_count": 0}
+                continue
+            response_futures[i] = (executor.submit(run_response, i, matches), matches, query_seconds)
+
+        for i, (future, matches, query_seconds) in response_futures.items():
+            try:
+                response_text, response_seconds, finished = future.result()
+            except Exception as e:
+                results[i] = {"success": False, "response": f"Response generation failed: {e}",
+                              "query_interpretation": plans[i], "results": [], "result_count": 0}
+                continue
+            formatted_results = engine.format_results(matches)
+            results[i] = {
+                "success": True,
+                "response": response_text,
+                "query_interpretation": plans[i],
+                "results": formatted_results,
+                "result_count": len(formatted_results),
+                "timings": {
+                    "plan": plan_seconds,
+                    "embed": embed_seconds,
+                    "query": query_seconds,
+                    "response": response_seconds,
+                    "total": finished - batch_start,
+                }
+            }
+
+    total_seconds = time.perf_counter() - batch_start
+    return {
+        "results": results,
+        "query_count": len(user_queries),
+        "total_seconds": total_seconds,
+        "queries_per_second": len(user_queries) / total_seconds if total_seconds > 0 else 0.0,
+        "llm_gateway": llm_gateway_metrics(),
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python batch.py <queries.txt> [max_workers]")
+        sys.exit(1)
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_WORKERS
+    batch = product_search_batch(queries, max_workers=workers)
+    for query, result in zip(queries, batch["results"]):
+        timings = result.get("timings", {})
+        print(f"[{timings.get('total', 0):.2f}s] {query} -> {result['result_count']} results")
+    print(f"\n{batch['query_count']} queries in {batch['total_seconds']:.2f}s "
+          f"({batch['queries_per_second']:.2f} queries/sec)")
@@ -0,0 +1,324 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+
+import numpy as np
+
+# Columnar on-disk tables: one .npy file per column (memory-mapped on load) plus manifest.json.
+#   string    utf-8 blob + int64 offsets + validity mask
+#   category  int32 codes into a value list kept in the manifest (-1 = missing)
+#   float     float64, NaN = missing
+#   int       int64 + validity mask
+#   parsed    display strings like "$16.46" or "5 lbs": float64 value + int32 code into format templates
+#   list      list of strings: int64 list offsets + validity mask + a child string column
+#   records   list of flat dicts (e.g. thumbnails): list offsets + validity mask + one child string column per key
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+NUMBER_PATTERN = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CATALOG_DIR = os.path.join(ROOT_DIR, "scraper", "kimelo_cheese_catalog")
+LEGACY_JSON_PATH = os.path.join(ROOT_DIR, "scraper", "kimelo_cheese_detailed_data_all_pages.json")
+
+# Column kinds of the scraped product items written by scraper/scrape_cheese.py
+ITEM_SCHEMA = {
+    "product_detail_url": "string",
+    "image_url": "string",
+    "product_name": "string",
+    "product_code_from_url": "string",
+    "brand": "category",
+    "price": "parsed",
+    "unit_price": "parsed",
+    "status": "category",
+    "product_name_detail": "string",
+    "item_number_from_name": "string",
+    "brand_supplier_detail": "category",
+    "categories": "category",
+    "detail_page_main_image_url": "string",
+    "detail_page_main_image_alt": "string",
+    "detail_page_thumbnail_images": "records",
+    "sku": "string",
+    "upc": "string",
+    "quantity_package_info": "category",
+    "dimensions": "category",
+    "weight": "parsed",
+    "table_caption": "category",
+    "proposition_65_warning": "category",
+    "related_products": "list",
+    "other_like_products": "list",
+}
+
+
+def infer_kind(values):
+    """Column kind for a field missing from the schema, from its first non-missing value."""
+    sample = next((value for value in values if value is not None), None)
+    if isinstance(sample, bool) or isinstance(sample, int):
+        return "int"
+    if isinstance(sample, float):
+        return "float"
+    if isinstance(sample, list):
+        return "records" if any(isinstance(item, dict) for value in values if value for item in value) else "list"
+    return "string"
+
+
+def parse_display_number(text):
+    """(value, format template) for strings like "$3.29/lb"; value is None when there is no number."""
+    match = NUMBER_PATTERN.search(text)
+    escape = lambda part: part.replace("{", "{{").replace("}", "}}")
+    if not match:
+        return None, escape(text)
+    number = match.group(0)
+    decimals = len(number.split(".", 1)[1]) if "." in number else 0
+    spec = ("," if "," in number else "") + f".{decimals}f"
+    template = escape(text[:match.start()]) + "{:" + spec + "}" + escape(text[match.end():])
+    return float(number.replace(",", "")), template
+
+
+def _save(directory, filename, array):
+    np.save(os.path.join(directory, filename), array)
+
+
+def _write_strings(directory, name, values):
+    encoded = [value.encode("utf-8") if value is not None else b"" for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    _save(directory, f"{name}.offsets.npy", offsets)
+    _save(directory, f"{name}.data.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    _save(directory, f"{name}.valid.npy", np.array([value is not None for value in values], dtype=np.bool_))
+
+
+def _write_list_offsets(directory, name, values):
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum([len(value) if value else 0 for value in values], out=offsets[1:])
+    _save(directory, f"{name}.list_offsets.npy", offsets)
+    _save(directory, f"{name}.valid.npy", np.array([value is not None for value in values], dtype=np.bool_))
+
+
+def _as_text(value):
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def _write_column(directory, name, kind, values):
+    """Writes one column and returns its manifest entry."""
+    column = {"kind": kind}
+    if kind == "string":
+        _write_strings(directory, name, [_as_text(value) for value in values])
+    elif kind == "category":
+        dictionary = sorted({_as_text(value) for value in values if value is not None})
+        positions = {value: code for code, value in enumerate(dictionary)}
+        codes = [positions[_as_text(value)] if value is not None else -1 for value in values]
+        _save(directory, f"{name}.codes.npy", np.array(codes, dtype=np.int32))
+        column["values"] = dictionary
+    elif kind == "float":
+        _save(directory, f"{name}.npy", np.array([np.nan if value is None else value for value in values], dtype=np.float64))
+    elif kind == "int":
+        _save(directory, f"{name}.npy", np.array([value or 0 for value in values], dtype=np.int64))
+        _save(directory, f"{name}.valid.npy", np.array([value is not None for value in values], dtype=np.bool_))
+    elif kind == "parsed":
+        templates = []
+        positions = {}
+        numbers = np.full(len(values), np.nan, dtype=np.float64)
+        codes = np.full(len(values), -1, dtype=np.int32)
+        for row, value in enumerate(values):
+            if value is None:
+                continue
+            number, template = parse_display_number(_as_text(value))
+            if template not in positions:
+                positions[template] = len(templates)
+                templates.append(template)
+            codes[row] = positions[template]
+            if number is not None:
+                numbers[row] = number
+        _save(directory, f"{name}.npy", numbers)
+        _save(directory, f"{name}.format.npy", codes)
+        column["formats"] = templates
+    elif kind == "list":
+        _write_list_offsets(directory, name, values)
+        _write_strings(directory, f"{name}.item", [_as_text(item) for value in values if value for item in value])
+    elif kind == "records":
+        _write_list_offsets(directory, name, values)
+        items = [item for value in values if value for item in value]
+        keys = sorted({key for item in items for key in item})
+        for key in keys:
+            _write_strings(directory, f"{name}.{key}", [_as_text(item.get(key)) for item in items])
+        column["keys"] = keys
+    else:
+        raise ValueError(f"Unknown column kind '{kind}' for {name}")
+    return column
+
+
+def write_table(directory, rows, schema):
+    """Writes dict rows as a columnar table; fields outside schema get an inferred kind.
+
+    The table is built next to directory and swapped in, so readers never see a partial write.
+    """
+    fields = list(schema)
+    for row in rows:
+        fields.extend(field for field in row if field not in schema and field not in fields)
+    tmp_directory = directory.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    columns = {}
+    for field in fields:
+        values = [row.get(field) for row in rows]
+        columns[field] = _write_column(tmp_directory, field, schema.get(field) or infer_kind(values), values)
+    manifest = {"version": FORMAT_VERSION, "rows": len(rows), "fields": fields, "columns": columns}
+    with open(os.path.join(tmp_directory, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    old_directory = directory.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_directory, ignore_errors=True)
+    if os.path.exists(directory):
+        os.replace(directory, old_directory)  # open memory maps of the old files stay valid
+    os.replace(tmp_directory, directory)
+    shutil.rmtree(old_directory, ignore_errors=True)
+    return directory
+
+
+class ColumnarTable:
+    """Read-only view of a table written by write_table. Columns are memory-mapped on first use."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported table version {self.manifest.get('version')} in {directory}")
+        self.fields = self.manifest["fields"]
+        self.columns = self.manifest["columns"]
+        self._arrays = {}
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def _array(self, filename):
+        array = self._arrays.get(filename)
+        if array is None:
+            array = self._arrays[filename] = np.load(os.path.join(self.directory, filename), mmap_mode="r")
+        return array
+
+    def _string(self, name, position):
+        if not self._array(f"{name}.valid.npy")[position]:
+            return None
+        offsets = self._array(f"{name}.offsets.npy")
+        start, end = int(offsets[position]), int(offsets[position + 1])
+        return bytes(self._array(f"{name}.data.npy")[start:end]).decode("utf-8")
+
+    def _list_range(self, name, row):
+        if not self._array(f"{name}.valid.npy")[row]:
+            return None
+        offsets = self._array(f"{name}.list_offsets.npy")
+        return range(int(offsets[row]), int(offsets[row + 1]))
+
+    def value(self, field, row):
+        """Python value of one cell, or None when missing."""
+        column = self.columns[field]
+        kind = column["kind"]
+        if kind == "string":
+            return self._string(field, row)
+        if kind == "category":
+            code = int(self._array(f"{field}.codes.npy")[row])
+            return column["values"][code] if code >= 0 else None
+        if kind == "float":
+            value = float(self._array(f"{field}.npy")[row])
+            return None if value != value else value
+        if kind == "int":
+            return int(self._array(f"{field}.npy")[row]) if self._array(f"{field}.valid.npy")[row] else None
+        if kind == "parsed":
+            code = int(self._array(f"{field}.format.npy")[row])
+            if code < 0:
+                return None
+            value = float(self._array(f"{field}.npy")[row])
+            return column["formats"][code].format(value) if value == value else column["formats"][code]
+        if kind == "list":
+            positions = self._list_range(field, row)
+            return None if positions is None else [self._string(f"{field}.item", position) for position in positions]
+        positions = self._list_range(field, row)
+        if positions is None:
+            return None
+        return [
+            {key: value for key in column["keys"] if (value := self._string(f"{field}.{key}", position)) is not None}
+            for position in positions
+        ]
+
+    def row(self, row, fields=None):
+        """Dict of the row's present fields (missing ones are left out, as in the source JSON)."""
+        values = {}
+        for field in fields or self.fields:
+            value = self.value(field, row)
+            if value is not None:
+                values[field] = value
+        return values
+
+    def rows(self):
+        return (self.row(position) for position in range(len(self)))
+
+    def numbers(self, field):
+        """float64 column (NaN = missing) of a float, int or parsed field, without decoding rows."""
+        array = self._array(f"{field}.npy")
+        if self.columns[field]["kind"] == "int":
+            return np.where(self._array(f"{field}.valid.npy"), array, np.nan)
+        return array
+
+    def strings(self, field):
+        """Every value of a string or category column, decoded in one pass."""
+        column = self.columns[field]
+        if column["kind"] == "category":
+            return [column["values"][code] if code >= 0 else None for code in self._array(f"{field}.codes.npy").tolist()]
+        offsets = self._array(f"{field}.offsets.npy").tolist()
+        data = self._array(f"{field}.data.npy").tobytes()
+        valid = self._array(f"{field}.valid.npy").tolist()
+        return [
+            data[offsets[position]:offsets[position + 1]].decode("utf-8") if valid[position] else None
+            for position in range(len(self))
+        ]
+
+
+def write_catalog(items, directory=DEFAULT_CATALOG_DIR):
+    """Writes scraped product items as the columnar catalog."""
+    return write_table(directory, items, ITEM_SCHEMA)
+
+
+def open_catalog(directory=DEFAULT_CATALOG_DIR):
+    """The catalog as a ColumnarTable, or None when it has not been written yet."""
+    if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        print(f"Warning: Catalog not found at {directory}. Run the scraper or: python search/catalog.py <items.json>")
+        return None
+    return ColumnarTable(directory)
+
+
+def load_catalog_items(directory=DEFAULT_CATALOG_DIR):
+    """Scraped items as dicts in the shape the scraper produced them. Empty when there is no catalog."""
+    catalog = open_catalog(directory)
+    return list(catalog.rows()) if catalog is not None else []
+
+
+def convert_json_catalog(json_path=LEGACY_JSON_PATH, directory=DEFAULT_CATALOG_DIR):
+    """Converts a scraper JSON array to the columnar catalog and checks that every item round-trips."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        items = json.load(f)
+    write_catalog(items, directory)
+    catalog = ColumnarTable(directory)
+    mismatched = [position for position, item in enumerate(items) if catalog.row(position) != item]
+    if mismatched:
+        raise ValueError(f"{len(mismatched)} items did not round-trip, first at position {mismatched[0]}")
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    print(f"INFO: Converted {len(items)} items from {json_path} ({os.path.getsize(json_path) / 1024:.0f} KB) "
+          f"to {directory} ({size / 1024:.0f} KB).")
+    return directory
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3:
+        print("Usage: python catalog.py [items.json] [catalog_dir]")
+        sys.exit(1)
+    json_path = sys.argv[1] if len(sys.argv) > 1 else LEGACY_JSON_PATH
+    directory = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CATALOG_DIR
+    convert_json_catalog(json_path, directory)
+    start = time.perf_counter()
+    catalog = ColumnarTable(directory)
+    prices = catalog.numbers("price")
+    print(f"INFO: Opened {len(catalog)} items and mapped the price column in "
+          f"{(time.perf_counter() - start) * 1000:.2f} ms ({int(np.isfinite(prices).sum())} priced).")
@@ -0,0 +1,82 @@
+import re
+
+from search.artifacts import load_json_artifact, save_json_artifact
+
+CODE_INDEX_FILE = "product_codes.json"
+CODE_FIELDS = ("sku", "upc", "product_code_from_url", "item_number_from_name")
+
+# Code-like tokens: at least 4 characters, containing a digit
+CODE_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9-]{3,}")
+# Words that may surround a pasted code without making it a free-text question
+CODE_QUERY_WORDS = {
+    "sku", "upc", "item", "code", "number", "no", "product", "find", "show", "me", "lookup", "look", "up",
+    "what", "is", "whats", "what's", "the", "a", "for", "please", "about", "info", "details", "on", "cheese",
+    # several codes in one turn ("106832 and 124144", "skus 106832, 124144 or 130021")
+    "and", "or", "plus", "also", "both", "skus", "upcs", "items", "codes", "numbers", "products", "are",
+}
+
+_codes = None
+
+
+def normalize_code(code):
+    return re.sub(r"[^0-9A-Za-z]", "", str(code)).upper()
+
+
+def build_code_index(all_metadata: list) -> dict:
+    """Maps every normalized sku/upc/product code/item number to the product ids carrying it."""
+    codes = {}
+    for metadata in all_metadata:
+        product_id = metadata["_id"]
+        for field in CODE_FIELDS:
+            code = normalize_code(metadata.get(field) or "")
+            if code and any(ch.isdigit() for ch in code):
+                ids = codes.setdefault(code, [])
+                if product_id not in ids:
+                    ids.append(product_id)
+    print(f"INFO: Code index has {len(codes)} codes over {len(all_metadata)} products.")
+    return codes
+
+
+def save_code_index(codes: dict):
+    return save_json_artifact(CODE_INDEX_FILE, codes)
+
+
+def load_code_index():
+    """Loads the code index into a dict. Returns True when it is available."""
+    global _codes
+    _codes = load_json_artifact(CODE_INDEX_FILE)
+    return _codes is not None
+
+
+def is_code_index_loaded():
+    return _codes is not None
+
+
+def lookup_code(code):
+    """Product ids carrying this exact code (case and separators ignored)."""
+    if _codes is None:
+        return []
+    return _codes.get(normalize_code(code), [])
+
+
+def match_code_query(text):
+    """Product ids for a query that is essentially one or more pasted codes, else None.
+
+    Queries with other content ("cheaper than 106832") return None and take the normal path.
+    """
+    if _codes is None:
+        return None
+    product_ids = []
+    for token in CODE_TOKEN_PATTERN.findall(text):
+        if not any(ch.isdigit() for ch in token):
+            continue
+        for product_id in _codes.get(normalize_code(token), []):
+            if product_id not in product_ids:
+                product_ids.append(product_id)
+    if not product_ids:
+        return None
+    leftover = [
+        word for word in re.findall(r"[A-Za-z0-9'-]+", text.lower())
+        if word not in CODE_QUERY_WORDS and not any(ch.isdigit() for ch in word)
+    ]
+    return product_ids if not leftover else None
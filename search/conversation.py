@@ -0,0 +1,145 @@
+import re
+import copy
+import json
+
+MAX_SUMMARY_TURNS = 4  # recent turns kept verbatim; older ones fold into earlier_topics
+MAX_EARLIER_TOPICS = 6
+MAX_MENTIONED = 15
+MAX_NAMES_PER_TURN = 3
+MAX_NAME_CHARS = 48
+MAX_CONTEXT_CHARS = 1200
+MAX_FOLLOW_UP_WORDS = 6
+
+# Short refinements of the previous results: (pattern, field, bound)
+FOLLOW_UP_RULES = (
+    (re.compile(r"\b(cheaper|less expensive|lower price|more affordable|budget)\b"), "price", "below"),
+    (re.compile(r"\b(more expensive|pricier|premium|higher end)\b"), "price", "above"),
+    (re.compile(r"\b(bigger|larger|heavier)\b"), "weight", "above"),
+    (re.compile(r"\b(smaller|lighter)\b"), "weight", "below"),
+)
+# Words that may surround a refinement without adding a new constraint ("any cheaper ones please?");
+# anything else ("cheaper cheddar") is a new search, planned with the previous filters as context
+FOLLOW_UP_WORDS = {
+    "a", "an", "the", "any", "some", "ones", "one", "options", "something", "anything", "else", "items",
+    "products", "cheese", "cheeses", "show", "me", "give", "find", "get", "i", "want", "need", "would", "like",
+    "do", "you", "have", "got", "are", "there", "is", "what", "about", "how", "please", "maybe", "even",
+    "still", "bit", "little", "lot", "much", "more", "slightly", "than", "that", "those", "these", "them",
+    "it", "and", "or", "but", "with", "to", "of", "in", "now", "instead", "too", "again", "ok", "okay",
+}
+
+
+class ConversationState:
+    """Rolling, bounded memory of one chat: recent turn summaries, mentioned products and the active plan."""
+
+    __slots__ = ("summary", "earlier_topics", "mentioned", "last_plan", "last_shown", "turns")
+
+    def __init__(self):
+        self.summary = []  # [topic, "asked ... -> ..."] for the most recent turns
+        self.earlier_topics = []
+        self.mentioned = {}  # sku -> product name, most recent last
+        self.last_plan = None
+        self.last_shown = []  # [{"sku", "price", "weight"}] of the previous turn's results
+        self.turns = 0
+
+    @property
+    def active_filters(self):
+        return (self.last_plan or {}).get("metadata_filters") or {}
+
+    def record_turn(self, user_query, search_params, search_results):
+        """Folds one finished turn into the state."""
+        self.turns += 1
+        if isinstance(search_params, str):
+            try:
+                search_params = json.loads(search_params)
+            except json.JSONDecodeError:
+                search_params = None
+        if isinstance(search_params, dict) and "vector_query" in search_params:
+            self.last_plan = search_params
+
+        shown = []
+        for product in search_results[:5]:
+            metadata = product.metadata or {}
+            sku = str(metadata.get("sku") or product.id)
+            self.mentioned.pop(sku, None)
+            self.mentioned[sku] = str(metadata.get("product_name", "Product"))[:MAX_NAME_CHARS]
+            shown.append({"sku": sku, "price": metadata.get("price"), "weight": metadata.get("weight")})
+        while len(self.mentioned) > MAX_MENTIONED:
+            del self.mentioned[next(iter(self.mentioned))]
+        self.last_shown = shown
+
+        names = [f'{self.mentioned[item["sku"]]} (SKU {item["sku"]})' for item in shown[:MAX_NAMES_PER_TURN]]
+        topic = (search_params or {}).get("vector_query") if isinstance(search_params, dict) else None
+        self.summary.append([(topic or user_query)[:60],
+                             f'asked "{user_query[:80]}" -> ' + ("; ".join(names) if names else "no matching products")])
+        while len(self.summary) > MAX_SUMMARY_TURNS:
+            topic = self.summary.pop(0)[0]
+            if topic in self.earlier_topics:
+                self.earlier_topics.remove(topic)
+            self.earlier_topics = (self.earlier_topics + [topic])[-MAX_EARLIER_TOPICS:]
+
+    def history_context(self):
+        """Compact history for the response prompt; its size is bounded however long the chat gets."""
+        if not self.turns:
+            return ""
+        lines = ["Conversation so far:"]
+        if self.earlier_topics:
+            lines.append("Earlier topics: " + ", ".join(self.earlier_topics))
+        summary = [f"- {line}" for _, line in self.summary]
+        tail = []
+        if self.active_filters:
+            tail.append("Active filters: " + json.dumps(self.active_filters))
+        if self.mentioned:
+            tail.append("SKUs already shown: " + ", ".join(self.mentioned))
+        # Over budget, whole turns go from the oldest end, then the earlier topics
+        while summary and len("\n".join(lines + summary + tail)) > MAX_CONTEXT_CHARS:
+            summary.pop(0)
+        if len(lines) > 1 and len("\n".join(lines + summary + tail)) > MAX_CONTEXT_CHARS:
+            del lines[1]
+        return "\n".join(lines + summary + tail)
+
+    def follow_up_plan(self, user_query):
+        """Plan JSON for short refinements like "cheaper ones", built from the previous plan without
+        an LLM call. None when the query is not such a refinement or there is nothing to refine.
+
+        Only queries made of nothing but refinements and FOLLOW_UP_WORDS qualify.
+        """
+        if not self.last_plan or not self.last_shown or len(user_query.split()) > MAX_FOLLOW_UP_WORDS:
+            return None
+        lowered = user_query.lower()
+        matched = [(pattern, field, bound) for pattern, field, bound in FOLLOW_UP_RULES if pattern.search(lowered)]
+        if not matched:
+            return None
+        leftover = lowered
+        for pattern, _, _ in matched:
+            leftover = pattern.sub(" ", leftover)
+        if any(word not in FOLLOW_UP_WORDS for word in re.findall(r"[a-z0-9]+", leftover)):
+            return None
+        filters = dict(self.active_filters)
+        refinements = []
+        for _, field, bound in matched:
+            values = [item[field] for item in self.last_shown if isinstance(item.get(field), (int, float))]
+            if not values:
+                return None
+            filters[field] = {"lt": min(values)} if bound == "below" else {"gt": max(values)}
+            refinements.append(f"{field} {bound}")
+        return json.dumps({**self.last_plan, "metadata_filters": filters, "follow_up": ", ".join(refinements)})
+
+    def plan_context(self):
+        """The previous search and its filters, for planning a turn that is not a plain refinement."""
+        if not self.last_plan:
+            return ""
+        context = f'Previous search: "{self.last_plan.get("vector_query", "")}"'
+        if self.active_filters:
+            context += " with filters " + json.dumps(self.active_filters)
+        return context
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        for slot in cls.__slots__:
+            if data and slot in data:
+                setattr(state, slot, copy.deepcopy(data[slot]))
+        return state
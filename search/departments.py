@@ -0,0 +1,120 @@
+import os
+import re
+import json
+
+from search.artifacts import load_json_artifact, save_json_artifact
+from search.catalog import DEFAULT_CATALOG_DIR
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# [{"name": "meat", "url": "https://shop.kimelo.com/department/<slug>/<id>"}, ...]; "namespace" and
+# "catalog_dir" are optional. The scraper adds departments given to it as name=url.
+DEPARTMENTS_FILE = os.environ.get("CHEESEBOT_DEPARTMENTS_FILE", os.path.join(ROOT_DIR, "departments.json"))
+NAMESPACE_MAP_FILE = "namespaces.json"  # namespace -> department, categories and product count
+
+# The cheese department keeps the namespace, catalog and checkpoint names it had before departments
+DEFAULT_NAMESPACE = "hybrid-namespace"
+DEFAULT_DEPARTMENTS = [{
+    "name": "cheese",
+    "url": "https://shop.kimelo.com/department/cheese/3365",
+    "namespace": DEFAULT_NAMESPACE,
+    "catalog_dir": DEFAULT_CATALOG_DIR,
+}]
+
+_namespace_map = None
+_terms = {}  # namespace -> words in a query that point at its department
+
+
+def _with_defaults(department):
+    name = department["name"]
+    return {
+        **department,
+        "namespace": department.get("namespace") or f"{name}-namespace",
+        "catalog_dir": department.get("catalog_dir") or os.path.join(ROOT_DIR, "scraper", f"kimelo_{name}_catalog"),
+    }
+
+
+def load_departments(path=DEPARTMENTS_FILE):
+    """Configured departments, cheese first, each with its namespace and catalog directory."""
+    departments = {department["name"]: department for department in DEFAULT_DEPARTMENTS}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for department in json.load(f):
+                    departments[department["name"]] = {**departments.get(department["name"], {}), **department}
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"Warning: Could not read departments from {path}: {e}")
+    return [_with_defaults(department) for department in departments.values()]
+
+
+def save_departments(departments, path=DEPARTMENTS_FILE):
+    """Writes the department list, leaving out the defaults derived from each name."""
+    entries = [{"name": department["name"], "url": department["url"]} for department in departments]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def build_namespace_map(metadata_by_department: dict, departments: list) -> dict:
+    """Routing table for queries: which department and product categories each namespace holds."""
+    namespace_map = {}
+    for department in departments:
+        all_metadata = metadata_by_department.get(department["name"])
+        if not all_metadata:
+            continue
+        categories = {metadata["categories"] for metadata in all_metadata if metadata.get("categories")}
+        namespace_map[department["namespace"]] = {
+            "department": department["name"],
+            "categories": sorted(categories),
+            "products": len(all_metadata),
+        }
+    return namespace_map
+
+
+def save_namespace_map(namespace_map: dict):
+    return save_json_artifact(NAMESPACE_MAP_FILE, namespace_map)
+
+
+def load_namespace_map():
+    """Loads the ingest-built routing table. Returns True when it is available."""
+    global _namespace_map, _terms
+    namespace_map = load_json_artifact(NAMESPACE_MAP_FILE)
+    _namespace_map = {
+        namespace: {**entry, "categories": set(entry.get("categories", []))}
+        for namespace, entry in (namespace_map or {}).items()
+    } or None
+    _terms = {}
+    for namespace, entry in (_namespace_map or {}).items():
+        words = re.findall(r"[a-z]+", entry["department"].lower())
+        _terms[namespace] = set(words) | {word + "s" for word in words}
+    return _namespace_map is not None
+
+
+def all_namespaces():
+    return list(_namespace_map) if _namespace_map else [DEFAULT_NAMESPACE]
+
+
+def _filter_values(condition):
+    if isinstance(condition, dict):
+        condition = condition.get("$eq", condition.get("$in"))
+    if condition is None:
+        return []
+    return condition if isinstance(condition, list) else [condition]
+
+
+def route_namespaces(filter_dict, vector_query=""):
+    """Namespaces a query needs: those holding its category filter, else those whose department the
+    query names, else all of them (fan-out)."""
+    namespaces = all_namespaces()
+    if len(namespaces) == 1:
+        return namespaces
+    categories = _filter_values((filter_dict or {}).get("categories"))
+    if categories:
+        routed = [namespace for namespace in namespaces
+                  if any(category in _namespace_map[namespace]["categories"] for category in categories)]
+        if routed:
+            return routed
+    words = set(re.findall(r"[a-z]+", (vector_query or "").lower()))
+    routed = [namespace for namespace in namespaces if _terms[namespace] & words]
+    return routed or namespaces
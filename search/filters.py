@@ -0,0 +1,328 @@
+import re
+
+from search.artifacts import load_json_artifact, save_json_artifact
+
+METADATA_SCHEMA_FILE = "metadata_schema.json"
+
+# Field types of the metadata written by ingest/ingest_data.py:prepare_detailed_metadata
+METADATA_SCHEMA = {
+    "product_detail_url": "string",
+    "image_url": "string",
+    "detail_page_main_image_url": "string",
+    "product_name": "string",
+    "product_name_detail": "string",
+    "brand": "string",
+    "brand_supplier_detail": "string",
+    "price": "number",
+    "unit_price": "number",
+    "status": "string",
+    "categories": "string",
+    "sku": "string",
+    "upc": "string",
+    "product_code_from_url": "string",
+    "item_number_from_name": "string",
+    "quantity_package_info": "string",
+    "dimensions": "string",
+    "weight": "number",
+    "detail_page_main_image_alt": "string",
+    "related_products_count": "number",
+    "other_like_products_count": "number",
+    "related_products": "list",
+    "other_like_products": "list",
+    "proposition_65_warning": "string",
+    "table_caption": "string",
+}
+
+# Keys the query-plan LLM tends to emit, mapped to the real metadata field
+FILTER_KEY_ALIASES = {
+    "name": "product_name",
+    "title": "product_name",
+    "product": "product_name",
+    "cheese": "product_name",
+    "manufacturer": "brand",
+    "supplier": "brand",
+    "category": "categories",
+    "type": "categories",
+    "cheese_type": "categories",
+    "availability": "status",
+    "stock": "status",
+    "cost": "price",
+    "price_per_unit": "unit_price",
+    "unitprice": "unit_price",
+    "net_weight": "weight",
+    "code": "sku",
+    "item_number": "item_number_from_name",
+    "package": "quantity_package_info",
+}
+
+# Fields that are only useful as distinct values when there are not too many of them
+MAX_VOCABULARY_SIZE = 5000
+# Pinecone accepts up to 10,000 values in $in; keep well below to bound payload size
+MAX_IN_VALUES = 100
+
+_NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+_UPPER_BOUND_WORDS = ("under", "below", "less", "max", "cheaper", "up to", "at most", "<")
+_LOWER_BOUND_WORDS = ("over", "above", "more", "min", "at least", "greater", ">")
+_RANGE_KEYS = {
+    "min": "$gte", "max": "$lte",
+    "gte": "$gte", "lte": "$lte", "gt": "$gt", "lt": "$lt",
+    "$gte": "$gte", "$lte": "$lte", "$gt": "$gt", "$lt": "$lt",
+}
+
+_metadata_schema = None
+
+
+def build_metadata_schema(all_metadata: list) -> dict:
+    """Builds field types and distinct string values from the metadata produced at ingest."""
+    fields = {}
+    values = {}
+    for metadata in all_metadata:
+        for key, value in metadata.items():
+            if key.startswith("_"):
+                continue
+            if isinstance(value, bool):
+                field_type = "string"
+            elif isinstance(value, (int, float)):
+                field_type = "number"
+            elif isinstance(value, list):
+                field_type = "list"
+            else:
+                field_type = "string"
+            fields.setdefault(key, field_type)
+            if field_type == "string" and value is not None:
+                values.setdefault(key, set()).add(str(value))
+
+    schema = {"fields": {}}
+    for key, field_type in fields.items():
+        entry = {"type": field_type}
+        distinct = values.get(key)
+        if distinct and len(distinct) <= MAX_VOCABULARY_SIZE:
+            entry["values"] = sorted(distinct)
+        schema["fields"][key] = entry
+    return schema
+
+
+def save_metadata_schema(schema: dict):
+    return save_json_artifact(METADATA_SCHEMA_FILE, schema)
+
+
+def load_metadata_schema():
+    """Loads the ingest-time schema, falling back to the static field types."""
+    global _metadata_schema
+    schema = load_json_artifact(METADATA_SCHEMA_FILE)
+    if not schema or "fields" not in schema:
+        schema = {"fields": {key: {"type": field_type} for key, field_type in METADATA_SCHEMA.items()}}
+    _metadata_schema = schema
+    return schema
+
+
+def get_metadata_schema():
+    if _metadata_schema is None:
+        return load_metadata_schema()
+    return _metadata_schema
+
+
+def _resolve_key(key, fields):
+    if key in fields:
+        return key
+    normalized = str(key).strip().lower().replace(" ", "_").replace("-", "_")
+    if normalized in fields:
+        return normalized
+    alias = FILTER_KEY_ALIASES.get(normalized)
+    return alias if alias in fields else None
+
+
+def _to_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _NUMBER_PATTERN.search(value.replace(",", ""))
+        if match:
+            return float(match.group())
+    return None
+
+
+def _compile_number(value):
+    if isinstance(value, dict):
+        range_filter = {}
+        for op, bound in value.items():
+            pinecone_op = _RANGE_KEYS.get(str(op).lower())
+            number = _to_number(bound)
+            if pinecone_op and number is not None:
+                range_filter[pinecone_op] = number
+            elif str(op).lower() in ("$eq", "eq") and number is not None:
+                range_filter["$eq"] = number
+        return range_filter or None
+    if isinstance(value, list):
+        numbers = [n for n in (_to_number(v) for v in value) if n is not None]
+        if len(numbers) == 2:
+            return {"$gte": min(numbers), "$lte": max(numbers)}
+        return {"$in": numbers} if numbers else None
+    number = _to_number(value)
+    if number is None:
+        return None
+    if isinstance(value, str):
+        lowered = value.lower()
+        if any(word in lowered for word in _UPPER_BOUND_WORDS):
+            return {"$lte": number}
+        if any(word in lowered for word in _LOWER_BOUND_WORDS):
+            return {"$gte": number}
+    return {"$eq": number}
+
+
+def _case_variants(value):
+    return list(dict.fromkeys([value, value.lower(), value.upper(), value.title()]))
+
+
+def _match_vocabulary(value, vocabulary):
+    """Case-insensitive exact match first, then substring match against known values."""
+    lowered = value.strip().lower()
+    exact = [v for v in vocabulary if v.lower() == lowered]
+    if exact:
+        return exact
+    return [v for v in vocabulary if lowered in v.lower()]
+
+
+def _compile_string(value, vocabulary):
+    negate = False
+    if isinstance(value, dict):
+        if "$ne" in value or "$nin" in value:
+            negate = True
+            value = value.get("$ne", value.get("$nin"))
+        else:
+            value = value.get("$eq", value.get("$in"))
+    raw_values = value if isinstance(value, list) else [value]
+    raw_values = [str(v).strip() for v in raw_values if v is not None and str(v).strip()]
+    if not raw_values:
+        return None, []
+
+    matched = []
+    unmatched = []
+    for raw in raw_values:
+        values = _match_vocabulary(raw, vocabulary) if vocabulary is not None else _case_variants(raw)
+        if not values:
+            unmatched.append(raw)
+        matched.extend(values)
+    matched = list(dict.fromkeys(matched))
+    if not matched or len(matched) > MAX_IN_VALUES:
+        return None, unmatched
+    return ({"$nin": matched} if negate else {"$in": matched}), unmatched
+
+
+def _merge_conditions(existing, compiled):
+    """Both conditions on one field as a single one, or None when no value can satisfy both."""
+    merged = dict(existing)
+    for op, value in compiled.items():
+        if op not in merged:
+            merged[op] = value
+        elif op == "$in":
+            merged[op] = [v for v in merged[op] if v in value]
+        elif op == "$nin":
+            merged[op] = list(dict.fromkeys(merged[op] + value))
+        elif op in ("$gt", "$gte"):
+            merged[op] = max(merged[op], value)
+        elif op in ("$lt", "$lte"):
+            merged[op] = min(merged[op], value)
+        elif merged[op] != value:
+            return None
+    if "$in" in merged and "$nin" in merged:
+        merged["$in"] = [v for v in merged["$in"] if v not in merged.pop("$nin")]
+    if "$in" in merged and not merged["$in"]:
+        return None
+    return merged
+
+
+def compile_metadata_filters(metadata_filters, schema=None):
+    """Validates LLM metadata filters against the ingest schema and returns a Pinecone filter.
+
+    Returns (filter_dict, dropped) where dropped lists (key, reason) for every clause that
+    could not be expressed, so the query can be issued once without a no-filter retry.
+    """
+    schema = schema or get_metadata_schema()
+    fields = schema.get("fields", {})
+    filter_dict = {}
+    dropped = []
+
+    if not isinstance(metadata_filters, dict):
+        if metadata_filters:
+            dropped.append(("metadata_filters", "not an object"))
+        return filter_dict, dropped
+
+    for key, value in metadata_filters.items():
+        field = _resolve_key(key, fields)
+        if field is None:
+            dropped.append((key, "unknown field"))
+            continue
+        field_type = fields[field].get("type")
+
+        unmatched = []
+        if field_type == "number":
+            compiled = _compile_number(value)
+        elif field_type == "string":
+            compiled, unmatched = _compile_string(value, fields[field].get("values"))
+        else:
+            compiled = None
+
+        # Values outside the field's vocabulary are reported instead of silently widening the search
+        dropped.extend((key, f"no '{field}' value matches '{raw}'") for raw in unmatched)
+        if compiled is None:
+            if not unmatched:
+                dropped.append((key, f"unsupported value for {field_type} field '{field}'"))
+            continue
+        if field in filter_dict:
+            merged = _merge_conditions(filter_dict[field], compiled)
+            if merged is None:
+                dropped.append((key, f"conflicts with another filter on '{field}'"))
+                continue
+            filter_dict[field] = merged
+        else:
+            filter_dict[field] = compiled
+
+    return filter_dict, dropped
+
+
+def matches_condition(actual, condition):
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    for op, expected in condition.items():
+        if op == "$eq":
+            ok = actual == expected
+        elif op == "$ne":
+            ok = actual != expected
+        elif op == "$in":
+            ok = actual in expected
+        elif op == "$nin":
+            ok = actual not in expected
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            if not isinstance(actual, (int, float)) or isinstance(actual, bool):
+                return False
+            ok = {
+                "$gt": actual > expected,
+                "$gte": actual >= expected,
+                "$lt": actual < expected,
+                "$lte": actual <= expected,
+            }[op]
+        else:
+            return False
+        if not ok:
+            return False
+    return True
+
+
+def matches_filter(metadata: dict, filter_dict: dict) -> bool:
+    """Evaluates a compiled Pinecone-style filter against one product's metadata locally."""
+    for key, condition in filter_dict.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key not in metadata:
+            if not (isinstance(condition, dict) and set(condition) <= {"$ne", "$nin"}):
+                return False
+        elif not matches_condition(metadata[key], condition):
+            return False
+    return True
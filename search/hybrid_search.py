@@ -1,19 +1,28 @@
 from dotenv import load_dotenv # Import the dotenv library
 import os
-from pinecone import Pinecone
-import openai
 import json
 load_dotenv()
 
 PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
-openai.api_key = OPENAI_API_KEY
+index_name = "cheese-chatbot"
+openai = None
+pc = None
+index = None
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
 
-index_name = "cheese-chatbot"
-index = pc.Index(index_name)
+def initialize_clients():
+    """Imports the SDKs and creates the clients on demand, so importing this module stays cheap."""
+    global openai, pc, index
+    if index is None:
+        import openai as openai_sdk
+        from pinecone import Pinecone
+
+        openai = openai_sdk
+        openai.api_key = OPENAI_API_KEY
+        pc = Pinecone(api_key=PINECONE_API_KEY)
+        index = pc.Index(index_name)
 
 
 def generate_search_query(user_input: str):
@@ -177,13 +186,15 @@ def product_search_bot(user_query):
         "results": formatted_results,
         "result_count": len(formatted_results)
     }
-        
-while True:
-    user_message = input("question:  ")
 
-    bot_response = product_search_bot(user_message)
+if __name__ == "__main__":
+    initialize_clients()
+    while True:
+        user_message = input("question:  ")
+
+        bot_response = product_search_bot(user_message)
 
-    if bot_response["success"]:
-        print(bot_response["response"])
-    else:
-        print(bot_response["response"])
\ No newline at end of file
+        if bot_response["success"]:
+            print(bot_response["response"])
+        else:
+            print(bot_response["response"])
\ No newline at end of file
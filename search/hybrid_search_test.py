@@ -2,21 +2,80 @@
 
 from dotenv import load_dotenv
 import os
-from pinecone import Pinecone
-import openai
+import sys
 import json
+import math
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search.ann_index import ann_search, is_ann_index_loaded, load_ann_index
+from search.code_index import load_code_index, match_code_query
+from search.conversation import ConversationState
+from search.departments import load_namespace_map, route_namespaces
+from search.filters import compile_metadata_filters, load_metadata_schema, matches_filter
+from search.lexicon import correct_query, load_lexicon, suggest_completions
+from search.llm_gateway import INTERACTIVE, chat_completion, llm_gateway_metrics
+from search.metadata_store import (
+    HydratedMatch, filter_mask, get_product_record, hydrate_matches, is_metadata_store_loaded, iter_products,
+    load_metadata_store, sample_product_ids, store_row_positions, store_size
+)
+from search.model_router import (
+    CODE_LOOKUP, GREETING, LARGE_MODEL, PLAN_MODEL, classify_turn, closing_response, greeting_response, is_closing,
+    model_router_metrics, record_route, response_model
+)
+from search.product_graph import get_neighbors, load_product_graph
+from search.response_cache import (
+    get_cached_response, put_cached_response, response_cache_key, response_cache_metrics
+)
+from search.thumbnails import load_thumbnail_manifest, thumbnail_url
+from search.tracing import payload_bytes, span, stage_percentiles, trace_turn, usage_attributes
+from search.web_search import collect_web_result, format_web_context
 
 load_dotenv()
 
 PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
+# "adaptive" over-fetches ids only and filters/hydrates locally; "standard" ships metadata from Pinecone;
+# "local" answers dense-only from the ingest-built ANN index and never queries Pinecone
+RETRIEVAL_MODE = os.environ.get("CHEESEBOT_RETRIEVAL_MODE", "adaptive")
+RESULT_LIMIT = 5  # generate_response and the reranker only ever use the top 5
+OVERFETCH_FACTOR = 3
+MAX_FETCH_K = 100
+NAMESPACE = "hybrid-namespace"  # cheese; other departments get their own namespace at ingest
+FAN_OUT_WORKERS = 8
+
+# Dense share of the hybrid score: 0 = keyword (sparse) only, 1 = semantic (dense) only
+DEFAULT_ALPHA = float(os.environ.get("CHEESEBOT_HYBRID_ALPHA", "0.5"))
+KEYWORD_ALPHA = 0.3  # short brand/name lookups
+DENSE_DIMENSION = 1024
+DENSE_PLACEHOLDER = 1e-6  # the index rejects all-zero dense vectors
+CODE_TOKEN_PATTERN = re.compile(r"\b\d{5,}\b")
+# A concurrent web search gets this long past retrieval before the answer is generated without it
+WEB_CONTEXT_WAIT_SECONDS = 0.5
+GREETING_PICKS = 2  # catalog products suggested along with a greeting
+
+PROMPT_FILES = ("system.txt", "role.txt", "result.txt", "additional.txt")
+
+# The SDKs take most of this module's import time, so they are imported by initialize_clients
+openai = None
 pc = None
 index = None
 _clients_initialized = False
+_init_lock = threading.Lock()  # concurrent Streamlit sessions share one initialization
+_fan_out_executor = None
 
 def initialize_clients():
     """Initializes Pinecone and OpenAI clients. Returns True on success, False on failure."""
+    if _clients_initialized:
+        return True
+    with _init_lock:
+        return _initialize_clients_locked()
+
+def _initialize_clients_locked():
     global pc, index, openai, _clients_initialized
 
     if _clients_initialized:
@@ -30,10 +89,18 @@ def initialize_clients():
         return False
 
     try:
+        import openai as openai_sdk
+        from pinecone import Pinecone
+
+        openai = openai_sdk
         openai.api_key = OPENAI_API_KEY
+        openai.max_retries = 0  # llm_gateway retries behind the queue instead
         pc = Pinecone(api_key=PINECONE_API_KEY)
         index_name = "cheese-chatbot" 
         index = pc.Index(index_name)
+        load_local_artifacts()
+        for filename in PROMPT_FILES:
+            load_prompt(filename)
         _clients_initialized = True
         print("INFO: OpenAI and Pinecone clients initialized successfully.")
         return True
@@ -42,6 +109,22 @@ def initialize_clients():
         _clients_initialized = False
         return False
 
+def load_local_artifacts():
+    """Loads the ingest-built schema, metadata store, product graph, code index, lexicon, thumbnail
+    manifest, namespace routing table and, in local retrieval mode, the ANN index. Missing ones are
+    skipped."""
+    load_metadata_schema()
+    load_namespace_map()
+    load_metadata_store()
+    with _selectivity_lock:
+        _selectivity_cache.clear()
+    load_product_graph()
+    load_code_index()
+    load_lexicon()
+    load_thumbnail_manifest()
+    if RETRIEVAL_MODE == "local":
+        load_ann_index()
+
 def _get_prompt_path(filename):
     base_dir = os.path.dirname(os.path.abspath(__file__))
     prompt_path = os.path.join(base_dir, "..", "prompt", filename)
@@ -53,15 +136,27 @@ def _get_prompt_path(filename):
         raise FileNotFoundError(f"Prompt file {filename} not found.")
     return prompt_path
 
+_prompt_templates = {}
 
-def generate_search_query(user_input: str):
-    """Transform user input into a structured search query using GPT-4o"""
-    if not _clients_initialized:
-        raise ConnectionError("Clients not initialized. Call initialize_clients() first.")
-    
+def load_prompt(filename):
+    """Prompt template text, read once per process and re-read only when the file changes."""
+    path = _get_prompt_path(filename)
+    mtime = os.path.getmtime(path)
+    cached = _prompt_templates.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r') as f:
+            cached = _prompt_templates[filename] = (mtime, f.read())
+    return cached[1]
+
+
+def build_search_query_messages(user_input: str, context: str = ""):
+    """Chat messages for the query-plan call. Returns None when the prompt file is missing.
+
+    context describes the previous search of a conversation; the plan keeps its filters unless the
+    query changes them.
+    """
     try:
-        with open(_get_prompt_path("system.txt"), 'r') as f:
-            search_prompt = f.read()
+        search_prompt = load_prompt("system.txt")
     except FileNotFoundError as e:
         print(f"ERROR: {e}")
         return None
@@ -70,17 +165,176 @@ def generate_search_query(user_input: str):
     Based on this user query: "{user_input}"
     {search_prompt}
     """
+    if context:
+        prompt += f"""
+    {context}. Keep those filters unless this query replaces or drops them.
+    """
+    return [
+        {"role": "system", "content": "You are a search query optimization assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+def generate_search_query(user_input: str, priority=INTERACTIVE, model=PLAN_MODEL, context: str = ""):
+    """Transform user input into a structured search query with the planning model"""
+    if not _clients_initialized:
+        raise ConnectionError("Clients not initialized. Call initialize_clients() first.")
     
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a search query optimization assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        response_format={"type": "json_object"}
-    )
+    messages = build_search_query_messages(user_input, context)
+    if messages is None:
+        return None
+    
+    with span("plan", model=model, request_bytes=payload_bytes(messages)) as stage:
+        response = chat_completion(
+            openai, priority,
+            model=model,
+            messages=messages,
+            response_format={"type": "json_object"}
+        )
+        stage.set(response_bytes=payload_bytes(response.choices[0].message.content), **usage_attributes(response))
     return response.choices[0].message.content
 
+def choose_alpha(search_params):
+    """Dense weight for a query plan: the plan's own "alpha" if valid, otherwise by query type."""
+    if use_local_retrieval():
+        return 1.0  # the local index holds dense vectors only
+    alpha = search_params.get("alpha")
+    if isinstance(alpha, (int, float)) and not isinstance(alpha, bool):
+        return min(1.0, max(0.0, float(alpha)))
+    vector_query = search_params.get("vector_query", "") or ""
+    if CODE_TOKEN_PATTERN.search(vector_query):
+        return 0.0
+    if len(vector_query.split()) <= 3:
+        return KEYWORD_ALPHA
+    return DEFAULT_ALPHA
+
+def embed_queries(vector_queries, alpha=None):
+    """Embed one or more query strings with a single call per model. Returns (dense, sparse) pairs.
+
+    With alpha 0 the dense embed is skipped and with alpha 1 the sparse one; the skipped side is None.
+    """
+    dense_data = sparse_data = [None] * len(vector_queries)
+    if alpha is None or alpha > 0:
+        with span("embed_dense", inputs=len(vector_queries), request_bytes=payload_bytes(vector_queries)) as stage:
+            dense_data = pc.inference.embed(
+                model="llama-text-embed-v2",
+                inputs=vector_queries,
+                parameters={"input_type": "query", "truncate": "END"}
+            ).data
+            stage.set(response_bytes=payload_bytes([d['values'] for d in dense_data]))
+
+    if alpha is None or alpha < 1:
+        with span("embed_sparse", inputs=len(vector_queries), request_bytes=payload_bytes(vector_queries)) as stage:
+            sparse_data = pc.inference.embed(
+                model="pinecone-sparse-english-v0",
+                inputs=vector_queries,
+                parameters={"input_type": "query", "truncate": "END"}
+            ).data
+            stage.set(response_bytes=payload_bytes([[d['sparse_indices'], d['sparse_values']] for d in sparse_data]))
+
+    return [
+        (dense['values'] if dense else None,
+         {'indices': sparse['sparse_indices'], 'values': sparse['sparse_values']} if sparse else None)
+        for dense, sparse in zip(dense_data, sparse_data)
+    ]
+
+def scale_hybrid_vectors(dense_vector, sparse_vector, alpha):
+    """Convex dense/sparse weighting for the dotproduct index. Returns (dense, sparse or None)."""
+    if dense_vector is None or alpha <= 0:
+        dense = [DENSE_PLACEHOLDER] * DENSE_DIMENSION
+    else:
+        dense = [v * alpha for v in dense_vector]
+    sparse = None
+    if sparse_vector is not None and alpha < 1:
+        sparse = {'indices': sparse_vector['indices'], 'values': [v * (1 - alpha) for v in sparse_vector['values']]}
+    return dense, sparse
+
+def compile_filters(metadata_filters):
+    filter_dict, dropped_filters = compile_metadata_filters(metadata_filters)
+    for key, reason in dropped_filters:
+        print(f"Warning: Dropped metadata filter '{key}': {reason}")
+    print(filter_dict)
+    return filter_dict
+
+def standard_query_kwargs(dense_vector, sparse_vector, filter_dict, top_k):
+    return dict(
+        namespace=NAMESPACE,
+        top_k=top_k,
+        vector=dense_vector,
+        sparse_vector=sparse_vector,
+        include_values=False,
+        filter=filter_dict or None,
+        rerank={
+            "model": "bge-reranker-v2-m3",
+            "top_n": 5,
+            "rank_fields": ["chunk_text"]
+        },
+        include_metadata=not is_metadata_store_loaded()
+    )
+
+def use_adaptive_retrieval():
+    return RETRIEVAL_MODE == "adaptive" and is_metadata_store_loaded()
+
+def use_local_retrieval():
+    return RETRIEVAL_MODE == "local" and is_ann_index_loaded() and is_metadata_store_loaded()
+
+def local_query(dense_vector, filter_dict):
+    """Dense retrieval from the local ANN index; filters are checked against the local store while probing."""
+    accept = None
+    if filter_dict:
+        mask = filter_mask(filter_dict)
+        if mask is not None:
+            accept = (mask, store_row_positions())
+    if filter_dict and accept is None:  # legacy JSON store
+        def accept(product_id):
+            record = get_product_record(product_id)
+            return record is not None and matches_filter(record, filter_dict)
+    fetch_k = RESULT_LIMIT * OVERFETCH_FACTOR
+    with span("index_query", top_k=fetch_k, local=True) as stage:
+        matches = [HydratedMatch(product_id, score, None) for product_id, score in ann_search(dense_vector, fetch_k, accept)]
+        stage.set(matches=len(matches))
+    with span("hydrate", matches=len(matches)):
+        return select_adaptive_results(matches, None)
+
+def query_namespaces(query_kwargs, namespaces):
+    """Runs the query in every namespace concurrently and merges the matches by score."""
+    global _fan_out_executor
+    if len(namespaces) == 1:
+        return index.query(**dict(query_kwargs, namespace=namespaces[0])).matches
+    with _init_lock:
+        if _fan_out_executor is None:
+            _fan_out_executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix="fan-out")
+    futures = [_fan_out_executor.submit(index.query, **dict(query_kwargs, namespace=namespace)) for namespace in namespaces]
+    matches = [match for future in futures for match in future.result().matches]
+    matches.sort(key=lambda match: match.score, reverse=True)
+    return matches[:query_kwargs["top_k"]]
+
+def search_with_vectors(dense_vector, sparse_vector, metadata_filters, top_k=5, alpha=DEFAULT_ALPHA, vector_query=""):
+    """Query the index with precomputed query vectors, weighted by alpha, and the LLM's metadata filters.
+    The query goes to the namespaces its category filter or wording routes it to, or to all of them."""
+    filter_dict = compile_filters(metadata_filters)
+    if use_local_retrieval() and dense_vector is not None:
+        return local_query(dense_vector, filter_dict)
+    dense_vector, sparse_vector = scale_hybrid_vectors(dense_vector, sparse_vector, alpha)
+    namespaces = route_namespaces(filter_dict, vector_query)
+
+    if use_adaptive_retrieval():
+        return _adaptive_query(dense_vector, sparse_vector, filter_dict, namespaces)
+
+    query_kwargs = standard_query_kwargs(dense_vector, sparse_vector, filter_dict, top_k)
+    with span("index_query", top_k=top_k, include_metadata=query_kwargs["include_metadata"],
+              namespaces=len(namespaces)) as stage:
+        matches = query_namespaces(query_kwargs, namespaces)
+        stage.set(matches=len(matches), response_bytes=matches_payload_bytes(matches))
+
+    if is_metadata_store_loaded():
+        with span("hydrate", matches=len(matches)):
+            return _hydrate_locally(matches, namespaces)
+    return matches
+
+def matches_payload_bytes(matches):
+    """Approximate wire size of query matches: ids, scores and any metadata shipped with them."""
+    return sum(len(match.id) + 8 + (payload_bytes(match.metadata) if match.metadata else 0) for match in matches)
+
 def perform_hybrid_search(search_params):
     """Execute hybrid search in Pinecone combining vector search with metadata filtering"""
     search_params=json.loads(search_params)
@@ -88,66 +342,135 @@ def perform_hybrid_search(search_params):
     vector_query = search_params.get("vector_query", "")
     metadata_filters = search_params.get("metadata_filters", {})
     top_k = search_params.get("top_k", 5)
+    alpha = choose_alpha(search_params)
 
-    dense_query_embedding = pc.inference.embed(
-        model="llama-text-embed-v2",
-        inputs=vector_query,
-        parameters={"input_type": "query", "truncate": "END"}
-    )
+    dense_vector, sparse_vector = embed_queries([vector_query], alpha)[0]
+    return search_with_vectors(dense_vector, sparse_vector, metadata_filters, top_k, alpha, vector_query)
 
-    sparse_query_embedding = pc.inference.embed(
-        model="pinecone-sparse-english-v0",
-        inputs=vector_query,
-        parameters={"input_type": "query", "truncate": "END"}
-    )
+def _hydrate_locally(matches, namespaces=(NAMESPACE,)):
+    """Hydrate id-only matches from the local store, fetching only unknown ids from the index."""
+    hydrated, missing_ids = hydrate_matches(matches)
+    if missing_ids:
+        print(f"Warning: {len(missing_ids)} products missing from local metadata store; fetching from index.")
+        fetched = {}
+        for namespace in namespaces:
+            fetched.update(index.fetch(ids=missing_ids, namespace=namespace).vectors)
+        return merge_fetched_metadata(hydrated, fetched)
+    return hydrated
+
+def merge_fetched_metadata(hydrated, fetched):
+    for match in hydrated:
+        if match.metadata is None and match.id in fetched:
+            match.metadata = dict(fetched[match.id].metadata or {})
+    return [match for match in hydrated if match.metadata is not None]
 
-    filter_dict = {}
-    for key, value in metadata_filters.items():
-        if isinstance(value, dict) and ("min" in value or "max" in value):
-            range_filter = {}
-            if "min" in value:
-                range_filter["$gte"] = value["min"]
-            if "max" in value:
-                range_filter["$lte"] = value["max"]
-            filter_dict[key] = range_filter
+SELECTIVITY_CACHE_SIZE = 1024
+_selectivity_cache = OrderedDict()  # filter JSON -> matching product count; cleared when the store is loaded
+_selectivity_lock = threading.Lock()
+
+def _count_matching_products(filter_dict):
+    """Counts products in the local store that satisfy the filter, memoized per filter."""
+    cache_key = json.dumps(filter_dict, sort_keys=True)
+    with _selectivity_lock:
+        if cache_key in _selectivity_cache:
+            _selectivity_cache.move_to_end(cache_key)
+            return _selectivity_cache[cache_key]
+    mask = filter_mask(filter_dict)
+    if mask is not None:
+        matching = int(mask.sum())
+    else:
+        matching = sum(1 for _, record in iter_products() if matches_filter(record, filter_dict))
+    with _selectivity_lock:
+        _selectivity_cache[cache_key] = matching
+        while len(_selectivity_cache) > SELECTIVITY_CACHE_SIZE:
+            _selectivity_cache.popitem(last=False)
+    return matching
+
+def _dedup_key(product_id, metadata):
+    return str(metadata.get("sku") or metadata.get("product_code_from_url") or product_id).strip()
+
+def plan_adaptive_fetch(filter_dict):
+    """Choose fetch size and whether to push the filter to the index. Returns None if nothing can match."""
+    server_filter = None
+    fetch_k = RESULT_LIMIT * OVERFETCH_FACTOR
+    if filter_dict:
+        matching = _count_matching_products(filter_dict)
+        if matching == 0:
+            print("INFO: No catalog product satisfies the filters; skipping index query.")
+            return None
+        selectivity = matching / max(store_size(), 1)
+        needed_k = math.ceil(RESULT_LIMIT * OVERFETCH_FACTOR / selectivity)
+        if needed_k <= MAX_FETCH_K:
+            fetch_k = needed_k
         else:
-            filter_dict[key] = value
-    print(filter_dict)
-    try:
+            # Strict filter: let the index apply it rather than over-fetching most of the catalog
+            server_filter = filter_dict
+    return fetch_k, server_filter
 
-        query_response = index.query(
-            namespace="hybrid-namespace",
-            top_k=top_k,
-            vector=dense_query_embedding.data[0]['values'],
-            sparse_vector={'indices': sparse_query_embedding.data[0]['sparse_indices'], 'values': sparse_query_embedding.data[0]['sparse_values']},
-            include_values=False,
-            filter=filter_dict,
-            rerank={
-                "model": "bge-reranker-v2-m3",
-                "top_n": 5,
-                "rank_fields": ["chunk_text"]
-            },
-            include_metadata=True
-        )
-    except Exception as e:
-        query_response = index.query(
-            namespace="hybrid-namespace",
-            top_k=top_k,
-            vector=dense_query_embedding.data[0]['values'],
-            sparse_vector={'indices': sparse_query_embedding.data[0]['sparse_indices'], 'values': sparse_query_embedding.data[0]['sparse_values']},
-            include_values=False,
-            # filter=filter_dict,
-            rerank={
-                "model": "bge-reranker-v2-m3",
-                "top_n": 5,
-                "rank_fields": ["chunk_text"]
-            },
-            include_metadata=True
-        )
-        
-    return query_response.matches
+def adaptive_query_kwargs(dense_vector, sparse_vector, fetch_k, server_filter):
+    return dict(
+        namespace=NAMESPACE,
+        top_k=fetch_k,
+        vector=dense_vector,
+        sparse_vector=sparse_vector,
+        include_values=False,
+        filter=server_filter,
+        include_metadata=False
+    )
+
+def select_adaptive_results(matches, filter_dict):
+    """Filter id-only matches locally, dedup by SKU and hydrate only the final RESULT_LIMIT."""
+    results = []
+    seen = set()
+    for match in matches:
+        record = get_product_record(match.id)
+        if record is None:
+            print(f"Warning: Product {match.id} not found in local metadata store.")
+            continue
+        if filter_dict and not matches_filter(record, filter_dict):
+            continue
+        key = _dedup_key(match.id, record)
+        if key in seen:
+            continue
+        seen.add(key)
+        results.append(HydratedMatch(match.id, match.score, record.to_metadata()))
+        if len(results) == RESULT_LIMIT:
+            break
+    return results
+
+def _adaptive_query(dense_vector, sparse_vector, filter_dict, namespaces=(NAMESPACE,)):
+    """Over-fetch ids without metadata, filter and dedup locally, hydrate only the final results."""
+    fetch_plan = plan_adaptive_fetch(filter_dict)
+    if fetch_plan is None:
+        return []
+    fetch_k, server_filter = fetch_plan
+
+    with span("index_query", top_k=fetch_k, include_metadata=False, namespaces=len(namespaces)) as stage:
+        matches = query_namespaces(adaptive_query_kwargs(dense_vector, sparse_vector, fetch_k, server_filter), namespaces)
+        stage.set(matches=len(matches), response_bytes=matches_payload_bytes(matches))
+    print(f"INFO: Adaptive retrieval fetched {len(matches)} ids (top_k={fetch_k}, server_filter={server_filter is not None}).")
+    with span("hydrate", matches=len(matches)):
+        return select_adaptive_results(matches, filter_dict)
+
+def similar_products(product_id, n=4):
+    """"Similar to this" lookup from the precomputed product graph; no embedding or index query."""
+    similar = []
+    for neighbor_id, weight in get_neighbors(product_id, n):
+        record = get_product_record(neighbor_id)
+        if record is None:
+            continue
+        similar.append({
+            "sku": record.get("sku", neighbor_id),
+            "product_name": record.get("product_name", "Product"),
+            "image_url": record.get("image_url") or record.get("detail_page_main_image_url"),
+            "product_detail_url": record.get("product_detail_url", "#"),
+            "price": record.get("price"),
+            "weight": round(weight, 3)
+        })
+    return similar
 
-def generate_response(user_query, search_results, search_params, history):
+def build_response_messages(user_query, search_results, search_params, history):
+    """Chat messages for the answer call, built from the top search results"""
     results_summary = []
     for i, product in enumerate(search_results[:5]):  # Limit to top 5 for prompt size
         result = {
@@ -180,11 +503,8 @@ def generate_response(user_query, search_results, search_params, history):
         }
         results_summary.append(result)
     
-    with open(_get_prompt_path("result.txt"), 'r') as f:
-        result_prompt =  f.read()
-    
-    with open(_get_prompt_path("additional.txt"), 'r') as f:
-        additional_data =  f.read()
+    result_prompt = load_prompt("result.txt")
+    additional_data = load_prompt("additional.txt")
         
     prompt = f"""
     Additional Data : "{additional_data}"
@@ -209,54 +529,239 @@ def generate_response(user_query, search_results, search_params, history):
     {result_prompt}
     """
 
-    with open(_get_prompt_path("role.txt"), 'r') as f:
-        content=f.read()
-    
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "system",
-                "content": content
-             },
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_tokens=800
-    )
+    content = load_prompt("role.txt")
+
+    return [
+        {
+            "role": "system",
+            "content": content
+         },
+        {"role": "user", "content": prompt}
+    ]
+
+def cached_response_lookup(search_results, search_params, history, model=LARGE_MODEL):
+    """Returns (cache_key, cached answer or None) for this response model, plan, result set and history."""
+    cache_key = response_cache_key(search_params, [product.id for product in search_results[:5]], history, model)
+    with span("response_cache") as stage:
+        cached = get_cached_response(cache_key)
+        stage.set(hit=cached is not None)
+    return cache_key, cached
+
+def store_response(cache_key, search_results, response_text, stage):
+    """Caches a fresh answer along with the latency and tokens a later hit will save."""
+    tokens = (stage.attributes.get("prompt_tokens") or 0) + (stage.attributes.get("completion_tokens") or 0)
+    put_cached_response(cache_key, response_text, [product.id for product in search_results[:5]],
+                        stage.duration, tokens)
+
+def generate_response(user_query, search_results, search_params, history, priority=INTERACTIVE, model=LARGE_MODEL):
+    cache_key, cached = cached_response_lookup(search_results, search_params, history, model)
+    if cached is not None:
+        return cached
+
+    messages = build_response_messages(user_query, search_results, search_params, history)
+    with span("response", model=model, request_bytes=payload_bytes(messages)) as stage:
+        response = chat_completion(
+            openai, priority,
+            model=model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=800
+        )
+        stage.set(response_bytes=payload_bytes(response.choices[0].message.content), **usage_attributes(response))
+    store_response(cache_key, search_results, response.choices[0].message.content, stage)
     
     return response.choices[0].message.content
 
-def product_search_bot(user_query: str, history: str):
-    """Main bot handler. Returns a dictionary with response and results."""
-    if not _clients_initialized:
-        if not initialize_clients():
-            return {
-                "success": False,
-                "response": "Critical Error: Failed to initialize API clients. Please check server logs or .env configuration.",
-                "query_interpretation": None, "results": [], "result_count": 0
-            }
-    
-    search_params = generate_search_query(user_query)
-    
-    search_results = perform_hybrid_search(search_params)
-    
+def format_results(search_results):
     formatted_results = []
     for item in search_results:
         product = item.metadata
         product["score"] = item.score
         formatted_results.append(product)
-    
-    response_text = generate_response(user_query, search_results, search_params, history)
-    
+    return formatted_results
+
+def _format_price(value):
+    return f"${value:.2f}" if isinstance(value, (int, float)) else "price not available"
+
+def code_lookup_response(search_results):
+    """Template answer for exact code matches, in the same text/****** /image layout as the LLM answers."""
+    lines = ["Here's the product matching that code:" if len(search_results) == 1 else
+             f"Here are the {len(search_results)} products matching those codes:", ""]
+    for product in search_results:
+        metadata = product.metadata
+        details = [metadata.get("brand"), _format_price(metadata.get("price")), metadata.get("quantity_package_info"), metadata.get("status")]
+        lines.append(f"- **{metadata.get('product_name', 'Product')}** (SKU {metadata.get('sku', product.id)}): "
+                     f"{', '.join(str(d) for d in details if d)}. [View product]({metadata.get('product_detail_url', '#')})")
+    lines += ["", "******"]
+    lines += [f"![{product.metadata.get('product_name', 'Product')}]({product.metadata['image_url']})"
+              for product in search_results if product.metadata.get("image_url")]
+    return "\n".join(lines)
+
+def answer_from_code_index(user_query: str, conversation=None):
+    """Answers pasted SKU/UPC/item codes from the local indexes without any LLM or Pinecone call.
+
+    Returns None when the query is not a pure code lookup or a code has no local record.
+    """
+    product_ids = match_code_query(user_query)
+    if not product_ids:
+        return None
+    with trace_turn() as trace:
+        with span("code_lookup", codes=len(product_ids)):
+            search_results = [
+                HydratedMatch(product_id, 1.0, record.to_metadata())
+                for product_id, record in ((pid, get_product_record(pid)) for pid in product_ids[:RESULT_LIMIT])
+                if record is not None
+            ]
+    if not search_results:
+        return None
+    record_route(CODE_LOOKUP, trace)
+    if conversation is not None:
+        conversation.record_turn(user_query, None, search_results)
+    formatted_results = format_results(search_results)
+    return {
+        "success": True,
+        "response": code_lookup_response(search_results),
+        "query_interpretation": json.dumps({"exact_codes": product_ids}),
+        "results": formatted_results,
+        "result_count": len(formatted_results),
+        "route": CODE_LOOKUP,
+        "trace": trace.to_dict(),
+        "stage_percentiles": stage_percentiles(),
+        "model_router": model_router_metrics()
+    }
+
+def answer_greeting(user_query: str):
+    """Answers greetings and small talk from the canned template without any LLM or Pinecone call,
+    suggesting a couple of products from the local store; thanks and goodbyes get a short closing.
+
+    Returns None when the turn is not a greeting.
+    """
+    if classify_turn(user_query) != GREETING:
+        return None
+    with trace_turn() as trace:
+        with span("greeting") as stage:
+            closing = is_closing(user_query)
+            records = () if closing else ((pid, get_product_record(pid)) for pid in sample_product_ids(GREETING_PICKS * 5))
+            picks = [HydratedMatch(pid, 1.0, record.to_metadata())
+                     for pid, record in records if record is not None and record.get("image_url")][:GREETING_PICKS]
+            stage.set(picks=len(picks))
+    record_route(GREETING, trace)
+    formatted_results = format_results(picks)
+    return {
+        "success": True,
+        "response": closing_response() if closing else greeting_response(picks),
+        "query_interpretation": None,
+        "results": formatted_results,
+        "result_count": len(formatted_results),
+        "route": GREETING,
+        "trace": trace.to_dict(),
+        "stage_percentiles": stage_percentiles(),
+        "model_router": model_router_metrics()
+    }
+
+# The steps below are shared by product_search_bot and the async pipeline so the two cannot drift apart
+
+def begin_turn(user_query, history, conversation=None):
+    """Returns (answer, history): the finished answer for code lookups and greetings, else None and the
+    history for the response prompt. With a ConversationState its bounded summary replaces history."""
+    code_answer = answer_from_code_index(user_query, conversation)
+    if code_answer is not None:
+        return code_answer, history
+    greeting = answer_greeting(user_query)
+    if greeting is not None:
+        return greeting, history
+    if conversation is not None:
+        history = conversation.history_context()
+    return None, history
+
+def correct_turn(user_query):
+    """(corrected_query, route). Misspelled brands and cheese names are fixed before planning and embedding."""
+    with span("spell_correct"):
+        corrected_query = correct_query(user_query)
+    return corrected_query, classify_turn(user_query)
+
+def reuse_plan(corrected_query, conversation=None):
+    """(search_params, context): the previous plan refined for follow-ups like "cheaper ones", else None and
+    the previous search as context for the LLM plan."""
+    if conversation is None:
+        return None, ""
+    with span("follow_up") as follow_up:
+        search_params = conversation.follow_up_plan(corrected_query)
+        follow_up.set(reused=search_params is not None)
+    return search_params, "" if search_params is not None else conversation.plan_context()
+
+def plan_turn(corrected_query, conversation=None):
+    """Search plan for this turn: refinements reuse the previous plan, anything else is planned by the LLM."""
+    search_params, context = reuse_plan(corrected_query, conversation)
+    if search_params is not None:
+        return search_params
+    return generate_search_query(corrected_query, context=context)
+
+def add_web_context(history, web_future):
+    """Appends snippets from a web search started alongside the pipeline. Returns (history, web_result)."""
+    with span("web_context") as stage:
+        web_result = collect_web_result(web_future, WEB_CONTEXT_WAIT_SECONDS)
+        context = format_web_context(web_result)
+        stage.set(included=bool(context))
+    return "\n\n".join(part for part in (history, context) if part), web_result
+
+def turn_result(trace, user_query, corrected_query, route, search_params, search_results, response_text,
+                conversation=None, web_result=None):
+    """Records a finished search turn into the conversation and route stats, and builds its result."""
+    if conversation is not None:
+        conversation.record_turn(corrected_query, search_params, search_results)
+    record_route(route, trace)
+    formatted_results = format_results(search_results)
     return {
         "success": True,
         "response": response_text,
         "query_interpretation": search_params,
         "results": formatted_results,
-        "result_count": len(formatted_results)
+        "result_count": len(formatted_results),
+        "corrected_query": corrected_query if corrected_query != user_query else None,
+        "web_results": (web_result or {}).get("results", []),
+        "route": route,
+        "trace": trace.to_dict(),
+        "stage_percentiles": stage_percentiles(),
+        "response_cache": response_cache_metrics(),
+        "llm_gateway": llm_gateway_metrics(),
+        "model_router": model_router_metrics()
     }
 
+def product_search_bot(user_query: str, history: str, conversation=None, web_future=None):
+    """Main bot handler. Returns a dictionary with response and results.
+
+    With a ConversationState, its bounded summary replaces history and the turn is recorded into it.
+    web_future is a web_search.submit_web_search() future; its snippets join the response prompt
+    if it finishes in time.
+    """
+    if not _clients_initialized:
+        if not initialize_clients():
+            return {
+                "success": False,
+                "response": "Critical Error: Failed to initialize API clients. Please check server logs or .env configuration.",
+                "query_interpretation": None, "results": [], "result_count": 0
+            }
+
+    answer, history = begin_turn(user_query, history, conversation)
+    if answer is not None:
+        return answer
+    
+    with trace_turn() as trace:
+        corrected_query, route = correct_turn(user_query)
+        search_params = plan_turn(corrected_query, conversation)
+        
+        search_results = perform_hybrid_search(search_params)
+        
+        web_result = None
+        if web_future is not None:
+            history, web_result = add_web_context(history, web_future)
+        
+        response_text = generate_response(user_query, search_results, search_params, history,
+                                          model=response_model(route))
+    return turn_result(trace, user_query, corrected_query, route, search_params, search_results, response_text,
+                       conversation, web_result)
+
 if __name__ == "__main__":
     print("Attempting to initialize clients for direct module test...")
     if initialize_clients():
@@ -264,7 +769,7 @@ if __name__ == "__main__":
 
         test_query_2 = "who are you?"
         print(f"\n--- Test 2: Query: '{test_query_2}' ---")
-        response_2 = product_search_bot(test_query_2)
+        response_2 = product_search_bot(test_query_2, "")
         print(response_2['response'])
     else:
         print("\nClient initialization failed. Cannot run tests.")
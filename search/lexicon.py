@@ -0,0 +1,267 @@
+import os
+import re
+from bisect import bisect_left
+
+from search.artifacts import load_json_artifact, save_json_artifact
+
+LEXICON_FILE = "lexicon.json"
+
+MAX_EDIT_DISTANCE = 2
+# SymSpell prefix trick: delete variants are generated from the first PREFIX_LENGTH characters only
+PREFIX_LENGTH = 7
+MIN_CORRECTION_LENGTH = 5  # shorter words are too ambiguous to correct
+MAX_PREFIX_WORDS = 20
+# Real words are never corrected: the system word list when there is one, plus these everyday query words
+DICTIONARY_PATH = os.environ.get("CHEESEBOT_DICTIONARY", "/usr/share/dict/words")
+COMMON_WORDS = {
+    "about", "above", "after", "again", "aged", "all", "also", "another", "around", "below", "between", "block",
+    "blocks", "bland", "bold", "buttery", "cheaper", "cheapest", "cheese", "cheeses", "classic", "cooking",
+    "could", "creamy", "crumbly", "cubes", "dairy", "delicious", "diced", "favorite", "firm", "flavor",
+    "flavored", "flavors", "flavour", "food", "fresh", "fruity", "grilled", "healthy", "heavy", "large",
+    "light", "little", "local", "lower", "mellow", "melting", "nutty", "other", "party", "pasta", "pizza",
+    "platter", "please", "price", "prices", "pungent", "quality", "recommend", "salad", "salty", "sandwich",
+    "sandwiches", "semi", "should", "similar", "small", "smoky", "smoked", "snack", "snacks", "softer", "spicy",
+    "stinky", "strong", "sweet", "tangy", "there", "these", "thing", "things", "those", "under", "which",
+    "would", "young",
+}
+STOP_WORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "by", "can", "do", "for", "from", "have", "how", "i",
+    "in", "is", "it", "like", "me", "more", "most", "my", "no", "not", "of", "on", "or", "some", "than",
+    "that", "the", "this", "to", "want", "was", "what", "with", "you", "your",
+}
+# Stripped before comparing stems, so "cheeses" never becomes "cheese" nor "smoky" "smoke"
+INFLECTION_SUFFIXES = ("ies", "iest", "ier", "ing", "est", "es", "ed", "er", "ly", "s", "y", "e")
+
+BRAND, CATEGORY, PRODUCT = 0, 1, 2
+
+_words = None
+_dictionary = None
+_deletes = None
+_sorted_words = []
+_phrases = []  # sorted (normalized, rank, display)
+_phrase_keys = []
+_phrases_by_word = {}
+
+
+def _tokens(text):
+    return re.findall(r"[^\W_]+", str(text).lower())
+
+
+def _normalize(text):
+    return " ".join(_tokens(text))
+
+
+def build_lexicon(all_metadata: list) -> dict:
+    """Word frequencies and display phrases (brands, categories, product names) for correction and autocomplete.
+
+    Only brand and product-name words ("terms") are correction targets.
+    """
+    words = {}
+    terms = set()
+    phrases = {}
+    for metadata in all_metadata:
+        name = metadata.get("product_name_detail") or metadata.get("product_name")
+        brand = metadata.get("brand")
+        categories = metadata.get("categories") or ""
+        if isinstance(categories, list):
+            categories = " / ".join(categories)
+        category_parts = [part.strip() for part in categories.split("/") if part.strip()]
+        for text in [name, brand] + category_parts:
+            for token in _tokens(text or ""):
+                if not token.isdigit():
+                    words[token] = words.get(token, 0) + 1
+        terms.update(token for token in _tokens(f"{name or ''} {brand or ''}") if token.isalpha())
+        if brand:
+            phrases[brand] = min(phrases.get(brand, PRODUCT), BRAND)
+        for part in category_parts:
+            phrases[part] = min(phrases.get(part, PRODUCT), CATEGORY)
+        if name:
+            phrases.setdefault(name, PRODUCT)
+    print(f"INFO: Lexicon has {len(words)} words and {len(phrases)} phrases.")
+    return {"words": words, "terms": sorted(terms),
+            "phrases": [[display, rank] for display, rank in sorted(phrases.items())]}
+
+
+def save_lexicon(lexicon: dict):
+    return save_json_artifact(LEXICON_FILE, lexicon)
+
+
+def _delete_variants(word, distance):
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {candidate[:i] + candidate[i + 1:] for candidate in frontier for i in range(len(candidate))}
+        variants |= frontier
+    return variants
+
+
+def _load_dictionary():
+    words = set(COMMON_WORDS) | STOP_WORDS
+    try:
+        with open(DICTIONARY_PATH, 'r', encoding='utf-8', errors='ignore') as f:
+            words.update(line.strip().lower() for line in f if line.strip().isalpha())
+    except OSError:
+        pass
+    return words
+
+
+def _stem(word):
+    for _ in range(2):  # "smokey" -> "smoke" -> "smok"
+        for suffix in INFLECTION_SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)]
+                break
+    return word
+
+
+def load_lexicon():
+    """Loads the lexicon and builds the delete, prefix and phrase indexes. Returns True when available."""
+    global _words, _dictionary, _deletes, _sorted_words, _phrases, _phrase_keys, _phrases_by_word
+    lexicon = load_json_artifact(LEXICON_FILE)
+    if not lexicon:
+        _words = _deletes = None
+        return False
+
+    _words = lexicon["words"]
+    if _dictionary is None:
+        _dictionary = _load_dictionary()
+    _deletes = {}
+    # Lexicons built before "terms" existed correct towards every catalog word
+    for word in lexicon.get("terms") or _words:
+        if len(word) >= MIN_CORRECTION_LENGTH - MAX_EDIT_DISTANCE:
+            for variant in _delete_variants(word[:PREFIX_LENGTH], MAX_EDIT_DISTANCE):
+                _deletes.setdefault(variant, []).append(word)
+    _sorted_words = sorted(_words)
+
+    _phrases = sorted((_normalize(display), rank, display) for display, rank in lexicon["phrases"])
+    _phrase_keys = [normalized for normalized, _, _ in _phrases]
+    _phrases_by_word = {}
+    for position, (normalized, _, _) in enumerate(_phrases):
+        for token in set(normalized.split()):
+            _phrases_by_word.setdefault(token, []).append(position)
+    return True
+
+
+def is_lexicon_loaded():
+    return _words is not None
+
+
+def edit_distance(a, b, max_distance):
+    """Optimal string alignment distance, or max_distance + 1 once it is exceeded."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # Typos are local: only the differing middle needs the quadratic table
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return len(a) + len(b)
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def correct_word(word):
+    """Closest brand or product-name word within the edit budget (1 for short words, 2 from 8 letters), else
+    the word itself. Catalog, dictionary and stop words are kept, as are inflections of the closest term."""
+    if (_words is None or word in _words or word in _dictionary or len(word) < MIN_CORRECTION_LENGTH
+            or not word.isalpha()):
+        return word
+    max_distance = 1 if len(word) < 8 else MAX_EDIT_DISTANCE
+    best = None
+    seen = set()
+    level = {word[:PREFIX_LENGTH]}
+    # A word at distance d is reachable with at most d query deletes, so stop past the best distance found
+    for depth in range(max_distance + 1):
+        if best is not None and depth > best[0]:
+            break
+        for variant in level:
+            for candidate in _deletes.get(variant, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                bound = best[0] if best else max_distance
+                if abs(len(candidate) - len(word)) > bound:
+                    continue
+                distance = edit_distance(word, candidate, bound)
+                if distance <= bound:
+                    key = (distance, -_words[candidate], candidate)
+                    if best is None or key < best:
+                        best = key
+        level = {variant[:i] + variant[i + 1:] for variant in level for i in range(len(variant))}
+    if best is None or _stem(best[2]) == _stem(word):
+        return word
+    corrected = best[2]
+    if word.endswith("s") and not corrected.endswith("s"):  # keep the plural the user typed
+        corrected += "es" if corrected.endswith(("x", "ch", "sh")) else "s"
+    return corrected
+
+
+def correct_query(text):
+    """Replaces misspelled catalog terms (brands, cheese names, categories) in free text."""
+    if _words is None:
+        return text
+
+    def replace(match):
+        original = match.group(0)
+        corrected = correct_word(original.lower())
+        if corrected == original.lower():
+            return original
+        return corrected.capitalize() if original[:1].isupper() else corrected
+
+    return re.sub(r"[^\W_]+", replace, text)
+
+
+def _words_with_prefix(prefix):
+    matches = []
+    for position in range(bisect_left(_sorted_words, prefix), len(_sorted_words)):
+        word = _sorted_words[position]
+        if not word.startswith(prefix):
+            break
+        matches.append(word)
+    matches.sort(key=lambda word: -_words[word])
+    return matches[:MAX_PREFIX_WORDS]
+
+
+def suggest_completions(text, n=5):
+    """Autocomplete for partial input: phrases starting with it first, then phrases containing a word
+    that starts with its last (spell-corrected) term. Brands rank before categories before products."""
+    if _words is None:
+        return []
+    tokens = _tokens(text)
+    if not tokens:
+        return []
+    last = tokens[-1]
+    if not _words_with_prefix(last):
+        tokens[-1] = last = correct_word(last)
+    prefix = " ".join(tokens)
+
+    positions = []
+    start = bisect_left(_phrase_keys, prefix)
+    for position in range(start, len(_phrases)):
+        if not _phrase_keys[position].startswith(prefix) or len(positions) >= n * 4:
+            break
+        positions.append(position)
+    if len(positions) < n:
+        leading = set(tokens[:-1])
+        for word in _words_with_prefix(last):
+            for position in _phrases_by_word.get(word, ())[:n * 4]:
+                if position not in positions and leading <= set(_phrase_keys[position].split()):
+                    positions.append(position)
+
+    ranked = sorted(positions, key=lambda position: (_phrases[position][1], len(_phrases[position][0])))
+    return [_phrases[position][2] for position in ranked[:n]]
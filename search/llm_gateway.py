@@ -0,0 +1,379 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import itertools
+import threading
+from concurrent.futures import Future
+
+from search.tracing import payload_bytes, span, stage_percentiles
+
+# Per-model OpenAI (requests, tokens) per minute at usage tier 1; DEFAULT_RATE_LIMITS covers other models.
+# CHEESEBOT_LLM_RPM / CHEESEBOT_LLM_TPM override every model, and e.g. CHEESEBOT_LLM_TPM_GPT_4O_MINI
+# overrides one; raise them to the account's tier.
+DEFAULT_RATE_LIMITS = (500, 30000)
+MODEL_RATE_LIMITS = {"gpt-4o": (500, 30000), "gpt-4o-mini": (500, 200000)}
+LLM_MAX_CONCURRENCY = int(os.environ.get("CHEESEBOT_LLM_CONCURRENCY", "16"))
+# 429s and connection errors are retried here, queued behind waiting calls, instead of inside the SDK
+LLM_MAX_RETRIES = 3
+DEFAULT_RETRY_AFTER_SECONDS = 2.0
+DEFAULT_COMPLETION_TOKENS = 512  # budgeted for calls that set no max_tokens
+BYTES_PER_TOKEN = 4
+
+# Queued calls are admitted lowest value first: chat turns go ahead of batch jobs
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+_lock = threading.Lock()
+_limits = {}  # model -> ModelLimits
+_queue = []  # (priority, sequence, _Waiter) for calls waiting on a slot or rate budget
+_sequence = itertools.count()
+_active = 0
+_timer_at = None  # monotonic time of the pending re-dispatch for rate-limited waiters
+_in_flight = {}  # request key -> Future shared by identical concurrent calls
+_stats = {"requests": 0, "coalesced": 0, "rate_limited": 0, "retries": 0, "errors": 0}
+
+
+class TokenBucket:
+    """Refills per_minute units a minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # A call larger than the whole bucket goes once the bucket is full
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level = min(self.capacity, self.level - amount)
+
+
+class ModelLimits:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0  # set from a 429's retry-after
+
+    def wait_time(self, tokens, now):
+        return max(self.paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+
+class _Waiter:
+    __slots__ = ("model", "tokens", "wake", "granted")
+
+    def __init__(self, model, tokens, wake):
+        self.model = model
+        self.tokens = tokens
+        self.wake = wake
+        self.granted = False
+
+
+def rate_limits(model):
+    """(requests, tokens) per minute for model, after the environment overrides."""
+    suffix = re.sub(r"[^A-Z0-9]+", "_", str(model).upper()).strip("_")
+    limits = []
+    for name, default in zip(("CHEESEBOT_LLM_RPM", "CHEESEBOT_LLM_TPM"), MODEL_RATE_LIMITS.get(model, DEFAULT_RATE_LIMITS)):
+        value = os.environ.get(f"{name}_{suffix}") or os.environ.get(name)
+        limits.append(int(value) if value else default)
+    return tuple(limits)
+
+
+def _model_limits(model):
+    limits = _limits.get(model)
+    if limits is None:
+        limits = _limits[model] = ModelLimits(*rate_limits(model))
+    return limits
+
+
+def reset_limits():
+    """Forgets the per-model buckets so changed limits take effect on the next call."""
+    with _lock:
+        _limits.clear()
+
+
+def _dispatch_locked():
+    """Admits queued calls in priority order while there are free slots and rate budget.
+
+    A call held back by its model's limits holds back later calls to that model, so small calls do
+    not starve a large one; calls to other models still go.
+    """
+    global _active
+    now = time.monotonic()
+    retry_in = None
+    held_models = set()
+    for entry in sorted(_queue, key=lambda entry: entry[:2]):
+        if _active >= LLM_MAX_CONCURRENCY:
+            break
+        waiter = entry[2]
+        if waiter.model in held_models:
+            continue
+        limits = _model_limits(waiter.model)
+        delay = limits.wait_time(waiter.tokens, now)
+        if delay > 0:
+            held_models.add(waiter.model)
+            retry_in = delay if retry_in is None else min(retry_in, delay)
+            continue
+        limits.requests.take(1)
+        limits.tokens.take(waiter.tokens)
+        _active += 1
+        waiter.granted = True
+        _queue.remove(entry)
+        waiter.wake()
+    if retry_in is not None:
+        _schedule_dispatch_locked(retry_in)
+
+
+def _schedule_dispatch_locked(delay):
+    global _timer_at
+    at = time.monotonic() + delay
+    if _timer_at is not None and _timer_at <= at:
+        return
+    _timer_at = at
+    timer = threading.Timer(delay, _timed_dispatch)
+    timer.daemon = True
+    timer.start()
+
+
+def _timed_dispatch():
+    global _timer_at
+    with _lock:
+        _timer_at = None
+        _dispatch_locked()
+
+
+def _enqueue_locked(priority, waiter):
+    entry = (priority, next(_sequence), waiter)
+    _queue.append(entry)
+    _dispatch_locked()
+    return entry
+
+
+def _acquire(model, tokens, priority):
+    granted = threading.Event()
+    with span(f"llm_queue_{PRIORITY_NAMES[priority]}", model=model, tokens=tokens):
+        with _lock:
+            _enqueue_locked(priority, _Waiter(model, tokens, granted.set))
+        granted.wait()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def _acquire_async(model, tokens, priority):
+    loop = asyncio.get_running_loop()
+    granted = loop.create_future()
+    waiter = _Waiter(model, tokens, lambda: loop.call_soon_threadsafe(_resolve, granted))
+    with span(f"llm_queue_{PRIORITY_NAMES[priority]}", model=model, tokens=tokens):
+        with _lock:
+            entry = _enqueue_locked(priority, waiter)
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with _lock:
+                if waiter.granted:
+                    _release_locked(model, tokens, None)
+                else:
+                    _queue.remove(entry)
+            raise
+
+
+def _release_locked(model, estimate, used):
+    global _active
+    _active -= 1
+    if used is not None:
+        _model_limits(model).tokens.take(used - estimate)  # settle the estimate against real usage
+    _dispatch_locked()
+
+
+def _release(model, estimate, used=None):
+    with _lock:
+        _release_locked(model, estimate, used)
+
+
+def estimate_tokens(request):
+    """Tokens a chat completion request counts against TPM: its prompt plus the completion budget."""
+    completion = request.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return payload_bytes(request.get("messages")) // BYTES_PER_TOKEN + completion
+
+
+def _used_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+def _retry_delay(error, model, attempt):
+    """Seconds to back off before retrying a failed call, or None when it should not be retried."""
+    status = getattr(error, "status_code", None)
+    with _lock:
+        if status == 429:
+            headers = getattr(getattr(error, "response", None), "headers", None) or {}
+            try:
+                retry_after = float(headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = DEFAULT_RETRY_AFTER_SECONDS
+            # Every queued call to this model waits out the limit rather than hitting it again
+            limits = _model_limits(model)
+            limits.paused_until = max(limits.paused_until, time.monotonic() + retry_after)
+            _stats["rate_limited"] += 1
+            _dispatch_locked()
+            delay = 0.0
+        elif (status is not None and status >= 500) or type(error).__name__ in ("APIConnectionError", "APITimeoutError"):
+            delay = DEFAULT_RETRY_AFTER_SECONDS * 2 ** attempt
+        else:
+            delay = None
+        if delay is None or attempt >= LLM_MAX_RETRIES:
+            _stats["errors"] += 1
+            return None
+        _stats["retries"] += 1
+        return delay
+
+
+def _call(client, priority, request):
+    model = request.get("model")
+    estimate = estimate_tokens(request)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        _acquire(model, estimate, priority)
+        used = None
+        try:
+            response = client.chat.completions.create(**request)
+            used = _used_tokens(response)
+            return response
+        except Exception as e:
+            delay = _retry_delay(e, model, attempt)
+            if delay is None:
+                raise
+        finally:
+            _release(model, estimate, used)
+        time.sleep(delay)
+
+
+async def _call_async(client, priority, request):
+    model = request.get("model")
+    estimate = estimate_tokens(request)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        await _acquire_async(model, estimate, priority)
+        used = None
+        try:
+            response = await client.chat.completions.create(**request)
+            used = _used_tokens(response)
+            return response
+        except Exception as e:
+            delay = _retry_delay(e, model, attempt)
+            if delay is None:
+                raise
+        finally:
+            _release(model, estimate, used)
+        await asyncio.sleep(delay)
+
+
+def _request_key(priority, request):
+    return hashlib.sha256(json.dumps([priority, request], sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _join_in_flight(key):
+    """(future, owner): the owner makes the call, everyone else shares its future."""
+    with _lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            _stats["coalesced"] += 1
+            return future, False
+        future = _in_flight[key] = Future()
+        _stats["requests"] += 1
+        return future, True
+
+
+def _finish_in_flight(key, future, response=None, error=None):
+    with _lock:
+        del _in_flight[key]
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(response)
+
+
+def chat_completion(client, priority=INTERACTIVE, **request):
+    """client.chat.completions.create(**request) within the rate limits and concurrency cap.
+
+    Calls wait in one priority queue; identical calls already in flight share a single response.
+    """
+    key = _request_key(priority, request)
+    future, owner = _join_in_flight(key)
+    if not owner:
+        return future.result()
+    try:
+        response = _call(client, priority, request)
+    except BaseException as e:
+        _finish_in_flight(key, future, error=e)
+        raise
+    _finish_in_flight(key, future, response)
+    return response
+
+
+async def chat_completion_async(client, priority=INTERACTIVE, **request):
+    """Async counterpart of chat_completion for AsyncOpenAI clients; shares its queue and limits."""
+    key = _request_key(priority, request)
+    future, owner = _join_in_flight(key)
+    if not owner:
+        # Shielded so a cancelled follower does not cancel the owner's call
+        return await asyncio.shield(asyncio.wrap_future(future))
+    try:
+        response = await _call_async(client, priority, request)
+    except BaseException as e:
+        _finish_in_flight(key, future, error=e)
+        raise
+    _finish_in_flight(key, future, response)
+    return response
+
+
+async def stream_chat_completion_async(client, priority=INTERACTIVE, **request):
+    """Yields the chunks of a streamed completion. The call holds its slot until the stream ends."""
+    model = request.get("model")
+    estimate = estimate_tokens(request)
+    with _lock:
+        _stats["requests"] += 1
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        await _acquire_async(model, estimate, priority)
+        try:
+            stream = await client.chat.completions.create(stream=True, **request)
+            break
+        except BaseException as e:
+            # Cancellation (a client disconnect) gives the slot back too
+            _release(model, estimate)
+            if not isinstance(e, Exception):
+                raise
+            delay = _retry_delay(e, model, attempt)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
+    used = None
+    try:
+        async for chunk in stream:
+            # With stream_options={"include_usage": True} the last chunk carries the usage
+            used = _used_tokens(chunk) or used
+            yield chunk
+    finally:
+        _release(model, estimate, used)
+
+
+def llm_gateway_metrics():
+    """Call counters, current slots and queue depth, and queue wait percentiles per priority."""
+    percentiles = stage_percentiles()
+    with _lock:
+        queued = {name: sum(1 for entry in _queue if entry[0] == priority) for priority, name in PRIORITY_NAMES.items()}
+        return {
+            **_stats,
+            "active": _active,
+            "queued": queued,
+            "queue_wait": {name: percentiles.get(f"llm_queue_{name}") for name in PRIORITY_NAMES.values()},
+        }
@@ -0,0 +1,291 @@
+import os
+import json
+import random
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from search.artifacts import get_artifact_path, load_json_artifact
+from search.catalog import MANIFEST_FILE, ColumnarTable, write_table
+from search.filters import METADATA_SCHEMA, matches_condition
+
+METADATA_STORE_DIR = "product_metadata"  # columnar table, memory-mapped on load
+LEGACY_STORE_FILE = "product_metadata.json"  # row-oriented JSON written by older ingests
+
+# Column order of the in-memory rows and of ProductRecord slots
+RECORD_FIELDS = tuple(METADATA_SCHEMA)
+# Low-cardinality string fields are dictionary-encoded on disk
+CATEGORY_FIELDS = {
+    "brand", "brand_supplier_detail", "status", "categories", "quantity_package_info", "dimensions",
+    "proposition_65_warning", "table_caption",
+}
+STORE_COLUMN_KINDS = {
+    "_id": "string",
+    **{
+        field: "category" if field in CATEGORY_FIELDS else
+        "int" if field.endswith("_count") else
+        {"number": "float", "list": "list"}.get(field_type, "string")
+        for field, field_type in METADATA_SCHEMA.items()
+    },
+}
+
+_table = None
+_ids = None  # product ids in row order
+_row_by_id = {}
+_records = {}  # ProductRecords built so far; every one of them for legacy JSON stores
+FILTER_MASK_CACHE_SIZE = 64
+_filter_masks = OrderedDict()  # compiled filter JSON -> row mask
+_mask_lock = threading.Lock()
+_column_codes = {}  # field -> (distinct values, int32 position of each row's value, -1 = missing)
+
+
+class ProductRecord:
+    """Compact per-product metadata row. Behaves like a read-only dict for filters."""
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, values):
+        for field, value in zip(RECORD_FIELDS, values):
+            setattr(self, field, value)
+
+    def __contains__(self, key):
+        return key in RECORD_FIELDS and getattr(self, key) is not None
+
+    def __getitem__(self, key):
+        if key not in RECORD_FIELDS:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if key not in RECORD_FIELDS:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def to_metadata(self):
+        """Returns a fresh metadata dict in the same shape Pinecone would return."""
+        metadata = {}
+        for field in RECORD_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                metadata[field] = list(value) if isinstance(value, list) else value
+        return metadata
+
+
+class HydratedMatch:
+    """Query match whose metadata comes from the local store instead of the index."""
+    __slots__ = ("id", "score", "metadata")
+
+    def __init__(self, id, score, metadata):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+
+
+def build_metadata_store(all_metadata: list) -> dict:
+    """Packs ingest metadata into positional rows keyed by vector id (the SKU when present)."""
+    rows = {}
+    for metadata in all_metadata:
+        rows[metadata["_id"]] = [metadata.get(field) for field in RECORD_FIELDS]
+    return {"fields": list(RECORD_FIELDS), "rows": rows}
+
+
+def save_metadata_store(store: dict):
+    rows = [
+        {"_id": product_id, **{field: value for field, value in zip(store["fields"], row)}}
+        for product_id, row in store["rows"].items()
+    ]
+    return write_table(get_artifact_path(METADATA_STORE_DIR), rows, STORE_COLUMN_KINDS)
+
+
+def _open_table():
+    directory = get_artifact_path(METADATA_STORE_DIR)
+    return ColumnarTable(directory) if os.path.exists(os.path.join(directory, MANIFEST_FILE)) else None
+
+
+def _record_values(table, row):
+    return [table.value(field, row) if field in table.columns else None for field in RECORD_FIELDS]
+
+
+def load_saved_store():
+    """The store as last written by ingest, in build_metadata_store's shape, or None."""
+    table = _open_table()
+    if table is None:
+        return load_json_artifact(LEGACY_STORE_FILE)
+    ids = table.strings("_id")
+    return {"fields": list(RECORD_FIELDS), "rows": {product_id: _record_values(table, row) for row, product_id in enumerate(ids)}}
+
+
+def changed_product_ids(previous_store, store):
+    """Ids added, removed or modified between two store artifacts."""
+    if not previous_store or "rows" not in previous_store:
+        return []
+    previous_fields = previous_store.get("fields", [])
+    fields = store.get("fields", [])
+
+    def as_dict(store_fields, row):
+        return {field: value for field, value in zip(store_fields, row) if value is not None}
+
+    changed = []
+    for product_id in set(previous_store["rows"]) | set(store["rows"]):
+        before = previous_store["rows"].get(product_id)
+        after = store["rows"].get(product_id)
+        if before is None or after is None or as_dict(previous_fields, before) != as_dict(fields, after):
+            changed.append(product_id)
+    return sorted(changed)
+
+
+def load_metadata_store():
+    """Opens the local metadata store. Returns True when it is available.
+
+    Columnar stores are memory-mapped and records are decoded on first access; legacy JSON
+    stores are read whole.
+    """
+    global _table, _ids, _row_by_id, _records
+    with _mask_lock:
+        _filter_masks.clear()
+        _column_codes.clear()
+    table = _open_table()
+    if table is not None:
+        _table, _ids, _records = table, table.strings("_id"), {}
+        _row_by_id = {product_id: row for row, product_id in enumerate(_ids)}
+        print(f"INFO: Mapped {len(_ids)} products from the local metadata store.")
+        return True
+
+    store = load_json_artifact(LEGACY_STORE_FILE)
+    if not isinstance(store, dict) or "rows" not in store:
+        _table, _ids, _row_by_id, _records = None, None, {}, {}
+        return False
+    fields = store.get("fields", [])
+    # Remap columns by name in case the artifact was written with a different field order
+    positions = [fields.index(field) if field in fields else None for field in RECORD_FIELDS]
+    _records = {
+        product_id: ProductRecord([row[pos] if pos is not None else None for pos in positions])
+        for product_id, row in store["rows"].items()
+    }
+    _table, _ids, _row_by_id = None, list(_records), {}
+    print(f"INFO: Loaded {len(_records)} products into the local metadata store.")
+    return True
+
+
+def is_metadata_store_loaded():
+    return _ids is not None
+
+
+def store_size():
+    return len(_ids) if _ids else 0
+
+
+def iter_products():
+    """Yields (product_id, ProductRecord) pairs without building metadata dicts."""
+    return ((product_id, get_product_record(product_id)) for product_id in (_ids or ()))
+
+
+def sample_product_ids(count):
+    """Up to count distinct product ids picked at random from the loaded store."""
+    return random.sample(_ids, min(count, len(_ids))) if _ids else []
+
+
+def get_product_record(product_id):
+    record = _records.get(product_id)
+    if record is None and _table is not None:
+        row = _row_by_id.get(product_id)
+        if row is not None:
+            record = _records[product_id] = ProductRecord(_record_values(_table, row))
+    return record
+
+
+def get_product_metadata(product_id):
+    """Returns a fresh metadata dict so callers can annotate it freely."""
+    record = get_product_record(product_id)
+    return record.to_metadata() if record is not None else None
+
+
+def hydrate_matches(matches):
+    """Attaches local metadata to id-only matches. Returns (hydrated, missing_ids)."""
+    hydrated = []
+    missing_ids = []
+    for match in matches:
+        metadata = get_product_metadata(match.id)
+        if metadata is None:
+            missing_ids.append(match.id)
+        hydrated.append(HydratedMatch(match.id, match.score, metadata))
+    return hydrated, missing_ids
+
+
+def _codes(field):
+    """Distinct values of a column and, per row, the position of its value among them (-1 = missing)."""
+    encoded = _column_codes.get(field)
+    if encoded is None:
+        column = _table.columns[field]
+        if column["kind"] == "category":
+            encoded = (column["values"], np.asarray(_table._array(f"{field}.codes.npy")))
+        elif column["kind"] in ("float", "int"):
+            numbers = np.asarray(_table.numbers(field))
+            present = ~np.isnan(numbers)
+            values, inverse = np.unique(numbers[present], return_inverse=True)
+            codes = np.full(len(numbers), -1, dtype=np.int32)
+            codes[present] = inverse
+            encoded = (values.tolist(), codes)
+        else:
+            strings = _table.strings(field)
+            values = sorted({value for value in strings if value is not None})
+            positions = {value: code for code, value in enumerate(values)}
+            encoded = (values, np.fromiter((positions.get(value, -1) if value is not None else -1 for value in strings),
+                                           dtype=np.int32, count=len(strings)))
+        _column_codes[field] = encoded
+    return encoded
+
+
+def _mask(filter_dict):
+    rows = np.ones(len(_ids), dtype=np.bool_)
+    for key, condition in filter_dict.items():
+        if key in ("$and", "$or"):
+            masks = [_mask(sub) for sub in condition]
+            if any(mask is None for mask in masks):
+                return None
+            combine = np.logical_and if key == "$and" else np.logical_or
+            rows &= combine.reduce(masks) if masks else np.full(len(_ids), key == "$and")
+            continue
+        # Same rules as matches_filter: a missing value passes only negative conditions
+        missing_ok = isinstance(condition, dict) and set(condition) <= {"$ne", "$nin"}
+        if key not in RECORD_FIELDS or key not in _table.columns:
+            if not missing_ok:
+                rows[:] = False
+            continue
+        if _table.columns[key]["kind"] not in ("category", "float", "int", "string"):
+            return None
+        values, codes = _codes(key)
+        # Evaluated once per distinct value; the last slot is for missing values (code -1)
+        lookup = np.fromiter((matches_condition(value, condition) for value in values), dtype=np.bool_, count=len(values))
+        rows &= np.append(lookup, missing_ok)[codes]
+    return rows
+
+
+def filter_mask(filter_dict):
+    """Boolean mask over the store's rows (product_ids order) of the products passing a compiled filter,
+    computed from the columns without building records and cached per filter. None for legacy JSON
+    stores, whose records are checked with matches_filter instead."""
+    if _table is None:
+        return None
+    cache_key = json.dumps(filter_dict, sort_keys=True)
+    with _mask_lock:
+        mask = _filter_masks.get(cache_key)
+        if mask is None:
+            mask = _mask(filter_dict)
+            if mask is None:
+                return None
+            _filter_masks[cache_key] = mask
+            while len(_filter_masks) > FILTER_MASK_CACHE_SIZE:
+                _filter_masks.popitem(last=False)
+        else:
+            _filter_masks.move_to_end(cache_key)
+    return mask
+
+
+def store_row_positions():
+    """Product id -> row of the columnar store; empty for legacy JSON stores."""
+    return _row_by_id
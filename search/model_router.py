@@ -0,0 +1,162 @@
+import os
+import re
+import threading
+
+# Query planning always uses the small model; answers use it too unless the turn asks for a comparison
+PLAN_MODEL = os.environ.get("CHEESEBOT_PLAN_MODEL", "gpt-4o-mini")
+RESPONSE_MODEL = os.environ.get("CHEESEBOT_RESPONSE_MODEL", "gpt-4o-mini")
+LARGE_MODEL = os.environ.get("CHEESEBOT_LARGE_MODEL", "gpt-4o")
+# USD per million (input, output) tokens; savings are priced against LARGE_MODEL doing every call
+MODEL_PRICES = {"gpt-4o": (2.50, 10.00), "gpt-4o-mini": (0.15, 0.60)}
+BYTES_PER_TOKEN = 4  # for calls whose backend reports no usage
+
+GREETING = "greeting"  # canned reply, no backend call
+CODE_LOOKUP = "code_lookup"  # pasted SKU/UPC answered from the local code index
+SEARCH = "search"
+COMPARATIVE = "comparative"
+ROUTES = (GREETING, CODE_LOOKUP, SEARCH, COMPARATIVE)
+
+# A turn is a greeting only when it is made of nothing but these phrases ("hi!", "hello, who are you?")
+GREETING_PATTERN = re.compile(
+    r"^(?:(?:hi+|hello|hey+|hiya|howdy|yo|greetings|good (?:morning|afternoon|evening|day))"
+    r"(?: there| again| (?:cheese)?bot| assistant)?"
+    r"|who are you|what are you|what can you do|what do you do|how are you(?: doing)?|how is it going"
+    r"|nice to meet you"
+    r")(?: (?:hi+|hello|hey+|who are you|what can you do|how are you(?: doing)?|thanks|thank you))*$"
+)
+# Thanks, acknowledgements and goodbyes ("ok thanks!", "bye") get a short closing instead of the greeting
+CLOSING_PATTERN = re.compile(
+    r"^(?:(?:thanks|thank you|thx|ty)(?: (?:so |very )?much| a lot)?|ok(?:ay)?|got it|great|perfect|cool"
+    r"|bye|goodbye|see you|good night)"
+    r"(?: (?:thanks|thank you|ok(?:ay)?|bye|goodbye|see you|(?:so |very )?much|a lot))*$"
+)
+COMPARATIVE_PATTERN = re.compile(
+    r"\b(?:compare[sd]?|comparing|comparison|versus|vs|differences?|differ|better|best|worse|worst"
+    r"|prefer(?:able)?|pros and cons|trade ?offs?)\b|\bwhich\b.*\bor\b"
+)
+GREETING_TEXT = "Hi, I am Cheese Product Assistant, how can I assist you?"
+CLOSING_TEXT = "You're welcome! Let me know if there is anything else I can help you find."
+
+_lock = threading.Lock()
+_stats = {route: {"turns": 0, "seconds": 0.0, "cost": 0.0, "large_model_cost": 0.0} for route in ROUTES}
+_call_latency = {}  # (stage, model) -> [calls, seconds]
+
+
+def _normalize(text):
+    return " ".join(re.sub(r"[^a-z0-9 ]+", " ", (text or "").lower()).split())
+
+
+def classify_turn(user_query):
+    """Route for a user turn, decided locally from its wording. Anything not recognized is a search."""
+    text = _normalize(user_query)
+    if text and (GREETING_PATTERN.match(text) or CLOSING_PATTERN.match(text)):
+        return GREETING
+    if COMPARATIVE_PATTERN.search(text):
+        return COMPARATIVE
+    return SEARCH
+
+
+def response_model(route):
+    return LARGE_MODEL if route == COMPARATIVE else RESPONSE_MODEL
+
+
+def is_closing(user_query):
+    """True for a thanks, acknowledgement or goodbye turn, which the greeting route answers with CLOSING_TEXT."""
+    return bool(CLOSING_PATTERN.match(_normalize(user_query)))
+
+
+def closing_response():
+    return "\n".join([CLOSING_TEXT, "", "******"])
+
+
+def greeting_response(products=()):
+    """The canned greeting from the answer prompt, with a small recommendation in the usual text/******/image layout."""
+    lines = [GREETING_TEXT]
+    if products:
+        lines += ["", "A couple of cheeses from the catalog to get you started:"]
+        lines += [f"- **{product.metadata.get('product_name', 'Product')}**"
+                  f" ([View product]({product.metadata.get('product_detail_url', '#')}))" for product in products]
+    lines += ["", "******"]
+    lines += [f"![{product.metadata.get('product_name', 'Product')}]({product.metadata['image_url']})"
+              for product in products if product.metadata.get("image_url")]
+    return "\n".join(lines)
+
+
+def _cost(model, prompt_tokens, completion_tokens):
+    input_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES[LARGE_MODEL])
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1e6
+
+
+def record_route(route, trace):
+    """Adds a finished turn to its route's share, latency and model cost.
+
+    Token counts come from the LLM spans of the turn; spans without usage are estimated from their
+    payload sizes.
+    """
+    cost = large_model_cost = 0.0
+    calls = []
+    for span in trace.spans:
+        model = span.attributes.get("model")
+        if not model or span.name not in ("plan", "response"):
+            continue
+        prompt_tokens = span.attributes.get("prompt_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = span.attributes.get("request_bytes", 0) // BYTES_PER_TOKEN
+        completion_tokens = span.attributes.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = span.attributes.get("response_bytes", 0) // BYTES_PER_TOKEN
+        cost += _cost(model, prompt_tokens, completion_tokens)
+        large_model_cost += _cost(LARGE_MODEL, prompt_tokens, completion_tokens)
+        calls.append(((span.name, model), span.duration))
+    with _lock:
+        stats = _stats[route]
+        stats["turns"] += 1
+        stats["seconds"] += (trace.end or trace.start) - trace.start
+        stats["cost"] += cost
+        stats["large_model_cost"] += large_model_cost
+        for key, seconds in calls:
+            latency = _call_latency.setdefault(key, [0, 0.0])
+            latency[0] += 1
+            latency[1] += seconds
+
+
+def model_router_metrics():
+    """Share, mean latency, model cost and savings per route, and mean LLM call latency per model.
+
+    Turns that skip the LLM are credited with the mean large-model cost and the mean latency of
+    the turns that did call it.
+    """
+    with _lock:
+        stats = {route: dict(values) for route, values in _stats.items()}
+        call_latency = {key: list(values) for key, values in _call_latency.items()}
+    total_turns = sum(values["turns"] for values in stats.values())
+    llm_turns = stats[SEARCH]["turns"] + stats[COMPARATIVE]["turns"]
+    llm_seconds = (stats[SEARCH]["seconds"] + stats[COMPARATIVE]["seconds"]) / llm_turns if llm_turns else 0.0
+    llm_cost = (stats[SEARCH]["large_model_cost"] + stats[COMPARATIVE]["large_model_cost"]) / llm_turns if llm_turns else 0.0
+
+    routes = {}
+    for route, values in stats.items():
+        turns = values["turns"]
+        mean_seconds = values["seconds"] / turns if turns else 0.0
+        if route in (GREETING, CODE_LOOKUP):
+            cost_saved = turns * llm_cost
+            seconds_saved = turns * max(llm_seconds - mean_seconds, 0.0) if llm_turns else 0.0
+        else:
+            cost_saved = values["large_model_cost"] - values["cost"]
+            seconds_saved = None  # read the per-model call latencies below
+        routes[route] = {
+            "turns": turns,
+            "share": round(turns / total_turns, 4) if total_turns else 0.0,
+            "mean_latency_ms": round(mean_seconds * 1000, 2),
+            "cost_usd": round(values["cost"], 6),
+            "cost_saved_usd": round(cost_saved, 6),
+            "latency_saved_s": round(seconds_saved, 3) if seconds_saved is not None else None,
+        }
+    return {
+        "turns": total_turns,
+        "routes": routes,
+        "cost_saved_usd": round(sum(route["cost_saved_usd"] for route in routes.values()), 6),
+        "call_latency_ms": {
+            f"{stage}:{model}": round(seconds / calls * 1000, 2) for (stage, model), (calls, seconds) in call_latency.items()
+        },
+    }
@@ -0,0 +1,111 @@
+from array import array
+from urllib.parse import urlparse
+
+from search.artifacts import load_json_artifact, save_json_artifact
+
+PRODUCT_GRAPH_FILE = "product_graph.json"
+
+RELATED_WEIGHT = 2.0
+OTHER_LIKE_WEIGHT = 1.0
+RECIPROCAL_BONUS = 1.0
+# Later positions in the scraped carousels are weaker signals
+POSITION_DECAY = 0.02
+
+_graph = None
+
+
+def sku_from_product_url(url):
+    """Extracts the trailing SKU from URLs like https://shop.kimelo.com//sku/<slug>/<sku>."""
+    if not url:
+        return None
+    segments = [segment for segment in urlparse(url).path.split('/') if segment]
+    if segments and segments[-1].isdigit():
+        return segments[-1]
+    return None
+
+
+def build_product_graph(id_item_pairs: list) -> dict:
+    """Builds a weighted CSR adjacency over related and other-like products.
+
+    Each row is sorted by descending weight, so the top-N neighbors of a product
+    are simply the first N entries of its row.
+    """
+    node_ids = [product_id for product_id, _ in id_item_pairs]
+    node_index = {product_id: i for i, product_id in enumerate(node_ids)}
+    # Items may be referenced by sku or by the code in their URL
+    for product_id, item in id_item_pairs:
+        for alias in (item.get("sku"), item.get("product_code_from_url"), sku_from_product_url(item.get("product_detail_url"))):
+            if alias:
+                node_index.setdefault(str(alias), node_index[product_id])
+
+    edges = [dict() for _ in node_ids]
+    unresolved = 0
+    for product_id, item in id_item_pairs:
+        source = node_index[product_id]
+        for field, base_weight in (("related_products", RELATED_WEIGHT), ("other_like_products", OTHER_LIKE_WEIGHT)):
+            for position, url in enumerate(item.get(field) or []):
+                target = node_index.get(sku_from_product_url(url))
+                if target is None:
+                    unresolved += 1
+                    continue
+                if target == source:
+                    continue
+                weight = base_weight * max(0.0, 1.0 - POSITION_DECAY * position)
+                edges[source][target] = edges[source].get(target, 0.0) + weight
+
+    for source, targets in enumerate(edges):
+        for target in targets:
+            if source in edges[target]:
+                targets[target] += RECIPROCAL_BONUS / 2
+
+    indptr = [0]
+    indices = []
+    weights = []
+    for targets in edges:
+        for target, weight in sorted(targets.items(), key=lambda kv: (-kv[1], kv[0])):
+            indices.append(target)
+            weights.append(round(weight, 4))
+        indptr.append(len(indices))
+
+    print(f"INFO: Product graph has {len(node_ids)} nodes, {len(indices)} edges, {unresolved} unresolved links.")
+    return {"nodes": node_ids, "indptr": indptr, "indices": indices, "weights": weights}
+
+
+def save_product_graph(graph: dict):
+    return save_json_artifact(PRODUCT_GRAPH_FILE, graph)
+
+
+def load_product_graph():
+    """Loads the CSR graph into typed arrays. Returns True when it is available."""
+    global _graph
+    graph = load_json_artifact(PRODUCT_GRAPH_FILE)
+    if not graph:
+        _graph = None
+        return False
+    _graph = {
+        "nodes": graph["nodes"],
+        "node_index": {product_id: i for i, product_id in enumerate(graph["nodes"])},
+        "indptr": array('i', graph["indptr"]),
+        "indices": array('i', graph["indices"]),
+        "weights": array('f', graph["weights"]),
+    }
+    return True
+
+
+def is_product_graph_loaded():
+    return _graph is not None
+
+
+def get_neighbors(product_id, n=4):
+    """Returns up to n (product_id, weight) pairs most strongly linked to product_id."""
+    if _graph is None:
+        return []
+    row = _graph["node_index"].get(str(product_id))
+    if row is None:
+        return []
+    start = _graph["indptr"][row]
+    end = min(_graph["indptr"][row + 1], start + n)
+    nodes = _graph["nodes"]
+    indices = _graph["indices"]
+    weights = _graph["weights"]
+    return [(nodes[indices[i]], weights[i]) for i in range(start, end)]
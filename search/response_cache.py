@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from search.artifacts import get_artifact_path, save_json_artifact
+from search.shared_store import shared_clear, shared_get, shared_invalidate_products, shared_put
+
+# Complete answers keyed by (response model, normalized plan, ordered result ids, prompt versions, history digest)
+CACHE_SIZE = int(os.environ.get("CHEESEBOT_RESPONSE_CACHE_SIZE", "512"))  # 0 disables the cache
+CACHE_TTL_SECONDS = float(os.environ.get("CHEESEBOT_RESPONSE_CACHE_TTL", "3600"))
+SHARED_NAMESPACE = "response"
+RESPONSE_PROMPT_FILES = ("role.txt", "result.txt", "additional.txt")
+# Ingest bumps this after a successful run; serving processes poll its mtime and drop answers about
+# the products it lists, or everything when they missed a generation
+INGEST_GENERATION_FILE = "ingest_generation.json"
+GENERATION_CHECK_SECONDS = 5.0
+PROMPT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompt")
+
+_entries = OrderedDict()  # key -> (expires_at, text, product_ids, seconds, tokens)
+_keys_by_product = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0,
+          "seconds_saved": 0.0, "tokens_saved": 0}
+_prompt_version = (None, None)  # (mtimes, digest)
+_generation = {"mtime": None, "number": None, "checked_at": 0.0}
+
+
+def prompt_version():
+    """Digest of the response prompt files; recomputed only when one of them changes on disk."""
+    global _prompt_version
+    paths = [os.path.join(PROMPT_DIR, filename) for filename in RESPONSE_PROMPT_FILES]
+    mtimes = tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+    if _prompt_version[0] != mtimes:
+        digest = hashlib.sha256()
+        for path in paths:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        _prompt_version = (mtimes, digest.hexdigest()[:16])
+    return _prompt_version[1]
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, dict):
+        return {str(k).lower(): _normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def normalize_plan(search_params):
+    """Plan JSON (string or dict) with keys sorted and strings lowercased and whitespace-collapsed."""
+    if isinstance(search_params, str):
+        try:
+            search_params = json.loads(search_params)
+        except json.JSONDecodeError:
+            return _normalize(search_params)
+    return _normalize(search_params)
+
+
+def response_cache_key(search_params, product_ids, history="", model=None):
+    history = " ".join((history or "").split())
+    payload = {
+        "model": model,  # answers from different response models are cached apart
+        "plan": normalize_plan(search_params),
+        "ids": list(product_ids),
+        "prompts": prompt_version(),
+        "history": hashlib.sha256(history.encode('utf-8')).hexdigest()[:16] if history else None,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _drop(key):
+    entry = _entries.pop(key, None)
+    if entry is not None:
+        for product_id in entry[2]:
+            keys = _keys_by_product.get(product_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del _keys_by_product[product_id]
+    return entry
+
+
+def _remember(key, entry):
+    _drop(key)
+    _entries[key] = entry
+    for product_id in entry[2]:
+        _keys_by_product.setdefault(product_id, set()).add(key)
+    while len(_entries) > CACHE_SIZE:
+        _drop(next(iter(_entries)))
+        _stats["evictions"] += 1
+
+
+def _count_hit(entry, shared=False):
+    _stats["hits"] += 1
+    _stats["shared_hits"] += 1 if shared else 0
+    _stats["seconds_saved"] += entry[3]
+    _stats["tokens_saved"] += entry[4]
+
+
+def _read_generation():
+    path = get_artifact_path(INGEST_GENERATION_FILE)
+    try:
+        mtime = os.path.getmtime(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            return mtime, json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None, None
+
+
+def _check_ingest_generation_locked():
+    """Drops in-process answers that a newer ingest has made stale."""
+    now = time.time()
+    if now - _generation["checked_at"] < GENERATION_CHECK_SECONDS:
+        return
+    _generation["checked_at"] = now
+    path = get_artifact_path(INGEST_GENERATION_FILE)
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    if mtime == _generation["mtime"] and _generation["number"] is not None:
+        return
+    mtime, generation = _read_generation()
+    seen = _generation["number"]
+    number = (generation or {}).get("generation", 0)  # no file yet: nothing ingested since this process started
+    _generation.update(mtime=mtime, number=number)
+    if seen is None and not _entries:
+        return  # first look in this process: nothing cached yet to be stale
+    if seen is not None and number == seen + 1:
+        for product_id in generation.get("changed_ids", []):
+            for key in list(_keys_by_product.get(product_id, ())):
+                if _drop(key) is not None:
+                    _stats["invalidations"] += 1
+    else:
+        _stats["invalidations"] += len(_entries)
+        _entries.clear()
+        _keys_by_product.clear()
+
+
+def record_ingest_generation(product_ids):
+    """Called by ingest once the index and artifacts are updated: publishes the changed products to
+    serving processes and purges them from the shared store. Returns how many shared answers were dropped."""
+    _, previous = _read_generation()
+    number = ((previous or {}).get("generation") or 0) + 1
+    save_json_artifact(INGEST_GENERATION_FILE, {"generation": number, "changed_ids": sorted(map(str, product_ids))})
+    return invalidate_products(product_ids)
+
+
+def get_cached_response(key):
+    """Cached answer text for key, or None. Counts the hit or miss.
+
+    Checks this process first, then answers other sessions or workers wrote to the shared store.
+    """
+    if CACHE_SIZE <= 0:
+        return None
+    with _lock:
+        _check_ingest_generation_locked()
+        entry = _entries.get(key)
+        if entry is not None and entry[0] < time.time():
+            _drop(key)
+            _stats["expirations"] += 1
+            entry = None
+        if entry is not None:
+            _entries.move_to_end(key)
+            _count_hit(entry)
+            return entry[1]
+
+    shared = shared_get(SHARED_NAMESPACE, key)
+    with _lock:
+        if shared is None:
+            _stats["misses"] += 1
+            return None
+        entry = (shared["expires_at"], shared["text"], tuple(shared["product_ids"]), shared["seconds"], shared["tokens"])
+        _remember(key, entry)
+        _count_hit(entry, shared=True)
+        return entry[1]
+
+
+def put_cached_response(key, text, product_ids, seconds=0.0, tokens=0):
+    """Stores an answer with what producing it cost, evicting the least recently used entries."""
+    if CACHE_SIZE <= 0 or not text:
+        return
+    entry = (time.time() + CACHE_TTL_SECONDS, text, tuple(product_ids), seconds, tokens or 0)
+    with _lock:
+        _remember(key, entry)
+    shared_put(SHARED_NAMESPACE, key, {
+        "expires_at": entry[0], "text": text, "product_ids": list(product_ids), "seconds": seconds, "tokens": entry[4]
+    }, CACHE_TTL_SECONDS, product_ids)
+
+
+def invalidate_products(product_ids):
+    """Drops every cached answer that mentions one of these products, here and in the shared store.
+    Returns how many were dropped."""
+    dropped = 0
+    with _lock:
+        for product_id in product_ids:
+            for key in list(_keys_by_product.get(product_id, ())):
+                if _drop(key) is not None:
+                    dropped += 1
+    shared_dropped = shared_invalidate_products(SHARED_NAMESPACE, list(product_ids))
+    with _lock:
+        _stats["invalidations"] += max(dropped, shared_dropped)
+    return max(dropped, shared_dropped)
+
+
+def clear_response_cache():
+    with _lock:
+        _entries.clear()
+        _keys_by_product.clear()
+    shared_clear(SHARED_NAMESPACE)
+
+
+def response_cache_metrics():
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "seconds_saved": round(_stats["seconds_saved"], 3),
+            "entries": len(_entries),
+            "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search import async_pipeline
+from search import hybrid_search_test as engine
+from search import tracing
+from search.conversation import ConversationState
+from search.model_router import response_model
+from search.web_search import submit_web_search
+
+
+class ChatRequest(BaseModel):
+    query: str
+    history: str = ""
+    conversation: Optional[dict] = None  # ConversationState.to_dict(); returned updated with the answer
+    web_context: bool = False  # search the web alongside the pipeline and add its snippets to the prompt
+
+
+def _conversation(request):
+    return ConversationState.from_dict(request.conversation) if request.conversation is not None else None
+
+
+def _web_future(request):
+    return submit_web_search(request.query) if request.web_context else None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Backends installed beforehand (e.g. load-test stubs) are kept as they are
+    if not async_pipeline._backends_initialized:
+        await async_pipeline.initialize_async_clients()
+    yield
+    await async_pipeline.close_async_clients()
+
+
+app = FastAPI(title="CheeseBot search service", lifespan=lifespan)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/health")
+async def health():
+    return {"ready": async_pipeline._backends_initialized}
+
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    """Same payload as product_search_bot, served from the shared event loop."""
+    try:
+        conversation = _conversation(request)
+        result = await async_pipeline.product_search_bot_async(request.query, request.history, conversation,
+                                                               _web_future(request))
+        if conversation is not None:
+            result["conversation"] = conversation.to_dict()
+        return result
+    except Exception as e:
+        print(f"ERROR: Chat request failed: {e}")
+        return {"success": False, "response": f"Sorry, an unexpected error occurred while searching: {e}",
+                "query_interpretation": None, "results": [], "result_count": 0}
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Server-sent events: plan, results, one token event per text delta, then done."""
+    async def events():
+        try:
+            if not async_pipeline._backends_initialized and not await async_pipeline.initialize_async_clients():
+                yield _sse("error", {"message": "Failed to initialize API clients."})
+                return
+            conversation = _conversation(request)
+            web_future = _web_future(request)
+            answer, history = await asyncio.to_thread(engine.begin_turn, request.query, request.history, conversation)
+            if answer is not None:
+                if conversation is not None:
+                    answer["conversation"] = conversation.to_dict()
+                yield _sse("results", {"results": answer["results"], "result_count": answer["result_count"]})
+                yield _sse("token", {"text": answer["response"]})
+                yield _sse("done", answer)
+                return
+            # Spans are attached explicitly: a context variable cannot stay active across yields
+            trace = tracing.start_turn()
+            with tracing.activate(trace):
+                corrected_query, route = engine.correct_turn(request.query)
+                search_params, search_results = await async_pipeline.retrieve_async(corrected_query, conversation)
+            yield _sse("plan", {"query_interpretation": search_params, "corrected_query":
+                                corrected_query if corrected_query != request.query else None})
+            formatted_results = engine.format_results(search_results)
+            yield _sse("results", {"results": formatted_results, "result_count": len(formatted_results)})
+
+            model = response_model(route)
+            with tracing.activate(trace):
+                web_result = None
+                if web_future is not None:
+                    history, web_result = await asyncio.to_thread(engine.add_web_context, history, web_future)
+                cache_key, cached = await asyncio.to_thread(
+                    engine.cached_response_lookup, search_results, search_params, history, model)
+            if cached is not None:
+                response_parts = [cached]
+                yield _sse("token", {"text": cached})
+            else:
+                response_parts = []
+                with tracing.span("response", trace=trace, model=model, streamed=True) as stage:
+                    async for delta in async_pipeline.stream_response_async(
+                            request.query, search_results, search_params, history, model, stage):
+                        response_parts.append(delta)
+                        yield _sse("token", {"text": delta})
+                    stage.set(response_bytes=tracing.payload_bytes("".join(response_parts)))
+                await asyncio.to_thread(engine.store_response, cache_key, search_results, "".join(response_parts), stage)
+            tracing.finish_turn(trace)
+            result = engine.turn_result(trace, request.query, corrected_query, route, search_params, search_results,
+                                        "".join(response_parts), conversation, web_result)
+            if conversation is not None:
+                result["conversation"] = conversation.to_dict()
+            yield _sse("done", result)
+        except Exception as e:
+            print(f"ERROR: Streaming chat request failed: {e}")
+            yield _sse("error", {"message": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.environ.get("CHEESEBOT_SERVICE_HOST", "127.0.0.1"),
+                port=int(os.environ.get("CHEESEBOT_SERVICE_PORT", "8000")))
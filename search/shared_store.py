@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Optional SQLite file shared by every process on the host (Streamlit workers, the search service, ingest)
+SHARED_DB_PATH = os.environ.get("CHEESEBOT_SHARED_CACHE_DB", "")
+INVALIDATE_CHUNK = 500  # stays under SQLite's bound-parameter limit
+
+_connection = None
+_lock = threading.Lock()
+
+
+def shared_store_enabled():
+    return bool(SHARED_DB_PATH)
+
+
+def _connect():
+    global _connection
+    if _connection is None:
+        directory = os.path.dirname(os.path.abspath(SHARED_DB_PATH))
+        os.makedirs(directory, exist_ok=True)
+        _connection = sqlite3.connect(SHARED_DB_PATH, timeout=5, check_same_thread=False, isolation_level=None)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("PRAGMA synchronous=NORMAL")
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "namespace TEXT, key TEXT, expires_at REAL, value TEXT, PRIMARY KEY (namespace, key))"
+        )
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS entry_products (namespace TEXT, key TEXT, product_id TEXT)"
+        )
+        _connection.execute("CREATE INDEX IF NOT EXISTS entry_products_by_id ON entry_products (namespace, product_id)")
+    return _connection
+
+
+def shared_get(namespace, key):
+    """JSON value stored under (namespace, key), or None when missing, expired or disabled."""
+    if not SHARED_DB_PATH:
+        return None
+    try:
+        with _lock:
+            row = _connect().execute(
+                "SELECT expires_at, value FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Warning: Shared cache read failed: {e}")
+        return None
+    if row is None or row[0] < time.time():
+        return None
+    return json.loads(row[1])
+
+
+def shared_put(namespace, key, value, ttl_seconds, product_ids=()):
+    if not SHARED_DB_PATH:
+        return
+    try:
+        with _lock:
+            connection = _connect()
+            with connection:  # commits, or rolls back on error
+                connection.execute("BEGIN")
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                    (namespace, key, time.time() + ttl_seconds, json.dumps(value))
+                )
+                connection.execute("DELETE FROM entry_products WHERE namespace = ? AND key = ?", (namespace, key))
+                connection.executemany(
+                    "INSERT INTO entry_products VALUES (?, ?, ?)",
+                    [(namespace, key, str(product_id)) for product_id in product_ids]
+                )
+    except sqlite3.Error as e:
+        print(f"Warning: Shared cache write failed: {e}")
+
+
+def shared_invalidate_products(namespace, product_ids):
+    """Deletes every entry linked to one of these products. Returns how many were deleted."""
+    if not SHARED_DB_PATH or not product_ids:
+        return 0
+    product_ids = [str(product_id) for product_id in product_ids]
+    try:
+        with _lock:
+            connection = _connect()
+            with connection:
+                connection.execute("BEGIN")
+                keys = set()
+                for start in range(0, len(product_ids), INVALIDATE_CHUNK):
+                    chunk = product_ids[start:start + INVALIDATE_CHUNK]
+                    keys.update(row[0] for row in connection.execute(
+                        "SELECT DISTINCT key FROM entry_products WHERE namespace = ? "
+                        f"AND product_id IN ({','.join('?' * len(chunk))})",
+                        (namespace, *chunk)
+                    ))
+                pairs = [(namespace, key) for key in keys]
+                connection.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", pairs)
+                connection.executemany("DELETE FROM entry_products WHERE namespace = ? AND key = ?", pairs)
+        return len(keys)
+    except sqlite3.Error as e:
+        print(f"Warning: Shared cache invalidation failed: {e}")
+        return 0
+
+
+def shared_clear(namespace):
+    if not SHARED_DB_PATH:
+        return
+    with _lock:
+        connection = _connect()
+        connection.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+        connection.execute("DELETE FROM entry_products WHERE namespace = ?", (namespace,))
+
+
+def purge_expired():
+    """Removes expired entries from every namespace. Returns how many were removed."""
+    if not SHARED_DB_PATH:
+        return 0
+    with _lock:
+        connection = _connect()
+        expired = connection.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),)).rowcount
+        connection.execute(
+            "DELETE FROM entry_products WHERE NOT EXISTS (SELECT 1 FROM entries e "
+            "WHERE e.namespace = entry_products.namespace AND e.key = entry_products.key)"
+        )
+    return expired
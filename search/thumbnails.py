@@ -0,0 +1,116 @@
+import io
+import os
+import sys
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from search.artifacts import load_json_artifact, save_json_artifact
+
+THUMBNAIL_MANIFEST_FILE = "thumbnails.json"  # image URL -> thumbnail file name
+IMAGE_FIELDS = ("image_url", "detail_page_main_image_url")
+THUMBNAIL_SIZE = (200, 200)  # matches IMAGE_WIDTH_PX x IMAGE_HEIGHT_PX in app.py
+THUMBNAIL_QUALITY = 80
+# Streamlit serves <app dir>/static at app/static when server.enableStaticServing is on
+THUMBNAIL_DIR = os.environ.get(
+    "CHEESEBOT_THUMBNAIL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "thumbs")
+)
+THUMBNAIL_URL_PREFIX = os.environ.get("CHEESEBOT_THUMBNAIL_URL_PREFIX", "app/static/thumbs/")
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_TIMEOUT = (5, 30)
+
+_manifest = None
+_local = threading.local()
+
+
+def _session():
+    # requests.Session is not thread-safe; one pooled session per download thread
+    if not hasattr(_local, "session"):
+        import requests
+
+        _local.session = requests.Session()
+    return _local.session
+
+
+def make_thumbnail(image_bytes: bytes) -> bytes:
+    """WebP thumbnail that fits in THUMBNAIL_SIZE, keeping the aspect ratio."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        image.thumbnail(THUMBNAIL_SIZE)
+        output = io.BytesIO()
+        image.save(output, format="WEBP", quality=THUMBNAIL_QUALITY, method=6)
+    return output.getvalue()
+
+
+def _fetch_thumbnail(url):
+    """Downloads one image and stores its thumbnail under the digest of the source bytes.
+    Returns the file name, or None when the image could not be fetched or decoded."""
+    try:
+        response = _session().get(url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        filename = hashlib.sha256(response.content).hexdigest()[:32] + ".webp"
+        path = os.path.join(THUMBNAIL_DIR, filename)
+        if not os.path.exists(path):  # the same picture under another URL or SKU is resized once
+            thumbnail = make_thumbnail(response.content)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(thumbnail)
+            os.replace(tmp_path, path)
+        return filename
+    except Exception as e:
+        print(f"Warning: Could not build thumbnail for {url}: {e}")
+        return None
+
+
+def build_thumbnails(all_metadata: list) -> dict:
+    """Fetches and resizes every distinct product image. URLs already in the saved manifest whose
+    thumbnail file exists are skipped. Returns the URL -> file name manifest."""
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+    previous = load_json_artifact(THUMBNAIL_MANIFEST_FILE) or {}
+    manifest = {
+        url: filename for url, filename in previous.items()
+        if os.path.exists(os.path.join(THUMBNAIL_DIR, filename))
+    }
+    urls = sorted({
+        metadata[field] for metadata in all_metadata for field in IMAGE_FIELDS
+        if metadata.get(field) and metadata[field] not in manifest
+    })
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        for url, filename in zip(urls, executor.map(_fetch_thumbnail, urls)):
+            if filename:
+                manifest[url] = filename
+    files = set(manifest.values())
+    print(f"INFO: Thumbnails cover {len(manifest)} image URLs with {len(files)} files "
+          f"({len(urls)} downloaded this run).")
+    return manifest
+
+
+def save_thumbnail_manifest(manifest: dict):
+    return save_json_artifact(THUMBNAIL_MANIFEST_FILE, manifest)
+
+
+def load_thumbnail_manifest():
+    """Loads the URL -> thumbnail manifest. Returns True when it is available."""
+    global _manifest
+    _manifest = load_json_artifact(THUMBNAIL_MANIFEST_FILE)
+    return _manifest is not None
+
+
+def thumbnail_url(image_url):
+    """Local thumbnail URL for a product image, or the original URL when none was built."""
+    if _manifest is None or image_url not in _manifest:
+        return image_url
+    return THUMBNAIL_URL_PREFIX + _manifest[image_url]
+
+
+if __name__ == "__main__":
+    # Rebuilds thumbnails from the local metadata store without a full ingest: python -m search.thumbnails
+    from search.metadata_store import iter_products, load_metadata_store
+
+    if not load_metadata_store():
+        sys.exit(1)
+    products = [record.to_metadata() for _, record in iter_products()]
+    print(f"Saved thumbnail manifest to {save_thumbnail_manifest(build_thumbnails(products))}")
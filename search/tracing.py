@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Optional JSONL export of every finished turn, one OpenTelemetry-style span per line
+TRACE_EXPORT_PATH = os.environ.get("CHEESEBOT_TRACE_EXPORT", "")
+HISTOGRAM_WINDOW = 1000  # latest samples kept per stage
+
+_current_trace = contextvars.ContextVar("cheesebot_trace", default=None)
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("span_id", "name", "start", "end", "attributes")
+
+    def __init__(self, name):
+        self.span_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.time()
+        self.end = None
+        self.attributes = {}
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+
+class TurnTrace:
+    """All stage spans of one chat turn."""
+
+    def __init__(self, name="chat_turn"):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.start = time.time()
+        self.end = None
+        self.spans = []
+
+    def to_dict(self):
+        end = self.end or time.time()
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "duration_ms": round((end - self.start) * 1000, 2),
+            "spans": [
+                {
+                    "name": span.name,
+                    "offset_ms": round((span.start - self.start) * 1000, 2),
+                    "duration_ms": round(span.duration * 1000, 2),
+                    "attributes": dict(span.attributes),
+                }
+                for span in self.spans
+            ],
+        }
+
+    def to_otel_records(self):
+        records = []
+        for span in [None] + self.spans:
+            start = self.start if span is None else span.start
+            end = (self.end or time.time()) if span is None else (span.end or time.time())
+            records.append({
+                "traceId": self.trace_id,
+                "spanId": self.trace_id[:16] if span is None else span.span_id,
+                "parentSpanId": None if span is None else self.trace_id[:16],
+                "name": self.name if span is None else span.name,
+                "startTimeUnixNano": int(start * 1e9),
+                "endTimeUnixNano": int(end * 1e9),
+                "attributes": {} if span is None else dict(span.attributes),
+            })
+        return records
+
+
+def _record_sample(stage, seconds):
+    with _histograms_lock:
+        samples = _histograms.get(stage)
+        if samples is None:
+            samples = _histograms[stage] = deque(maxlen=HISTOGRAM_WINDOW)
+        samples.append(seconds)
+
+
+def _percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def stage_percentiles():
+    """p50/p95/p99 latency in milliseconds per stage over the recent window."""
+    with _histograms_lock:
+        snapshot = {stage: sorted(samples) for stage, samples in _histograms.items() if samples}
+    return {
+        stage: {
+            "count": len(samples),
+            "p50_ms": round(_percentile(samples, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(samples, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(samples, 0.99) * 1000, 2),
+        }
+        for stage, samples in snapshot.items()
+    }
+
+
+def reset_histograms():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+def start_turn(name="chat_turn"):
+    return TurnTrace(name)
+
+
+def finish_turn(trace):
+    """Closes a turn, records its end-to-end latency and exports it when configured."""
+    trace.end = time.time()
+    _record_sample(trace.name, trace.end - trace.start)
+    if TRACE_EXPORT_PATH:
+        export_jsonl(trace, TRACE_EXPORT_PATH)
+    return trace
+
+
+@contextmanager
+def activate(trace):
+    """Makes trace the parent of spans opened in this context (thread or asyncio task)."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def trace_turn(name="chat_turn"):
+    """Collects every span opened inside the block into one TurnTrace."""
+    trace = start_turn(name)
+    try:
+        with activate(trace):
+            yield trace
+    finally:
+        finish_turn(trace)
+
+
+@contextmanager
+def span(name, trace=None, **attributes):
+    """Times one pipeline stage. Recorded in the stage histogram and the given or current turn."""
+    current = Span(name)
+    current.set(**attributes)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.spans.append(current)
+    try:
+        yield current
+    finally:
+        current.end = time.time()
+        _record_sample(name, current.duration)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def payload_bytes(obj):
+    """Approximate serialized size of a request or response payload."""
+    if obj is None:
+        return 0
+    if isinstance(obj, (bytes, str)):
+        return len(obj.encode('utf-8') if isinstance(obj, str) else obj)
+    try:
+        return len(json.dumps(obj, default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 0
+
+
+def usage_attributes(response):
+    """Token counts from an OpenAI response, when the backend reports them."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+    }
+
+
+_export_lock = threading.Lock()
+
+
+def export_jsonl(trace, path):
+    with _export_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            for record in trace.to_otel_records():
+                f.write(json.dumps(record) + "\n")
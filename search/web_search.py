@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SERPAPI_URL = os.environ.get("CHEESEBOT_SERPAPI_URL", "https://serpapi.com/search")  # stub servers override this
+SERPAPI_API_KEY = os.environ.get("SERPAPI_API_KEY", "")
+WEB_SEARCH_TIMEOUT = (3, 10)  # (connect, read) seconds
+WEB_CACHE_TTL_SECONDS = float(os.environ.get("CHEESEBOT_WEB_SEARCH_TTL", "900"))
+WEB_CACHE_SIZE = 256
+WEB_SEARCH_WORKERS = 4
+MAX_CONTEXT_SNIPPETS = 3
+
+_session = None
+_executor = None
+_cache = OrderedDict()  # (query, engine, tb, tbs, num) -> (expires_at, result)
+_in_flight = {}  # same key -> Future shared by identical concurrent requests
+_lock = threading.Lock()
+_stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "errors": 0}
+
+
+def _get_session():
+    global _session
+    import requests  # deferred: it is a noticeable share of app start-up
+    from requests.adapters import HTTPAdapter
+
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            _session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        return _session
+
+
+def _cache_key(query, engine, tb, tbs, num_results):
+    return (" ".join(query.lower().split()), engine, tb, tbs, num_results)
+
+
+def _fetch(query, num_results, engine, tb, tbs):
+    import requests
+
+    params = {
+        "q": query + " cheese",
+        "api_key": SERPAPI_API_KEY,
+        "engine": engine,
+        "num": num_results,
+        "tb": tb,
+        "tbs": tbs
+    }
+    try:
+        response = _get_session().get(SERPAPI_URL, params=params, timeout=WEB_SEARCH_TIMEOUT)
+        response.raise_for_status()
+        results = response.json()
+    except requests.exceptions.RequestException as e:
+        return {"success": False, "error": f"Error making request to SerpAPI: {str(e)}"}
+    except ValueError as e:
+        return {"success": False, "error": f"Error parsing SerpAPI response: {str(e)}"}
+
+    processed_results = [
+        {"title": result.get("title", ""), "link": result.get("link", ""), "snippet": result.get("snippet", "")}
+        for result in results.get("organic_results", [])[:num_results]
+    ]
+    return {"success": True, "results": processed_results, "total_results": len(processed_results)}
+
+
+def web_search(query: str, num_results: int = 5, engine: str = "google", tb: str = "", tbs: str = "") -> dict:
+    """SerpAPI search through a pooled session. Answers are cached for WEB_CACHE_TTL_SECONDS and
+    identical requests already in flight share one HTTP call. Failures are returned, never cached."""
+    if not SERPAPI_API_KEY:
+        return {
+            "success": False,
+            "error": "SERPAPI_API_KEY not found in .env file. Please add it to use web search functionality."
+        }
+    key = _cache_key(query, engine, tb, tbs, num_results)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] >= time.time():
+            _cache.move_to_end(key)
+            _stats["cache_hits"] += 1
+            return {**entry[1], "cached": True}
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = _in_flight[key] = Future()
+            _stats["requests"] += 1
+        else:
+            _stats["coalesced"] += 1
+    if not owner:
+        return future.result()
+
+    try:
+        result = _fetch(query, num_results, engine, tb, tbs)
+    except Exception as e:
+        result = {"success": False, "error": f"Unexpected error during web search: {str(e)}"}
+    with _lock:
+        if result["success"]:
+            _cache[key] = (time.time() + WEB_CACHE_TTL_SECONDS, result)
+            while len(_cache) > WEB_CACHE_SIZE:
+                _cache.popitem(last=False)
+        else:
+            _stats["errors"] += 1
+        del _in_flight[key]
+    future.set_result(result)
+    return result
+
+
+def submit_web_search(query: str, num_results: int = 5, engine: str = "google", tb: str = "", tbs: str = "") -> Future:
+    """Starts web_search on a background thread so it overlaps the catalog pipeline."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WEB_SEARCH_WORKERS, thread_name_prefix="web-search")
+    return _executor.submit(web_search, query, num_results, engine, tb, tbs)
+
+
+def format_web_context(result: dict) -> str:
+    """Top snippets as a short prompt section, or "" for failed or empty searches."""
+    if not result or not result.get("success") or not result.get("results"):
+        return ""
+    lines = ["Fresh web results (may mention products outside the catalog):"]
+    lines += [f"- {item['title']}: {item['snippet']} ({item['link']})" for item in result["results"][:MAX_CONTEXT_SNIPPETS]]
+    return "\n".join(lines)
+
+
+def collect_web_result(future: Future, timeout: float):
+    """The background search result, or None if it is not back within timeout seconds."""
+    try:
+        return future.result(timeout=max(timeout, 0))
+    except Exception:
+        return None
+
+
+def clear_web_cache():
+    with _lock:
+        _cache.clear()
+
+
+def web_search_metrics():
+    with _lock:
+        return {**_stats, "entries": len(_cache)}
@@ -0,0 +1,26 @@
+"""Pasted product codes answered from the local code index."""
+import pytest
+
+from search import code_index
+
+CODES = {"106832": ["p1"], "124144": ["p2"], "AB12345": ["p3", "p1"]}
+
+
+@pytest.fixture(autouse=True)
+def codes(monkeypatch):
+    monkeypatch.setattr(code_index, "_codes", CODES)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("106832", ["p1"]),
+    ("106832 and 124144", ["p1", "p2"]),
+    ("skus 106832, 124144 or ab-12345", ["p1", "p2", "p3"]),
+    ("show me 124144 & 106832", ["p2", "p1"]),
+])
+def test_code_queries(query, expected):
+    assert code_index.match_code_query(query) == expected
+
+
+@pytest.mark.parametrize("query", ["cheaper than 106832", "106832 and something like it", "999999"])
+def test_other_queries_take_the_normal_path(query):
+    assert code_index.match_code_query(query) is None
@@ -0,0 +1,29 @@
+"""LLM metadata filters compiled against the ingest schema."""
+import pytest
+
+from search.filters import compile_metadata_filters
+
+SCHEMA = {"fields": {
+    "brand": {"type": "string", "values": ["Galbani", "Tillamook", "BelGioioso"]},
+    "price": {"type": "number"},
+}}
+
+
+@pytest.mark.parametrize("value", ["", "   ", None, [], [None, ""], {"$regex": "x"}])
+def test_empty_or_unsupported_string_values_are_dropped(value):
+    filter_dict, dropped = compile_metadata_filters({"brand": value, "price": {"lt": 20}}, SCHEMA)
+    assert filter_dict == {"price": {"$lt": 20.0}}
+    assert dropped == [("brand", "unsupported value for string field 'brand'")]
+
+
+def test_unmatched_vocabulary_values_are_reported():
+    filter_dict, dropped = compile_metadata_filters({"brand": ["tillamook", "Kraft"]}, SCHEMA)
+    assert filter_dict == {"brand": {"$in": ["Tillamook"]}}
+    assert dropped == [("brand", "no 'brand' value matches 'Kraft'")]
+
+
+def test_repeated_fields_are_merged():
+    filter_dict, dropped = compile_metadata_filters({"brand": ["Galbani", "Tillamook"], "name": None,
+                                                     "Brand": "galbani"}, SCHEMA)
+    assert filter_dict == {"brand": {"$in": ["Galbani"]}}
+    assert ("name", "unknown field") in dropped
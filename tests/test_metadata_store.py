@@ -0,0 +1,78 @@
+"""Columnar filter masks agree with matches_filter and drive filtered ANN search."""
+import numpy as np
+import pytest
+
+from search import artifacts
+from search import hybrid_search_test as engine
+from search import metadata_store as store
+from search.ann_index import IvfIndex
+from search.filters import matches_filter
+
+PRODUCTS = [
+    {"_id": "1", "brand": "Galbani", "price": 4.5, "status": "In Stock", "sku": "A1", "related_products_count": 2},
+    {"_id": "2", "brand": "Tillamook", "price": 12.0, "status": "Out of Stock", "sku": "B2"},
+    {"_id": "3", "brand": "Galbani", "status": "In Stock", "related_products_count": 0},
+    {"_id": "4", "price": 30.25, "sku": "A1"},
+    {"_id": "5", "brand": "BelGioioso", "price": 12.0, "status": "In Stock", "sku": "C3", "related_products_count": 5},
+]
+
+FILTERS = [
+    {"brand": {"$in": ["Galbani", "BelGioioso"]}},
+    {"brand": {"$nin": ["Galbani"]}},
+    {"brand": "Tillamook", "price": {"$lte": 12.0}},
+    {"price": {"$gt": 5, "$lt": 31}},
+    {"price": {"$ne": 12.0}},
+    {"sku": {"$in": ["A1", "C3"]}},
+    {"sku": {"$nin": ["A1"]}, "status": {"$eq": "In Stock"}},
+    {"related_products_count": {"$gte": 2}},
+    {"$or": [{"brand": "Tillamook"}, {"price": {"$gt": 20}}]},
+    {"$and": [{"status": "In Stock"}, {"$or": [{"price": {"$lt": 5}}, {"sku": "C3"}]}]},
+    {"weight": {"$lt": 1}},
+    {"weight": {"$ne": 1}},
+]
+
+
+@pytest.fixture
+def columnar_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, "ARTIFACTS_DIR", str(tmp_path))
+    store.save_metadata_store(store.build_metadata_store(PRODUCTS))
+    assert store.load_metadata_store()
+    yield
+    monkeypatch.undo()
+    store.load_metadata_store()
+
+
+@pytest.mark.parametrize("filter_dict", FILTERS)
+def test_filter_mask_matches_records(columnar_store, filter_dict):
+    mask = store.filter_mask(filter_dict)
+    expected = [matches_filter(store.get_product_record(product["_id"]), filter_dict) for product in PRODUCTS]
+    assert mask.tolist() == expected
+
+
+def test_filter_mask_builds_no_records(columnar_store):
+    store.filter_mask({"brand": "Galbani", "price": {"$lt": 10}})
+    assert store.filter_mask({"price": {"$lt": 10}, "brand": "Galbani"}) is store.filter_mask({"brand": "Galbani", "price": {"$lt": 10}})
+    assert not store._records
+
+
+def test_filtered_ann_search_uses_store_mask(columnar_store):
+    rng = np.random.default_rng(0)
+    ids = [product["_id"] for product in reversed(PRODUCTS)]  # index rows in another order than the store
+    ann = IvfIndex.build(ids, rng.standard_normal((len(ids), 8)).astype(np.float32), nlist=2)
+    ann.remove(["5"])
+    ann.add(["6"], rng.standard_normal((1, 8)).astype(np.float32))
+    accept = (store.filter_mask({"brand": {"$in": ["Galbani", "BelGioioso"]}}), store.store_row_positions())
+    found = {product_id for product_id, _ in ann.search(rng.standard_normal(8), k=10, accept=accept)}
+    assert found == {"1", "3"}
+
+
+def test_selectivity_counts_are_bounded_and_reset_on_reload(columnar_store, monkeypatch):
+    monkeypatch.setattr(engine, "SELECTIVITY_CACHE_SIZE", 2)
+    assert engine._count_matching_products({"brand": "Galbani"}) == 2
+    engine._count_matching_products({"price": {"$lt": 5}})
+    engine._count_matching_products({"sku": "A1"})
+    assert list(engine._selectivity_cache) == ['{"price": {"$lt": 5}}', '{"sku": "A1"}']
+    store.save_metadata_store(store.build_metadata_store(PRODUCTS[:1]))
+    engine.load_local_artifacts()
+    assert not engine._selectivity_cache
+    assert engine._count_matching_products({"sku": "A1"}) == 1
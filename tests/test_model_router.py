@@ -0,0 +1,21 @@
+"""Local turn routing: greetings and closings are answered without a backend call."""
+import pytest
+
+from search.model_router import COMPARATIVE, GREETING, SEARCH, classify_turn, is_closing
+
+
+@pytest.mark.parametrize("query, route, closing", [
+    ("Hi!", GREETING, False),
+    ("hello, who are you?", GREETING, False),
+    ("hey there thanks", GREETING, False),
+    ("Thanks!", GREETING, True),
+    ("thank you so much", GREETING, True),
+    ("ok thanks, bye", GREETING, True),
+    ("Goodbye", GREETING, True),
+    ("thanks for the brie tip, any goat cheese?", SEARCH, False),
+    ("okay show me cheddar", SEARCH, False),
+    ("which is better, brie or camembert", COMPARATIVE, False),
+])
+def test_classify_turn(query, route, closing):
+    assert classify_turn(query) == route
+    assert is_closing(query) == closing
@@ -0,0 +1,77 @@
+"""Web-search client against the local SerpAPI stub: timeouts, TTL caching and in-flight coalescing."""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bench.web_search_stub import StubSerpApi, start_stub
+from search import web_search as client
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    server, url = start_stub(0.0)
+    yield url
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def stub_client(stub_url, monkeypatch):
+    monkeypatch.setattr(client, "SERPAPI_URL", stub_url)
+    monkeypatch.setattr(client, "SERPAPI_API_KEY", "stub-key")
+    monkeypatch.setattr(StubSerpApi, "latency", 0.0)
+    client.clear_web_cache()
+    yield
+    client.clear_web_cache()
+
+
+def test_slow_upstream_times_out_and_is_not_cached(monkeypatch):
+    monkeypatch.setattr(StubSerpApi, "latency", 0.5)
+    monkeypatch.setattr(client, "WEB_SEARCH_TIMEOUT", (1, 0.1))
+    errors = client.web_search_metrics()["errors"]
+
+    start = time.perf_counter()
+    result = client.web_search("aged gouda")
+    assert time.perf_counter() - start < 0.45
+    assert not result["success"] and "SerpAPI" in result["error"]
+    assert client.web_search_metrics()["errors"] == errors + 1
+
+    hits = StubSerpApi.hits
+    assert not client.web_search("aged gouda")["success"]
+    assert StubSerpApi.hits == hits + 1  # failures are retried, never served from the cache
+
+
+def test_collect_gives_up_on_a_slow_search(monkeypatch):
+    monkeypatch.setattr(StubSerpApi, "latency", 0.5)
+    future = client.submit_web_search("fresh mozzarella")
+    assert client.collect_web_result(future, 0.05) is None
+    assert future.result(timeout=5)["success"]
+
+
+def test_repeat_is_cached_until_the_ttl_expires(monkeypatch):
+    monkeypatch.setattr(client, "WEB_CACHE_TTL_SECONDS", 0.3)
+    hits = StubSerpApi.hits
+
+    first = client.web_search("aged gouda")
+    assert first["success"] and first["total_results"] == 5 and not first.get("cached")
+    repeat = client.web_search("  Aged   GOUDA ")
+    assert repeat["cached"] and repeat["results"] == first["results"]
+    assert StubSerpApi.hits == hits + 1
+
+    time.sleep(0.4)
+    expired = client.web_search("aged gouda")
+    assert expired["success"] and not expired.get("cached")
+    assert StubSerpApi.hits == hits + 2
+
+
+def test_identical_concurrent_searches_share_one_request(monkeypatch):
+    monkeypatch.setattr(StubSerpApi, "latency", 0.3)
+    hits = StubSerpApi.hits
+    coalesced = client.web_search_metrics()["coalesced"]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: client.web_search("smoked provolone"), range(8)))
+
+    assert all(result["success"] for result in results)
+    assert StubSerpApi.hits == hits + 1
+    assert client.web_search_metrics()["coalesced"] == coalesced + 7